@@ -0,0 +1,308 @@
+"""
+Asynchronous analysis jobs for large inspection batches
+Jobs are persisted in SQLite so queued work survives a restart. Several
+processes can share one store: a job is claimed atomically before it runs,
+and its owner renews a lease while running it, so a job left running by a
+process that died is taken over once the lease expires.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Result of an item that is not an object; it fails on its own, as in /batch-analyze
+MALFORMED_ITEM = {'status': 'error', 'message': 'Image entry must be an object', 'error_type': 'ValueError'}
+
+# Seconds without a heartbeat after which a running job is taken over;
+# owners renew their leases every LEASE_SECONDS / 3
+LEASE_SECONDS = 60
+
+
+class JobStore:
+    """
+    SQLite store for jobs and their images. Image payloads are dropped once
+    an item has a result, so finished jobs only keep metadata and results.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                message TEXT,
+                owner TEXT,
+                heartbeat REAL
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                metadata TEXT NOT NULL,
+                image BLOB,
+                image_is_text INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                PRIMARY KEY (job_id, idx)
+            );
+        ''')
+        # Stores written before jobs were claimed have no lease columns
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        for column, kind in (('owner', 'TEXT'), ('heartbeat', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+
+    def create(self, items):
+        """
+        Persist a new queued job; items are dicts with 'image' and metadata.
+        Anything else is stored with an error result right away.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        rows = []
+        malformed = []
+        for idx, item in enumerate(items):
+            if not isinstance(item, dict):
+                malformed.append((job_id, idx, '{}', json.dumps(MALFORMED_ITEM)))
+                continue
+            image = item.get('image')
+            metadata = {k: v for k, v in item.items() if k != 'image'}
+            if isinstance(image, str):
+                rows.append((job_id, idx, json.dumps(metadata), image.encode('utf-8'), 1))
+            else:
+                rows.append((job_id, idx, json.dumps(metadata),
+                             bytes(image) if image is not None else None, 0))
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('INSERT INTO jobs (id, status, total, completed, failed, created_at, updated_at) '
+                               'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (job_id, 'queued', len(items), len(malformed), len(malformed), now, now))
+            self._conn.executemany('INSERT INTO job_items (job_id, idx, metadata, image, image_is_text) '
+                                   'VALUES (?, ?, ?, ?, ?)', rows)
+            self._conn.executemany('INSERT INTO job_items (job_id, idx, metadata, result) VALUES (?, ?, ?, ?)',
+                                   malformed)
+            self._conn.execute('COMMIT')
+        return job_id
+
+    def get(self, job_id):
+        """Job summary dict or None"""
+        with self._lock:
+            row = self._conn.execute('SELECT id, status, total, completed, failed, created_at, '
+                                     'updated_at, message FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'status', 'total', 'completed', 'failed', 'created_at', 'updated_at', 'message')
+        return dict(zip(keys, row))
+
+    def results(self, job_id):
+        """(index, metadata, result) for every finished item, in order"""
+        with self._lock:
+            rows = self._conn.execute('SELECT idx, metadata, result FROM job_items WHERE job_id = ? '
+                                      'AND result IS NOT NULL ORDER BY idx', (job_id,)).fetchall()
+        return [(idx, json.loads(metadata), json.loads(result)) for idx, metadata, result in rows]
+
+    def pending_items(self, job_id):
+        """(index, image) for items without a result"""
+        with self._lock:
+            rows = self._conn.execute('SELECT idx, image, image_is_text FROM job_items WHERE job_id = ? '
+                                      'AND result IS NULL ORDER BY idx', (job_id,)).fetchall()
+        return [(idx, image.decode('utf-8') if is_text and image is not None else image)
+                for idx, image, is_text in rows]
+
+    def active_jobs(self):
+        """Ids of queued or running jobs, oldest first"""
+        with self._lock:
+            rows = self._conn.execute('SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at',
+                                      ACTIVE_STATUSES).fetchall()
+        return [row[0] for row in rows]
+
+    def claimable_jobs(self, lease_seconds=LEASE_SECONDS):
+        """Ids of queued jobs and of running jobs whose lease expired, oldest first"""
+        with self._lock:
+            rows = self._conn.execute('SELECT id FROM jobs WHERE status = ? OR (status = ? AND '
+                                      '(heartbeat IS NULL OR heartbeat < ?)) ORDER BY created_at',
+                                      ('queued', 'running', time.time() - lease_seconds)).fetchall()
+        return [row[0] for row in rows]
+
+    def claim(self, job_id, owner, lease_seconds=LEASE_SECONDS):
+        """
+        Mark a queued job, or a running one whose lease expired, as running
+        for owner; False when another owner holds it or it has finished
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, updated_at = ? WHERE id = ? AND '
+                '(status = ? OR (status = ? AND (heartbeat IS NULL OR heartbeat < ?)))',
+                ('running', owner, now, now, job_id, 'queued', 'running', now - lease_seconds))
+        return cursor.rowcount == 1
+
+    def renew(self, owner):
+        """Extend the leases of every job owner is running"""
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = ?',
+                               (time.time(), owner, 'running'))
+
+    def finish(self, job_id, owner, status, message=None):
+        """Set the final status of a job, unless another owner has taken it over"""
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET status = ?, message = ?, updated_at = ? WHERE id = ? AND owner = ?',
+                               (status, message, time.time(), job_id, owner))
+
+    def set_status(self, job_id, status, message=None):
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET status = ?, message = ?, updated_at = ? WHERE id = ?',
+                               (status, message, time.time(), job_id))
+
+    def record_result(self, job_id, idx, result):
+        """
+        Store one item's result and update the job counters; an item that
+        already has a result keeps it and is not counted again
+        """
+        failed = int(result.get('status') == 'error')
+        with self._lock:
+            self._conn.execute('BEGIN')
+            cursor = self._conn.execute('UPDATE job_items SET result = ?, image = NULL WHERE job_id = ? AND idx = ? '
+                                        'AND result IS NULL', (json.dumps(result), job_id, idx))
+            if cursor.rowcount:
+                self._conn.execute('UPDATE jobs SET completed = completed + 1, failed = failed + ?, '
+                                   'updated_at = ? WHERE id = ?', (failed, time.time(), job_id))
+            self._conn.execute('COMMIT')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """
+    Run stored jobs on a bounded pool of job threads.
+
+    At most `workers` jobs run at once; further jobs wait in the queue.
+    Images inside a job are analyzed with the AnalysisPool when one is
+    given, otherwise one at a time by the analyzer. Jobs left queued or
+    running by a process that stopped are resumed from their first
+    unfinished image: queued ones when the manager starts, running ones
+    once their lease has expired. A job runs in one manager at a time.
+    """
+
+    def __init__(self, analyzer, store, workers=2, pool=None, lease_seconds=LEASE_SECONDS):
+        self.analyzer = analyzer
+        self.store = store
+        self.pool = pool
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis-job')
+        self._changed = threading.Condition()
+        self._scheduled = set()
+        self._scheduled_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._resume()
+        self._heartbeat = threading.Thread(target=self._keep_leases, name='analysis-job-lease', daemon=True)
+        self._heartbeat.start()
+
+    def submit(self, items):
+        """Queue a batch (dicts with 'image' and metadata) and return its job id"""
+        job_id = self.store.create(items)
+        self._schedule(job_id)
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def results(self, job_id):
+        return self.store.results(job_id)
+
+    def wait_for_change(self, job_id, last_seen, timeout=1.0):
+        """
+        Block until the job's progress differs from last_seen (a job dict)
+        or the timeout passes; returns the current job dict
+        """
+        deadline = time.time() + timeout
+        with self._changed:
+            while True:
+                job = self.store.get(job_id)
+                if job is None or last_seen is None or _progress(job) != _progress(last_seen):
+                    return job
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return job
+                self._changed.wait(remaining)
+
+    def shutdown(self, wait=True):
+        self._stopping.set()
+        self._executor.shutdown(wait=wait)
+        if wait:
+            self._heartbeat.join()
+
+    def _schedule(self, job_id):
+        with self._scheduled_lock:
+            if job_id in self._scheduled:
+                return
+            self._scheduled.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def _resume(self):
+        """Schedule queued jobs and running jobs whose owner stopped renewing their lease"""
+        for job_id in self.store.claimable_jobs(self.lease_seconds):
+            self._schedule(job_id)
+
+    def _keep_leases(self):
+        while not self._stopping.wait(self.lease_seconds / 3):
+            try:
+                self.store.renew(self.owner)
+                self._resume()
+            except Exception as e:
+                print(f"[WARN] Could not renew analysis job leases: {e}")
+
+    def _run(self, job_id):
+        try:
+            if not self.store.claim(job_id, self.owner, self.lease_seconds):
+                return
+            self._notify()
+            try:
+                items = self.store.pending_items(job_id)
+                for idx, result in self._analyze(items):
+                    self.store.record_result(job_id, idx, result)
+                    self._notify()
+                self.store.finish(job_id, self.owner, 'completed')
+            except Exception as e:
+                self.store.finish(job_id, self.owner, 'failed', str(e))
+            self._notify()
+        finally:
+            with self._scheduled_lock:
+                self._scheduled.discard(job_id)
+
+    def _analyze(self, items):
+        """(index, result) for every pending item, as each finishes"""
+        missing = {'status': 'error', 'message': 'No image data provided', 'error_type': 'ValueError'}
+        present = [(idx, image) for idx, image in items if image is not None]
+        for idx, image in items:
+            if image is None:
+                yield idx, dict(missing)
+
+        if self.pool is not None and len(present) > 1:
+            for pos, result in self.pool.imap_unordered([image for _, image in present]):
+                yield present[pos][0], result
+        else:
+            for idx, image in present:
+                yield idx, self.analyzer.analyze_image(image)
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+
+def _progress(job):
+    return job['status'], job['completed']
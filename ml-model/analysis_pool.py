@@ -0,0 +1,178 @@
+"""
+Process pool for analyzing many dam images concurrently
+Each worker process loads its own DamConditionAnalyzer once at startup
+"""
+
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import cv2
+from dam_condition_analyzer import DamConditionAnalyzer, analysis_outcome
+
+
+class AnalysisPool:
+    """
+    Run DamConditionAnalyzer.analyze_image over batches of images in worker
+    processes.
+
+    Workers are started lazily with the 'spawn' method (safe to use from a
+    threaded Flask server) and keep their analyzer between batches. OpenCV's
+    own thread pool is limited to cpu_count // workers threads per worker so
+    the processes do not oversubscribe the cores. At most max_in_flight
+    images are submitted at a time, which bounds the memory held by encoded
+    payloads and pending results. The result cache stays in the parent
+    process: hits are answered without a round trip to a worker.
+    """
+
+    def __init__(self, analyzer, workers=None, max_in_flight=None, opencv_threads=None):
+        self.analyzer = analyzer
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.opencv_threads = opencv_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def imap(self, images, analysis_max_side=None, include_timings=False):
+        """
+        Yield (index, result) for every image in input order. A failure on
+        one image is reported as that image's error result. Stage timings
+        measured in the workers are recorded in the parent analyzer's
+        metrics and, with include_timings, kept in the results.
+        """
+        executor = self._get_executor()
+        pending = deque()
+        in_flight = 0
+        for index, image_data in enumerate(images):
+            key, cached = self._lookup(image_data, analysis_max_side)
+            if cached is not None:
+                pending.append((index, key, self._cached(cached, include_timings)))
+                continue
+            future = executor.submit(_analyze, _picklable(image_data), analysis_max_side)
+            pending.append((index, key, future))
+            in_flight += 1
+            # Results are yielded in order, so drain from the head
+            while in_flight > self.max_in_flight:
+                item = pending.popleft()
+                in_flight -= not isinstance(item[2], dict)
+                yield self._collect(item, include_timings)
+        while pending:
+            yield self._collect(pending.popleft(), include_timings)
+
+    def imap_unordered(self, images, analysis_max_side=None, include_timings=False):
+        """
+        Yield (index, result) for every image as soon as it is finished.
+        Cache hits come first; the first analyzed result is available after
+        one image's analysis time regardless of batch size.
+        """
+        executor = self._get_executor()
+        running = {}
+        for index, image_data in enumerate(images):
+            key, cached = self._lookup(image_data, analysis_max_side)
+            if cached is not None:
+                yield index, self._cached(cached, include_timings)
+                continue
+            while len(running) >= self.max_in_flight:
+                yield from self._collect_done(running, None, include_timings)
+            future = executor.submit(_analyze, _picklable(image_data), analysis_max_side)
+            running[future] = (index, key)
+            yield from self._collect_done(running, 0, include_timings)
+        while running:
+            yield from self._collect_done(running, None, include_timings)
+
+    def map(self, images, analysis_max_side=None, include_timings=False):
+        """Results for all images, in input order"""
+        return [result for _, result in self.imap(images, analysis_max_side, include_timings)]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _get_executor(self):
+        # Batches from several request threads share one set of workers
+        with self._lock:
+            if self._executor is None:
+                settings = (self.analyzer.analysis_max_side, self.analyzer.min_region_area,
+                            self.analyzer.precision, self.analyzer.parallel_detectors,
+                            self.analyzer.validation_thumbnail_side)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(settings, self.opencv_threads)
+                )
+            return self._executor
+
+    def _lookup(self, image_data, analysis_max_side):
+        try:
+            return self.analyzer.lookup_cached_result(image_data, analysis_max_side)
+        except Exception:
+            # Undecodable input; let the worker report the error
+            return None, None
+
+    def _collect_done(self, running, timeout, include_timings):
+        """Yield finished futures, waiting up to timeout for the first one"""
+        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, key = running.pop(future)
+            yield self._collect((index, key, future), include_timings)
+
+    def _cached(self, result, include_timings):
+        self.analyzer.record_metrics({}, 'cached')
+        if include_timings:
+            result['timings'] = {}
+        return result
+
+    def _collect(self, item, include_timings):
+        """Wait for one pending item, record its timings and cache its result"""
+        index, key, outcome = item
+        if isinstance(outcome, dict):
+            return index, outcome
+        try:
+            result = outcome.result()
+        except Exception as e:
+            # A crashed or unpicklable task only fails its own image
+            self.analyzer.record_metrics({}, 'error')
+            return index, {
+                'status': 'error',
+                'message': str(e),
+                'error_type': type(e).__name__
+            }
+        timings = result.pop('timings', {})
+        self.analyzer.record_metrics({stage: ms / 1000 for stage, ms in timings.items()},
+                                     analysis_outcome(result))
+        self.analyzer.store_cached_result(key, result)
+        if include_timings:
+            result['timings'] = timings
+        return index, result
+
+
+def _picklable(image_data):
+    """memoryview payloads (zero-copy uploads) cannot be pickled"""
+    if isinstance(image_data, memoryview):
+        if isinstance(image_data.obj, bytes) and image_data.nbytes == len(image_data.obj):
+            return image_data.obj
+        return image_data.tobytes()
+    return image_data
+
+
+# Per-process analyzer for pool workers
+_worker = {}
+
+
+def _init_worker(settings, opencv_threads):
+    """Load the analyzer once per process"""
+    cv2.setNumThreads(opencv_threads)
+    analysis_max_side, min_region_area, precision, parallel_detectors, thumbnail_side = settings
+    _worker['analyzer'] = DamConditionAnalyzer(analysis_max_side=analysis_max_side,
+                                               min_region_area=min_region_area,
+                                               precision=precision,
+                                               parallel_detectors=parallel_detectors,
+                                               validation_thumbnail_side=thumbnail_side)
+
+
+def _analyze(image_data, analysis_max_side):
+    return _worker['analyzer'].analyze_image(image_data, analysis_max_side, include_timings=True)
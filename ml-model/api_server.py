@@ -6,34 +6,102 @@ Serves the trained dam monitoring ML model
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import numpy as np
-import joblib
-import json
+import hmac
 import os
+import threading
+import time
 from datetime import datetime
+from model_registry import ModelRegistry, ModelSet, load_model_set, warm_up
 
 app = Flask(__name__)
 CORS(app)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_DIR = os.path.join(BASE_DIR, 'models')
+MODEL_DIR = os.environ.get('DAM_MODEL_DIR', os.path.join(BASE_DIR, 'models'))
+
+# Versioned models; a server switches to a newly activated version without a restart
+registry = ModelRegistry(MODEL_DIR)
+
+# Seconds between checks of the registry for a newly activated version (0 disables)
+MODEL_POLL_SECONDS = float(os.environ.get('DAM_MODEL_POLL_SECONDS', 5))
+
+# Required in the X-Admin-Token header of /models requests; without it
+# the /models endpoints are disabled
+ADMIN_TOKEN = os.environ.get('DAM_ADMIN_TOKEN')
+
+_swap_lock = threading.Lock()
+_watcher_lock = threading.Lock()
+_watcher_pid = None
+
+def install_models(models, if_active=False):
+    """
+    Switch every request that starts from now on to models; with if_active
+    only when models.version is still the registry's active version, so a
+    slow load never replaces a version activated meanwhile. Returns whether
+    the models were switched.
+    """
+    global loaded_version, rf_model, gb_model, nn_model, scaler, compiled_model, metadata
+    with _swap_lock:
+        if if_active and (models.version != registry.active() or models.version == loaded_version):
+            return False
+        loaded_version = models.version
+        rf_model, gb_model, nn_model = models.rf_model, models.gb_model, models.nn_model
+        scaler, compiled_model, metadata = models.scaler, models.compiled_model, models.metadata
+        return True
+
+def active_models():
+    """The loaded models, read together so a swap never mixes two versions in one request"""
+    with _swap_lock:
+        return ModelSet(loaded_version, rf_model, gb_model, nn_model, scaler, compiled_model, metadata)
 
 # Load models
 print("Loading ML models...")
 try:
-    rf_model = joblib.load(os.path.join(MODEL_DIR, 'random_forest.pkl'))
-    gb_model = joblib.load(os.path.join(MODEL_DIR, 'gradient_boosting.pkl'))
-    nn_model = joblib.load(os.path.join(MODEL_DIR, 'neural_network.pkl'))
-    scaler = joblib.load(os.path.join(MODEL_DIR, 'scaler.pkl'))
-    
-    with open(os.path.join(MODEL_DIR, 'metadata.json'), 'r') as f:
-        metadata = json.load(f)
-    
-    print("[OK] Models loaded successfully!")
+    install_models(load_model_set(registry.path(), registry.active()))
+    print(f"[OK] Models loaded successfully! (version {loaded_version or 'unversioned'})")
 except Exception as e:
     print(f"[ERROR] Error loading models: {e}")
     print("Please run train_model.py first to train the models.")
-    rf_model = gb_model = nn_model = scaler = None
-    metadata = {}
+    install_models(ModelSet(None, None, None, None, None, None, {}))
+
+def reload_models():
+    """
+    Load and warm up the registry's active version when it is not the
+    loaded one, then switch to it; returns the version switched to. Requests
+    keep using the loaded models until the switch.
+    """
+    version = registry.active()
+    with _swap_lock:
+        if version is None or version == loaded_version:
+            return None
+    models = load_model_set(registry.path(version), version)
+    warm_up(models)
+    return version if install_models(models, if_active=True) else None
+
+def watch_registry():
+    """Follow activations made by other processes (e.g. train_model.py or another worker)"""
+    failed = None
+    while MODEL_POLL_SECONDS > 0:
+        time.sleep(MODEL_POLL_SECONDS)
+        try:
+            if registry.active() != failed:
+                version = reload_models()
+                if version is not None:
+                    print(f"[OK] Switched to model version {version}")
+        except Exception as e:
+            failed = registry.active()
+            print(f"[ERROR] Could not load model version {failed}: {e}")
+
+@app.before_request
+def start_registry_watcher():
+    """Poll the registry from every server process; forked workers start their own watcher"""
+    global _watcher_pid
+    if MODEL_POLL_SECONDS <= 0 or _watcher_pid == os.getpid():
+        return
+    with _watcher_lock:
+        if _watcher_pid != os.getpid():
+            _watcher_pid = os.getpid()
+            threading.Thread(target=watch_registry, daemon=True).start()
 
 feature_names = [
     'waterLevel', 'pressure', 'seepage', 'structuralStress', 
@@ -41,8 +109,66 @@ feature_names = [
     'ph', 'dissolvedOxygen', 'vibration', 'rainfall'
 ]
 
+# Value assumed for a feature missing from a reading, in feature_names order
+feature_defaults = {
+    'waterLevel': 65, 'pressure': 70, 'seepage': 3, 'structuralStress': 40,
+    'temperature': 20, 'inflow': 1000, 'outflow': 950, 'turbidity': 5,
+    'ph': 7.2, 'dissolvedOxygen': 7, 'vibration': 0.3, 'rainfall': 15
+}
+
 risk_labels = ['Safe', 'Medium Risk', 'High Risk', 'Critical']
 
+# Readings accepted by one /predict-batch request
+MAX_BATCH_ROWS = 100000
+
+# Larger batches go to sklearn, whose compiled per-tree loops outrun the
+# NumPy traversal once per-call overhead no longer dominates
+COMPILED_MAX_ROWS = 256
+
+# Sensor thresholds that add a recommendation: (feature, limit, priority,
+# category, action, reason with the value formatted in)
+threshold_recommendations = [
+    ('waterLevel', 85, 'HIGH', 'Water Management', 'Increase outflow through spillways immediately',
+     'Water level at {:.1f}% approaching maximum capacity'),
+    ('pressure', 100, 'HIGH', 'Structural Integrity', 'Emergency structural inspection required',
+     'Pressure at {:.1f} kPa exceeds safe limits'),
+    ('seepage', 7, 'HIGH', 'Maintenance', 'Inspect and seal seepage points urgently',
+     'Seepage rate of {:.1f} L/min is dangerously high'),
+    ('structuralStress', 75, 'HIGH', 'Structural Assessment', 'Conduct immediate structural stress analysis',
+     'Structural stress at {:.1f}% approaching failure threshold'),
+    ('rainfall', 80, 'MEDIUM', 'Weather Monitoring', 'Monitor weather forecasts and prepare for increased inflow',
+     'Heavy rainfall of {:.1f} mm detected')
+]
+
+critical_recommendations = [
+    {
+        'priority': 'CRITICAL',
+        'category': 'Emergency Response',
+        'action': 'Activate emergency response protocol immediately',
+        'reason': 'Multiple parameters indicate imminent failure risk'
+    },
+    {
+        'priority': 'CRITICAL',
+        'category': 'Public Safety',
+        'action': 'Evacuate downstream areas immediately',
+        'reason': 'Dam failure probability is critically high'
+    }
+]
+
+high_risk_recommendation = {
+    'priority': 'HIGH',
+    'category': 'Monitoring',
+    'action': 'Implement 24/7 monitoring with hourly reports',
+    'reason': 'Elevated risk requires continuous surveillance'
+}
+
+routine_recommendation = {
+    'priority': 'LOW',
+    'category': 'Routine Operations',
+    'action': 'Continue routine monitoring and maintenance',
+    'reason': 'All systems operating within normal parameters'
+}
+
 @app.route('/')
 def home():
     return jsonify({
@@ -52,8 +178,10 @@ def home():
         'trained_date': metadata.get('trained_date', 'Unknown'),
         'endpoints': {
             '/predict': 'POST - Predict risk level',
+            '/predict-batch': 'POST - Predict risk levels of many readings',
             '/health': 'GET - Check API health',
-            '/model-info': 'GET - Get model information'
+            '/model-info': 'GET - Get model information',
+            '/models': 'GET - List model versions; POST /models/<version>/activate, /models/rollback'
         }
     })
 
@@ -76,9 +204,74 @@ def model_info():
         'ensemble_method': 'Average voting'
     })
 
+def admin_error():
+    """Error response for a /models request without the DAM_ADMIN_TOKEN, or when none is set"""
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'Model administration is disabled; set DAM_ADMIN_TOKEN'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'success': False, 'error': 'Admin token required'}), 403
+    return None
+
+def models_status():
+    return {'active': registry.active(), 'loaded': active_models().version, 'versions': registry.versions()}
+
+def switch_models(version, change):
+    """
+    Load and warm up version, record the change in the registry, then swap
+    the models in; requests are served by the current models meanwhile.
+    A version deleted or activated elsewhere in the meantime is not swapped
+    in.
+    """
+    try:
+        models = load_model_set(registry.path(version), version)
+        warm_up(models)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Model version {version} could not be loaded: {e}'}), 400
+    try:
+        change()
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e.args[0])}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OSError as e:
+        return jsonify({'success': False, 'error': f'Model registry could not be updated: {e}'}), 500
+    install_models(models, if_active=True)
+    return jsonify({'success': True, 'data': models_status()})
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """Stored model versions, the active one and the one this process serves"""
+    error = admin_error()
+    if error:
+        return error
+    return jsonify({'success': True, 'data': models_status()})
+
+@app.route('/models/<version>/activate', methods=['POST'])
+def activate_model(version):
+    error = admin_error()
+    if error:
+        return error
+    try:
+        registry.path(version)
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e.args[0])}), 404
+    return switch_models(version, lambda: registry.activate(version))
+
+@app.route('/models/rollback', methods=['POST'])
+def rollback_model():
+    """Return to the version that was active before the current one"""
+    error = admin_error()
+    if error:
+        return error
+    version = registry.previous()
+    if version is None:
+        return jsonify({'success': False, 'error': 'No earlier model version to roll back to'}), 400
+    return switch_models(version, registry.rollback)
+
 @app.route('/predict', methods=['POST'])
 def predict():
-    if rf_model is None or gb_model is None or nn_model is None or scaler is None:
+    models = active_models()
+    if models.rf_model is None or models.gb_model is None or models.nn_model is None or models.scaler is None:
         return jsonify({
             'success': False,
             'error': 'Models not loaded. Please train the models first.'
@@ -89,28 +282,10 @@ def predict():
         sensor_data = data.get('sensorData', {})
         
         # Prepare input
-        input_data = np.array([[
-            sensor_data.get('waterLevel', 65),
-            sensor_data.get('pressure', 70),
-            sensor_data.get('seepage', 3),
-            sensor_data.get('structuralStress', 40),
-            sensor_data.get('temperature', 20),
-            sensor_data.get('inflow', 1000),
-            sensor_data.get('outflow', 950),
-            sensor_data.get('turbidity', 5),
-            sensor_data.get('ph', 7.2),
-            sensor_data.get('dissolvedOxygen', 7),
-            sensor_data.get('vibration', 0.3),
-            sensor_data.get('rainfall', 15)
-        ]])
-        
-        # Scale input
-        input_scaled = scaler.transform(input_data)
+        input_data = np.array([[sensor_data.get(name, default) for name, default in feature_defaults.items()]])
         
         # Get predictions from all models
-        rf_pred = rf_model.predict_proba(input_scaled)[0]
-        gb_pred = gb_model.predict_proba(input_scaled)[0]
-        nn_pred = nn_model.predict_proba(input_scaled)[0]
+        rf_pred, gb_pred, nn_pred = (proba[0] for proba in ensemble_probabilities(input_data, models))
         
         # Ensemble prediction
         ensemble_proba = (rf_pred + gb_pred + nn_pred) / 3
@@ -157,7 +332,7 @@ def predict():
                 },
                 'recommendations': recommendations,
                 'timestamp': datetime.now().isoformat(),
-                'modelVersion': metadata.get('model_version', '1.0.0')
+                'modelVersion': models.metadata.get('model_version', '1.0.0')
             }
         }
         
@@ -169,85 +344,158 @@ def predict():
             'error': str(e)
         }), 500
 
-def generate_recommendations(sensor_data, risk_level):
-    """Generate actionable recommendations based on sensor data and risk level"""
-    recommendations = []
+@app.route('/predict-batch', methods=['POST'])
+def predict_batch():
+    """
+    Predict the risk of many readings at once: {"sensorData": [{...}, ...]}.
+    The scaler and each model run once over the whole matrix; every result
+    carries the fields of a /predict response, in request order.
+    """
+    models = active_models()
+    if models.rf_model is None or models.gb_model is None or models.nn_model is None or models.scaler is None:
+        return jsonify({
+            'success': False,
+            'error': 'Models not loaded. Please train the models first.'
+        }), 500
     
-    water_level = sensor_data.get('waterLevel', 65)
-    pressure = sensor_data.get('pressure', 70)
-    seepage = sensor_data.get('seepage', 3)
-    structural_stress = sensor_data.get('structuralStress', 40)
-    rainfall = sensor_data.get('rainfall', 15)
+    readings = (request.get_json(silent=True) or {}).get('sensorData')
+    if not isinstance(readings, list) or not readings or not all(isinstance(r, dict) for r in readings):
+        return jsonify({'success': False, 'error': 'sensorData must be a non-empty list of readings'}), 400
+    if len(readings) > MAX_BATCH_ROWS:
+        return jsonify({
+            'success': False,
+            'error': f'At most {MAX_BATCH_ROWS} readings per request, got {len(readings)}'
+        }), 400
+    try:
+        input_data = np.array([[reading.get(name, default) for name, default in feature_defaults.items()]
+                               for reading in readings], dtype=float)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Non-numeric sensor value: {e}'}), 400
+    invalid = np.flatnonzero(~np.isfinite(input_data).all(axis=1))
+    if len(invalid):
+        return jsonify({'success': False, 'error': f'Missing or non-finite sensor values in reading {invalid[0]}'}), 400
     
-    if risk_level >= 3:  # Critical
-        recommendations.append({
-            'priority': 'CRITICAL',
-            'category': 'Emergency Response',
-            'action': 'Activate emergency response protocol immediately',
-            'reason': 'Multiple parameters indicate imminent failure risk'
-        })
-        recommendations.append({
-            'priority': 'CRITICAL',
-            'category': 'Public Safety',
-            'action': 'Evacuate downstream areas immediately',
-            'reason': 'Dam failure probability is critically high'
+    try:
+        return jsonify({
+            'success': True,
+            'data': {
+                'count': len(readings),
+                'results': predict_rows(input_data, models),
+                'timestamp': datetime.now().isoformat(),
+                'modelVersion': models.metadata.get('model_version', '1.0.0')
+            }
         })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def ensemble_probabilities(input_data, models):
+    """
+    Class probabilities of the random forest, gradient boosting and neural
+    network models of a ModelSet for raw feature rows; the input is only
+    scaled when the compiled models do not have the scaler folded in
+    """
+    compiled = models.compiled_model
+    if compiled is not None and len(input_data) <= COMPILED_MAX_ROWS:
+        if compiled.raw_inputs:
+            return compiled.predict_proba(input_data)
+        return compiled.predict_proba(models.scaler.transform(input_data))
+    input_scaled = models.scaler.transform(input_data)
+    return (models.rf_model.predict_proba(input_scaled), models.gb_model.predict_proba(input_scaled),
+            models.nn_model.predict_proba(input_scaled))
+
+def predict_rows(input_data, models):
+    """/predict result fields for every row of a feature matrix (feature_names order)"""
+    rf_pred, gb_pred, nn_pred = ensemble_probabilities(input_data, models)
     
-    if risk_level >= 2:  # High
-        recommendations.append({
-            'priority': 'HIGH',
-            'category': 'Monitoring',
-            'action': 'Implement 24/7 monitoring with hourly reports',
-            'reason': 'Elevated risk requires continuous surveillance'
-        })
+    # Same arithmetic as /predict, one column at a time
+    ensemble_proba = (rf_pred + gb_pred + nn_pred) / 3
+    risk_levels = np.argmax(ensemble_proba, axis=1)
+    confidences = ensemble_proba[np.arange(len(input_data)), risk_levels]
+    risk_scores = (ensemble_proba[:, 0] * 0 + ensemble_proba[:, 1] * 33 +
+                   ensemble_proba[:, 2] * 66 + ensemble_proba[:, 3] * 100)
+    recommendations = batch_recommendations(input_data, risk_levels)
     
-    if water_level > 85:
-        recommendations.append({
-            'priority': 'HIGH',
-            'category': 'Water Management',
-            'action': 'Increase outflow through spillways immediately',
-            'reason': f'Water level at {water_level:.1f}% approaching maximum capacity'
+    levels = risk_levels.tolist()
+    probabilities = ensemble_proba.tolist()
+    model_levels = zip(np.argmax(rf_pred, axis=1).tolist(), np.argmax(gb_pred, axis=1).tolist(),
+                       np.argmax(nn_pred, axis=1).tolist())
+    results = []
+    for level, confidence, score, proba, (rf_level, gb_level, nn_level), advice in zip(
+            levels, confidences.tolist(), risk_scores.tolist(), probabilities, model_levels, recommendations):
+        results.append({
+            'riskScore': round(score, 2),
+            'riskLevel': level,
+            'riskLabel': risk_labels[level],
+            'confidence': round(confidence * 100, 2),
+            'prediction': {
+                'level': risk_labels[level],
+                'probability': confidence,
+                'message': get_risk_message(level),
+                'action': get_risk_action(level)
+            },
+            'probabilities': {
+                'safe': round(proba[0] * 100, 2),
+                'medium': round(proba[1] * 100, 2),
+                'high': round(proba[2] * 100, 2),
+                'critical': round(proba[3] * 100, 2)
+            },
+            'models': {
+                'randomForest': rf_level,
+                'gradientBoosting': gb_level,
+                'neuralNetwork': nn_level
+            },
+            'recommendations': advice
         })
+    return results
+
+def batch_recommendations(input_data, risk_levels):
+    """generate_recommendations for every row, with the threshold checks done per column"""
+    recommendations = [[] for _ in range(len(input_data))]
+    for row in np.flatnonzero(risk_levels >= 3):
+        recommendations[row].extend(critical_recommendations)
+    for row in np.flatnonzero(risk_levels >= 2):
+        recommendations[row].append(high_risk_recommendation)
     
-    if pressure > 100:
-        recommendations.append({
-            'priority': 'HIGH',
-            'category': 'Structural Integrity',
-            'action': 'Emergency structural inspection required',
-            'reason': f'Pressure at {pressure:.1f} kPa exceeds safe limits'
-        })
+    for feature, limit, priority, category, action, reason in threshold_recommendations:
+        values = input_data[:, feature_names.index(feature)]
+        for row in np.flatnonzero(values > limit):
+            recommendations[row].append({
+                'priority': priority,
+                'category': category,
+                'action': action,
+                'reason': reason.format(values[row])
+            })
     
-    if seepage > 7:
-        recommendations.append({
-            'priority': 'HIGH',
-            'category': 'Maintenance',
-            'action': 'Inspect and seal seepage points urgently',
-            'reason': f'Seepage rate of {seepage:.1f} L/min is dangerously high'
-        })
+    for row in np.flatnonzero(risk_levels <= 1):
+        if not recommendations[row]:
+            recommendations[row].append(routine_recommendation)
+    return recommendations
+
+def generate_recommendations(sensor_data, risk_level):
+    """Generate actionable recommendations based on sensor data and risk level"""
+    recommendations = []
     
-    if structural_stress > 75:
-        recommendations.append({
-            'priority': 'HIGH',
-            'category': 'Structural Assessment',
-            'action': 'Conduct immediate structural stress analysis',
-            'reason': f'Structural stress at {structural_stress:.1f}% approaching failure threshold'
-        })
+    if risk_level >= 3:  # Critical
+        recommendations.extend(critical_recommendations)
     
-    if rainfall > 80:
-        recommendations.append({
-            'priority': 'MEDIUM',
-            'category': 'Weather Monitoring',
-            'action': 'Monitor weather forecasts and prepare for increased inflow',
-            'reason': f'Heavy rainfall of {rainfall:.1f} mm detected'
-        })
+    if risk_level >= 2:  # High
+        recommendations.append(high_risk_recommendation)
+    
+    for feature, limit, priority, category, action, reason in threshold_recommendations:
+        value = sensor_data.get(feature, feature_defaults[feature])
+        if value > limit:
+            recommendations.append({
+                'priority': priority,
+                'category': category,
+                'action': action,
+                'reason': reason.format(value)
+            })
     
     if risk_level <= 1 and len(recommendations) == 0:
-        recommendations.append({
-            'priority': 'LOW',
-            'category': 'Routine Operations',
-            'action': 'Continue routine monitoring and maintenance',
-            'reason': 'All systems operating within normal parameters'
-        })
+        recommendations.append(routine_recommendation)
     
     return recommendations
 
@@ -282,6 +530,8 @@ if __name__ == '__main__':
     print("  GET  /health     - Health check")
     print("  GET  /model-info - Model details")
     print("  POST /predict    - Predict risk level")
+    print("  POST /predict-batch - Predict risk levels of many readings")
+    print("  GET  /models     - Model versions (POST /models/<version>/activate, /models/rollback)")
     print("\n" + "="*60 + "\n")
     
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,507 @@
+"""
+Vectorized analysis of batches of same-size images
+Frames from fixed cameras share one resolution, so they are stacked into one
+(N, H, W, C) array: pixel operations run as single OpenCV calls over the
+stack and per-image statistics as reductions along the batch axis
+"""
+
+import cv2
+import numpy as np
+from PIL import Image
+import fast_stats
+from dam_condition_analyzer import (CRACK_SEVERITY, DAMAGE_SEVERITY, EROSION_LEVELS,
+                                    MOISTURE_LEVELS, SURFACE_WEAR_LEVELS, DamConditionAnalyzer,
+                                    analysis_outcome, grade_indices)
+from image_context import ImageContext, pyramid_downscale, stride_thumbnail
+from image_decoder import normalize_pil, read_header
+from metrics import StageTimer
+
+# Pixels stacked per chunk (about six VGA frames). Larger chunks push the
+# float64 derivative maps out of cache and run slower
+DEFAULT_CHUNK_PIXELS = 1 << 21
+
+
+def _stack_key(image_array):
+    """Shape that groups an image with others it can be stacked with, or None"""
+    # Stacked 3x3 filters need at least three rows per frame
+    if image_array.dtype != np.uint8 or image_array.ndim not in (2, 3) or image_array.shape[0] < 3:
+        return None
+    if image_array.ndim == 3 and image_array.shape[2] != 3:
+        return None
+    return image_array.shape
+
+
+class HistogramBatch:
+    """
+    Unit-bin histograms of N images as an (N, bins) count matrix, with the
+    statistics of fast_stats.Histogram computed for all rows at once.
+    Every statistic uses the same arithmetic as Histogram, so the values
+    are identical.
+    """
+
+    def __init__(self, counts):
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.values = np.arange(self.counts.shape[1])
+        self.count = self.counts.sum(axis=1)
+
+    @property
+    def mean(self):
+        return (self.counts * self.values).sum(axis=1) / self.count
+
+    @property
+    def variance(self):
+        deviation = self.values - self.mean[:, None]
+        return (self.counts * deviation * deviation).sum(axis=1) / self.count
+
+    def quantile(self, q):
+        """Per-row q-th percentile with np.percentile's linear interpolation"""
+        cumulative = np.cumsum(self.counts, axis=1)
+        rank = q / 100 * (cumulative[:, -1] - 1)
+        lower = np.floor(rank)
+        # Rows of cumulative are sorted: counting entries <= x is searchsorted(side='right')
+        low_bin = (cumulative <= lower[:, None]).sum(axis=1)
+        high_bin = np.where(rank > lower, (cumulative <= lower[:, None] + 1).sum(axis=1), low_bin)
+        return low_bin + (rank - lower) * (high_bin - low_bin)
+
+    def count_where(self, mask):
+        """Per-row number of values whose bin satisfies an (N, bins) mask"""
+        return (self.counts * mask).sum(axis=1)
+
+    def count_above(self, thresholds):
+        return self.count_where(self.values > thresholds[:, None])
+
+    def row(self, index):
+        return fast_stats.Histogram(self.counts[index])
+
+
+class FrameStack:
+    """
+    Shared representations of N same-size uint8 frames, the batch
+    counterpart of image_context.ImageContext. Each representation is
+    computed for the whole stack at most once.
+    """
+
+    def __init__(self, frames, scale=1.0, precision='float64'):
+        self.frames = frames
+        self.count, self.height, self.width = frames.shape[:3]
+        self.is_color = frames.ndim == 4
+        self.scale = scale
+        self.precision = precision
+        self._cache = {}
+
+    def _memoize(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def pixel_count(self):
+        """Pixels per frame"""
+        return self.height * self.width
+
+    @property
+    def _compact(self):
+        return self.precision == 'float32'
+
+    def _rows(self, stack):
+        """View an (N, H, W[, C]) stack as one tall image for OpenCV"""
+        return stack.reshape((self.count * self.height,) + stack.shape[2:])
+
+    @property
+    def gray(self):
+        def compute():
+            if not self.is_color:
+                return self.frames
+            return cv2.cvtColor(self._rows(self.frames), cv2.COLOR_RGB2GRAY).reshape(self.frames.shape[:3])
+        return self._memoize('gray', compute)
+
+    @property
+    def hsv(self):
+        def compute():
+            if not self.is_color:
+                return None
+            return cv2.cvtColor(self._rows(self.frames), cv2.COLOR_RGB2HSV).reshape(self.frames.shape)
+        return self._memoize('hsv', compute)
+
+    def _filter3x3(self, apply):
+        """
+        Run a 3x3 filter over every frame with one call on the stacked
+        frames. The first and last row of each frame would see the
+        neighbouring frame, so they are recomputed from three-row blocks
+        that reflect the frame border as OpenCV does (BORDER_REFLECT_101).
+        """
+        gray = self.gray
+        height = self.height
+        out = apply(self._rows(gray)).reshape(gray.shape)
+        blocks = gray[:, [1, 0, 1, height - 2, height - 1, height - 2]]
+        edges = apply(blocks.reshape(self.count * 6, self.width)).reshape(self.count, 6, self.width)
+        out[:, 0] = edges[:, 1]
+        out[:, -1] = edges[:, 4]
+        return out
+
+    @property
+    def laplacian(self):
+        depth = cv2.CV_16S if self._compact else cv2.CV_64F
+        return self._memoize('laplacian', lambda: self._filter3x3(lambda rows: cv2.Laplacian(rows, depth)))
+
+    @property
+    def laplacian_magnitude(self):
+        def compute():
+            if self._compact:
+                return np.abs(self.laplacian).view(np.uint16)
+            return np.abs(self.laplacian)
+        return self._memoize('laplacian_magnitude', compute)
+
+    @property
+    def gray_histograms(self):
+        # cv2.calcHist per frame counts faster than any batched counting
+        # (2-D calcHist over a frame index image, offset bincount)
+        return self._memoize('gray_histograms', lambda: HistogramBatch(
+            [fast_stats.uint8_histogram(frame).counts for frame in self.gray]))
+
+    @property
+    def laplacian_histograms(self):
+        return self._memoize('laplacian_histograms', lambda: HistogramBatch(
+            [fast_stats.laplacian_magnitude_histogram(frame).counts for frame in self.laplacian_magnitude]))
+
+    @property
+    def laplacian_variance(self):
+        """Per-frame variance of the Laplacian, as ImageContext computes it"""
+        def compute():
+            flat = self.laplacian.reshape(self.count, -1)
+            if not self._compact:
+                return np.var(flat, axis=1)
+            hist = self.laplacian_histograms
+            mean_square = (hist.counts * hist.values.astype(np.float64) ** 2).sum(axis=1) / hist.count
+            mean = flat.sum(axis=1, dtype=np.int64) / hist.count
+            return mean_square - mean * mean
+        return self._memoize('laplacian_variance', compute)
+
+    @property
+    def gradient_means(self):
+        """Per-frame mean Sobel gradient magnitude"""
+        def compute():
+            depth = cv2.CV_32F if self._compact else cv2.CV_64F
+            gx = self._filter3x3(lambda rows: cv2.Sobel(rows, depth, 1, 0, ksize=3))
+            gy = self._filter3x3(lambda rows: cv2.Sobel(rows, depth, 0, 1, ksize=3))
+            # Sobel responses of uint8 images are integers, so x*x + y*y is
+            # exact and float64 cv2.magnitude matches np.sqrt(gx**2 + gy**2)
+            # bit for bit. Its float32 square root is approximate (about 1e-7
+            # relative, varying with buffer alignment), as in ImageContext
+            magnitude = cv2.magnitude(self._rows(gx), self._rows(gy)).reshape(self.count, -1)
+            if self._compact:
+                return magnitude.sum(axis=1, dtype=np.float64) / self.pixel_count
+            return magnitude.mean(axis=1)
+        return self._memoize('gradient_means', compute)
+
+    def count_regions(self, masks, min_region_area=None):
+        """
+        Per-frame region counts of an (N, H, W) mask stack as
+        DamConditionAnalyzer._count_regions reports them (background label
+        included), from one connected components pass. A blank row between
+        frames keeps regions from joining across frames.
+        """
+        padded = np.zeros((self.count, self.height + 1, self.width), dtype=np.uint8)
+        padded[:, :self.height] = masks
+        padded = padded.reshape(-1, self.width)
+        if not min_region_area:
+            # Labels follow raster order, so every frame owns a contiguous
+            # label range ending at its largest label; skipping the stats
+            # makes this pass several times faster. A frame without
+            # foreground has largest label 0, so its range ends where the
+            # previous frame's did
+            _, labels = cv2.connectedComponents(padded)
+            last = np.maximum.accumulate(labels.reshape(self.count, -1).max(axis=1))
+            return 1 + np.diff(last, prepend=0)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(padded)
+        large = stats[1:, cv2.CC_STAT_AREA] >= min_region_area * self.scale ** 2
+        frames = stats[1:, cv2.CC_STAT_TOP][large] // (self.height + 1)
+        return 1 + np.bincount(frames, minlength=self.count)
+
+    def context(self, index):
+        """ImageContext of one frame that reuses the stack's representations"""
+        ctx = ImageContext(self.frames[index], scale=self.scale, precision=self.precision)
+        representations = {'gray': self.gray[index]}
+        if self.is_color:
+            representations['hsv'] = self.hsv[index]
+        for key in ('laplacian', 'laplacian_magnitude'):
+            if key in self._cache:
+                representations[key] = self._cache[key][index]
+        if 'gray_histograms' in self._cache:
+            representations['gray_histogram'] = self.gray_histograms.row(index)
+        if 'laplacian_variance' in self._cache:
+            representations['laplacian_variance'] = float(self.laplacian_variance[index])
+        return ctx.preload(**representations)
+
+    def subset(self, indices):
+        """Stack of some frames, keeping the representations already computed"""
+        subset = FrameStack(self.frames[indices], self.scale, self.precision)
+        for key, value in self._cache.items():
+            if isinstance(value, HistogramBatch):
+                subset._cache[key] = HistogramBatch(value.counts[indices])
+            elif value is not None:
+                subset._cache[key] = value[indices]
+        return subset
+
+
+class BatchDamAnalyzer:
+    """
+    Analyze many same-size images with DamConditionAnalyzer's detectors,
+    vectorized over the batch.
+
+    Grayscale, HSV, Laplacian and (in float64 precision) Sobel maps are
+    computed with one OpenCV call per chunk of stacked frames. Histogram statistics, the moisture
+    threshold, algae coverage, erosion statistics, level thresholds, the
+    condition score and the condition level are array operations over the
+    batch axis. Moisture and damage regions of all frames are counted in
+    one connected components pass. Validation and crack detection (Canny
+    and morphology) run per frame on contexts that reuse the stacked
+    representations. Reports are identical to analyze_image's, including
+    the thumbnail validation of images more than twice
+    validation_thumbnail_side across.
+
+    Images of other sizes or dtypes in the same batch are grouped by shape;
+    uint8 is required for stacking and anything else is analyzed one by one.
+    """
+
+    def __init__(self, analyzer=None, chunk_pixels=DEFAULT_CHUNK_PIXELS):
+        self.analyzer = analyzer or DamConditionAnalyzer()
+        self.chunk_pixels = chunk_pixels
+
+    def analyze_batch(self, images, include_timings=False, detectors=None):
+        """
+        Analyze a list of images (any input analyze_image accepts); returns
+        results in input order. Decoded images are grouped by shape and each
+        group is analyzed in stacked chunks of at most chunk_pixels.
+        """
+        analyzer = self.analyzer
+        detectors = analyzer.select_detectors(detectors)
+        results = [None] * len(images)
+        timings = [None] * len(images)
+        cache_keys = [None] * len(images)
+        groups = {}
+
+        for index, image_data in enumerate(images):
+            timer = StageTimer()
+            try:
+                if isinstance(image_data, str):
+                    with timer.stage('base64_decode'):
+                        encoded = analyzer._encoded_bytes(image_data)
+                else:
+                    encoded = analyzer._encoded_bytes(image_data)
+                with timer.stage('cache_lookup'):
+                    cache_keys[index], cached = analyzer.lookup_cached_result(encoded, None, detectors)
+                if cached is not None:
+                    results[index] = cached
+                    timings[index] = (timer, 'cached')
+                    timer.stop()
+                    continue
+                header = None
+                thumbnail_checked = False
+                if encoded is not None and analyzer.validation_thumbnail_side:
+                    with timer.stage('thumbnail_validation'):
+                        header = read_header(encoded)
+                        thumbnail = analyzer._decode_thumbnail(encoded, header)
+                        rejection = thumbnail is not None and analyzer._validate_thumbnail(thumbnail)
+                    if rejection:
+                        results[index] = rejection
+                        timings[index] = (timer, 'rejected')
+                        timer.stop()
+                        continue
+                    thumbnail_checked = thumbnail is not None
+                with timer.stage('decode'):
+                    if encoded is not None:
+                        image_array = analyzer._decode_image_bytes(encoded, header)
+                    elif isinstance(image_data, Image.Image):
+                        image_array = normalize_pil(image_data)
+                    else:
+                        image_array = np.asarray(image_data)
+            except Exception as e:
+                results[index] = {'status': 'error', 'message': str(e), 'error_type': type(e).__name__}
+                timings[index] = (timer, 'error')
+                timer.stop()
+                continue
+
+            # Stages shared with the rest of the batch are added to the total later
+            timer.stop()
+            timings[index] = (timer, None)
+            key = _stack_key(image_array) or ('single', index)
+            group = groups.setdefault(key, [])
+            group.append((index, image_array, thumbnail_checked))
+            if len(group) * image_array.shape[0] * image_array.shape[1] >= self.chunk_pixels:
+                self._flush(groups.pop(key), results, timings, detectors)
+
+        for group in groups.values():
+            self._flush(group, results, timings, detectors)
+
+        for index, (timer, outcome) in enumerate(timings):
+            analyzer.store_cached_result(cache_keys[index], results[index])
+            timer.timings['total'] += timer.timings.pop('shared_total', 0.0)
+            analyzer.record_metrics(timer.timings, outcome or analysis_outcome(results[index]))
+            if include_timings:
+                results[index]['timings'] = timer.milliseconds()
+        return results
+
+    def _flush(self, group, results, timings, detectors):
+        """Analyze one group of same-shape images and share its stage timings"""
+        indices = [index for index, _, _ in group]
+        timer = StageTimer()
+        try:
+            if len(group) == 1:
+                _, array, checked = group[0]
+                analyzed = [self.analyzer._analyze_array(array, self.analyzer.analysis_max_side,
+                                                         timer, detectors, thumbnail_checked=checked)]
+            else:
+                analyzed = self.analyze_stack(np.stack([array for _, array, _ in group]), detectors, timer=timer,
+                                              thumbnail_checked=[checked for _, _, checked in group])
+        except Exception as e:
+            analyzed = [{'status': 'error', 'message': str(e), 'error_type': type(e).__name__} for _ in group]
+        timer.stop()
+        # Stacked stages are shared; every image is charged an equal part
+        shared = {stage: seconds / len(group) for stage, seconds in timer.timings.items()}
+        shared['shared_total'] = shared.pop('total')
+        for index, result in zip(indices, analyzed):
+            results[index] = result
+            own = timings[index][0].timings
+            for stage, seconds in shared.items():
+                own[stage] = own.get(stage, 0.0) + seconds
+
+    def analyze_stack(self, frames, detectors=None, timer=None, thumbnail_checked=None):
+        """
+        Analyze an (N, H, W, 3) RGB or (N, H, W) grayscale uint8 stack,
+        splitting it into chunks of at most chunk_pixels; returns one result
+        per frame. thumbnail_checked flags the frames whose thumbnail the
+        caller already validated.
+        """
+        frames = np.asarray(frames)
+        if frames.dtype != np.uint8 or frames.ndim not in (3, 4):
+            raise ValueError(f'Expected an (N, H, W[, 3]) uint8 stack, got {frames.dtype} {frames.shape}')
+        timer = timer or StageTimer()
+        if thumbnail_checked is None:
+            thumbnail_checked = [False] * len(frames)
+        per_chunk = max(1, self.chunk_pixels // (frames.shape[1] * frames.shape[2]))
+        results = []
+        for start in range(0, len(frames), per_chunk):
+            results.extend(self._analyze_chunk(frames[start:start + per_chunk], detectors, timer,
+                                               thumbnail_checked[start:start + per_chunk]))
+        return results
+
+    def _analyze_chunk(self, frames, detectors, timer, thumbnail_checked):
+        analyzer = self.analyzer
+        detectors = analyzer.select_detectors(detectors)
+        results = [None] * len(frames)
+        candidates = list(range(len(frames)))
+
+        # The thumbnail pass of _analyze_array, frame by frame; frames share
+        # a shape, so either all of them get a thumbnail or none does
+        side = analyzer.validation_thumbnail_side
+        if side and stride_thumbnail(frames[0], side) is not frames[0]:
+            with timer.stage('thumbnail_validation'):
+                candidates = []
+                for index, frame in enumerate(frames):
+                    rejection = None if thumbnail_checked[index] else analyzer._validate_thumbnail(
+                        stride_thumbnail(frame, side))
+                    if rejection:
+                        results[index] = rejection
+                    else:
+                        candidates.append(index)
+            if not candidates:
+                return results
+            if len(candidates) < len(frames):
+                frames = frames[candidates]
+
+        stack = FrameStack(np.ascontiguousarray(frames), precision=analyzer.precision)
+        with timer.stage('validation'):
+            # Representations validation reads, computed for the whole chunk
+            stack.gray_histograms, stack.hsv, stack.laplacian_variance
+            valid = []
+            for position, index in enumerate(candidates):
+                is_valid, message = analyzer._validate_dam_image(stack.context(position))
+                if is_valid:
+                    valid.append(position)
+                else:
+                    results[index] = analyzer._validation_error(message)
+        if not valid:
+            return results
+        if len(valid) < stack.count:
+            stack = stack.subset(valid)
+        valid = [candidates[position] for position in valid]
+
+        max_side = analyzer.analysis_max_side
+        if max_side and max(stack.height, stack.width) > max_side:
+            with timer.stage('downscale'):
+                reduced = [pyramid_downscale(frame, max_side) for frame in stack.frames]
+                stack = FrameStack(np.stack([frame for frame, _ in reduced]), scale=reduced[0][1],
+                                   precision=analyzer.precision)
+
+        grades = {}
+        columns = {}
+        with timer.stage('detectors'):
+            for name in detectors:
+                with timer.stage(name):
+                    columns[name], grades[name] = getattr(self, '_' + name)(stack)
+
+        with timer.stage('scoring'):
+            scores = analyzer._calculate_overall_scores(grades)
+            levels = analyzer._get_condition_levels(scores)
+            for position, index in enumerate(valid):
+                detector_results = {name: columns[name][position] for name in detectors}
+                report = analyzer._build_report(detector_results, float(scores[position]), levels[position])
+                if stack.scale < 1:
+                    report['analysis_resolution'] = {
+                        'width': int(stack.width),
+                        'height': int(stack.height),
+                        'scale': float(round(stack.scale, 4))
+                    }
+                results[index] = report
+        return results
+
+    # Detectors over a FrameStack: (per-frame result dicts, ladder indices
+    # or, for algae growth, coverage for the vectorized score)
+
+    def _cracks(self, stack):
+        analyzer = self.analyzer
+        crack_pixels = np.array([np.count_nonzero(analyzer._crack_mask(stack.context(index)))
+                                 for index in range(stack.count)])
+        coverage = crack_pixels / stack.pixel_count * 100 * stack.scale
+        results = [analyzer._classify_cracks(float(value), pixels / stack.scale)
+                   for value, pixels in zip(coverage, crack_pixels)]
+        return results, grade_indices(coverage, CRACK_SEVERITY)
+
+    def _surface_wear(self, stack):
+        hist = stack.gray_histograms
+        variance = hist.variance
+        thresholds = hist.quantile(25)
+        wear_pixels = hist.count_where(np.abs(hist.values - hist.mean[:, None]) > thresholds[:, None])
+        coverage = wear_pixels / hist.count * 100
+        results = [self.analyzer._classify_surface_wear(float(v), float(c)) for v, c in zip(variance, coverage)]
+        return results, grade_indices(variance, SURFACE_WEAR_LEVELS)
+
+    def _moisture(self, stack):
+        dark_pixels = stack.gray_histograms.counts[:, :100].sum(axis=1)
+        percentage = dark_pixels / stack.pixel_count * 100
+        regions = stack.count_regions(stack.gray < 100, self.analyzer.min_region_area)
+        results = [self.analyzer._classify_moisture(float(p), areas) for p, areas in zip(percentage, regions)]
+        return results, grade_indices(percentage, MOISTURE_LEVELS)
+
+    def _algae_growth(self, stack):
+        if not stack.is_color:
+            coverage = np.zeros(stack.count)
+            return [{'detected': False, 'coverage': 0} for _ in range(stack.count)], coverage
+        mask = cv2.inRange(stack._rows(stack.hsv), np.array([35, 40, 40]), np.array([90, 255, 255]))
+        green_pixels = np.count_nonzero(mask.reshape(stack.count, -1), axis=1)
+        coverage = green_pixels / (stack.pixel_count * 3) * 100
+        return [self.analyzer._classify_algae(float(value)) for value in coverage], coverage
+
+    def _structural_damage(self, stack):
+        hist = stack.laplacian_histograms
+        thresholds = hist.quantile(75)
+        percentage = hist.count_above(thresholds) / stack.pixel_count * 100
+        masks = stack.laplacian_magnitude > thresholds[:, None, None]
+        regions = stack.count_regions(masks, self.analyzer.min_region_area)
+        results = [self.analyzer._classify_structural_damage(float(p), areas) for p, areas in zip(percentage, regions)]
+        return results, grade_indices(percentage, DAMAGE_SEVERITY)
+
+    def _erosion(self, stack):
+        scores = stack.gradient_means
+        return [self.analyzer._classify_erosion(float(score)) for score in scores], grade_indices(scores, EROSION_LEVELS)
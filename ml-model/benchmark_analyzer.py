@@ -0,0 +1,277 @@
+"""
+Benchmark suite for DamConditionAnalyzer
+Times analyze_image end to end and per stage on a synthetic corpus, records
+peak memory and compares the results against a stored baseline
+
+Usage:
+    python benchmark_analyzer.py [--sizes 0.3 2 12 48] [--variants concrete cracked]
+                                 [--repeat 3] [--output results.json]
+                                 [--baseline baseline.json] [--tolerance 0.15]
+
+Each case runs in a fresh process so its peak RSS is not inflated by earlier
+cases. A run with --baseline exits with status 1 if any case got slower or
+used more memory than the tolerance allows, or if its score changed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from dam_condition_analyzer import ANALYZER_VERSION, DamConditionAnalyzer
+from synthetic_corpus import VARIANTS, create_variant
+
+DEFAULT_SIZES = [0.3, 2, 12, 48]
+
+
+def _proc_status_mb(field):
+    """VmRSS/VmHWM from /proc/self/status in MB, or None off Linux"""
+    try:
+        with open('/proc/self/status', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """
+    Start a new RSS high-water mark (Linux). ru_maxrss survives fork and
+    exec, so without this a fresh worker inherits the parent's peak from
+    generating the corpus image.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='utf-8') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _current_rss_mb():
+    rss = _proc_status_mb('VmRSS')
+    return rss if rss is not None else _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    """Process high-water RSS in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def write_input(image, directory, input_format):
+    """Store a corpus image as the analyzer will receive it"""
+    if input_format == 'array':
+        path = os.path.join(directory, 'image.npy')
+        np.save(path, image)
+    else:
+        path = os.path.join(directory, 'image.png')
+        # Fast compression; encoding time is not part of the benchmark
+        cv2.imwrite(path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    return path
+
+
+def run_case(path, repeat, analyzer_options):
+    """
+    Analyze one stored image: a warm-up run for peak RSS, repeat timed
+    runs and one run under tracemalloc. Runs in its own process.
+    """
+    if path.endswith('.npy'):
+        image = np.load(path)
+    else:
+        with open(path, 'rb') as f:
+            image = f.read()
+    analyzer = DamConditionAnalyzer(**analyzer_options)
+
+    _reset_peak_rss()
+    rss_before = _current_rss_mb()
+    result = analyzer.analyze_image(image)
+    rss_peak = _peak_rss_mb()
+
+    latencies = []
+    stages = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        timed = analyzer.analyze_image(image, include_timings=True)
+        latencies.append(time.perf_counter() - start)
+        for stage, ms in timed.get('timings', {}).items():
+            stages.setdefault(stage, []).append(ms)
+
+    tracemalloc.start()
+    analyzer.analyze_image(image)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'status': result['status'],
+        'message': result.get('message'),
+        'condition_score': result.get('condition_score'),
+        'overall_condition': result.get('overall_condition'),
+        'latency_ms': {
+            'median': round(float(np.median(latencies_ms)), 2),
+            'min': round(float(latencies_ms.min()), 2),
+            'max': round(float(latencies_ms.max()), 2)
+        },
+        'stages_ms': {stage: round(float(np.median(values)), 2) for stage, values in stages.items()},
+        'peak_traced_mb': round(traced_peak / 2 ** 20, 1),
+        'peak_rss_mb': round(rss_peak, 1),
+        'peak_rss_delta_mb': round(rss_peak - rss_before, 1)
+    }
+
+
+def add_budgets(case):
+    """Peak memory per megapixel, the budget to provision per concurrent request"""
+    megapixels = case['width'] * case['height'] / 1e6
+    case['peak_rss_mb_per_mp'] = round(case['peak_rss_delta_mb'] / megapixels, 1)
+    case['peak_traced_mb_per_mp'] = round(case['peak_traced_mb'] / megapixels, 1)
+    return case
+
+
+def run_benchmark(sizes, variants, repeat=3, seed=0, input_format='png', analyzer_options=None,
+                  isolate=True, log=print):
+    """Benchmark every (size, variant) case; returns the results document"""
+    analyzer_options = analyzer_options or {}
+    cases = []
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in sizes:
+            for variant in variants:
+                image = create_variant(variant, megapixels, seed)
+                height, width = image.shape[:2]
+                path = write_input(image, tmp, input_format)
+                del image
+
+                if isolate:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        measured = executor.submit(run_case, path, repeat, analyzer_options).result()
+                else:
+                    measured = run_case(path, repeat, analyzer_options)
+
+                case = add_budgets({'variant': variant, 'megapixels': megapixels, 'width': width,
+                                    'height': height, **measured})
+                cases.append(case)
+                log(format_case(case))
+
+    return {
+        'meta': {
+            'analyzer_version': ANALYZER_VERSION,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'input': input_format,
+            'repeat': repeat,
+            'seed': seed,
+            'analyzer_options': analyzer_options,
+            'isolated': isolate
+        },
+        'cases': cases
+    }
+
+
+def format_case(case):
+    if case['status'] != 'success':
+        return f"{case['megapixels']:>6} {case['variant']:<10} {case['status']}: {case['message']}"
+    stages = case['stages_ms']
+    slowest = sorted((name for name in stages if name not in ('total', 'detectors')),
+                     key=stages.get, reverse=True)[:3]
+    return (f"{case['megapixels']:>6} {case['variant']:<10} {case['latency_ms']['median']:>9.1f}ms "
+            f"{case['peak_rss_delta_mb']:>8.1f}MB {case['peak_traced_mb']:>8.1f}MB "
+            f"{case['peak_rss_mb_per_mp']:>7.1f} "
+            f"{case['condition_score']:>6.1f}  " + ', '.join(f'{name} {stages[name]:.0f}' for name in slowest))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Per-case ratios against a baseline document. Returns (rows, regressions)
+    where regressions lists human-readable descriptions.
+    """
+    reference = {(case['variant'], case['megapixels']): case for case in baseline['cases']}
+    rows = []
+    regressions = []
+    for case in results['cases']:
+        base = reference.get((case['variant'], case['megapixels']))
+        if base is None or base['status'] != 'success' or case['status'] != 'success':
+            continue
+        name = f"{case['variant']} @ {case['megapixels']} MP"
+        latency = case['latency_ms']['median'] / base['latency_ms']['median']
+        memory = case['peak_traced_mb'] / base['peak_traced_mb'] if base['peak_traced_mb'] else 1.0
+        rows.append((name, latency, memory))
+        if latency > 1 + tolerance:
+            regressions.append(f'{name}: latency {latency:.2f}x baseline')
+        if memory > 1 + tolerance:
+            regressions.append(f'{name}: peak memory {memory:.2f}x baseline')
+        if case['condition_score'] != base['condition_score']:
+            regressions.append(f"{name}: condition score {base['condition_score']} -> {case['condition_score']}")
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=DEFAULT_SIZES, help='image sizes in megapixels')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--input', choices=['png', 'array'], default='png',
+                        help='png includes decoding in the end-to-end time')
+    parser.add_argument('--analysis-max-side', type=int, default=None)
+    parser.add_argument('--precision', choices=['float64', 'float32'], default='float64')
+    parser.add_argument('--parallel-detectors', action='store_true',
+                        help='run the detectors of each image on a shared thread pool')
+    parser.add_argument('--in-process', action='store_true',
+                        help='run cases in this process (faster, but peak RSS accumulates)')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='allowed relative slowdown or memory growth before flagging a regression')
+    args = parser.parse_args()
+
+    analyzer_options = {'precision': args.precision, 'parallel_detectors': args.parallel_detectors}
+    if args.analysis_max_side:
+        analyzer_options['analysis_max_side'] = args.analysis_max_side
+
+    print("=" * 78)
+    print("DAM CONDITION ANALYZER BENCHMARK")
+    print("=" * 78)
+    print(f"{'MP':>6} {'variant':<10} {'latency':>11} {'RSS grew':>10} {'traced':>10} {'RSS/MP':>7} {'score':>6}  slowest stages (ms)")
+    results = run_benchmark(args.sizes, args.variants, args.repeat, args.seed, args.input,
+                            analyzer_options, isolate=not args.in_process)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.tolerance)
+        print(f"\n{'case':<24} {'latency':>9} {'memory':>9}   (vs. baseline)")
+        for name, latency, memory in rows:
+            print(f"{name:<24} {latency:>8.2f}x {memory:>8.2f}x")
+        if regressions:
+            print("\nREGRESSIONS:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nNo regressions")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
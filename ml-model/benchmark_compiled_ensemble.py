@@ -0,0 +1,88 @@
+"""
+Benchmark for the compiled NumPy evaluator against sklearn's predict_proba
+Reports the median latency of each ensemble model and of the whole ensemble
+(scaling of the raw readings included) per batch size, and the largest
+probability difference between the two
+
+Usage:
+    python benchmark_compiled_ensemble.py [--batch-sizes 1 100 10000] [--repeat 20] [--no-fold]
+
+By default the scaler is folded into the compiled models, as train_model.py
+exports them; --no-fold scales the readings before the compiled models too.
+
+Models are loaded from models/ when train_model.py has been run; otherwise
+models with the production settings are trained on --train-samples synthetic
+readings first.
+"""
+
+import argparse
+import time
+import numpy as np
+import api_server
+from benchmark_predict_batch import ensure_models, sample_readings
+from compiled_ensemble import compile_ensemble
+
+MODELS = ('rf', 'gb', 'nn')
+
+
+def median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def sklearn_proba(raw):
+    X = api_server.scaler.transform(raw)
+    return tuple(model.predict_proba(X) for model in (api_server.rf_model, api_server.gb_model, api_server.nn_model))
+
+
+def compiled_proba(compiled, raw):
+    return compiled.predict_proba(raw if compiled.raw_inputs else api_server.scaler.transform(raw))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--train-samples', type=int, default=2000)
+    parser.add_argument('--no-fold', action='store_true', help='keep the scaler out of the compiled models')
+    args = parser.parse_args()
+
+    source = ensure_models(args.train_samples)
+    compiled = compile_ensemble(api_server.rf_model, api_server.gb_model, api_server.nn_model,
+                                scaler=None if args.no_fold else api_server.scaler)
+    readings = sample_readings(max(args.batch_sizes))
+    raw = np.array([[reading[name] for name in api_server.feature_names] for reading in readings])
+    X = api_server.scaler.transform(raw)
+    models = dict(zip(MODELS, (api_server.rf_model, api_server.gb_model, api_server.nn_model)))
+    evaluators = {'rf': compiled._random_forest, 'gb': compiled._gradient_boosting, 'nn': compiled._neural_network}
+
+    print("=" * 60)
+    print("COMPILED ENSEMBLE BENCHMARK")
+    print("=" * 60)
+    print(f"Models: {source} ({compiled.manifest['rf']['trees']} forest trees, "
+          f"{compiled.manifest['gb']['stages']} boosting stages, {compiled.manifest['inputs']} inputs)")
+    print(f"{'rows':>6} {'model':>8} {'sklearn ms':>11} {'compiled ms':>12} {'speedup':>8} {'max diff':>9}")
+    for size in args.batch_sizes:
+        rows, readings = X[:size], raw[:size]
+        if compiled.raw_inputs:
+            inputs = {'rf': readings, 'gb': readings, 'nn': readings}
+        else:
+            rounded = rows.astype(np.float32).astype(np.float64)
+            inputs = {'rf': rounded, 'gb': rounded, 'nn': rows}
+        for name in MODELS:
+            reference = median_ms(lambda: models[name].predict_proba(rows), args.repeat)
+            fast = median_ms(lambda: evaluators[name](inputs[name]), args.repeat)
+            difference = np.abs(evaluators[name](inputs[name]) - models[name].predict_proba(rows)).max()
+            print(f"{size:>6} {name:>8} {reference:>11.2f} {fast:>12.2f} {reference / fast:>7.1f}x {difference:>9.1e}")
+        reference = median_ms(lambda: sklearn_proba(readings), args.repeat)
+        fast = median_ms(lambda: compiled_proba(compiled, readings), args.repeat)
+        difference = max(np.abs(a - b).max() for a, b in zip(compiled_proba(compiled, readings),
+                                                              sklearn_proba(readings)))
+        print(f"{size:>6} {'ensemble':>8} {reference:>11.2f} {fast:>12.2f} {reference / fast:>7.1f}x {difference:>9.1e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Microbenchmark: histogram-based statistics vs. np.percentile / np.var
+on the thresholds used by the dam condition analyzer
+
+Usage:
+    python benchmark_fast_stats.py [--megapixels 12] [--repeat 5]
+"""
+
+import argparse
+import timeit
+import numpy as np
+import cv2
+import fast_stats
+
+
+def measure(label, function, repeat):
+    seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+    print(f"  {label:<44} {seconds * 1000:>9.2f} ms")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    width = int((args.megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    gray = cv2.GaussianBlur(rng.integers(0, 256, (height, width), dtype=np.uint8), (5, 5), 0)
+    magnitude = np.abs(cv2.Laplacian(gray, cv2.CV_64F))
+
+    print("=" * 60)
+    print(f"FAST STATISTICS BENCHMARK ({width}x{height})")
+    print("=" * 60)
+
+    print("Surface wear (25th percentile, mean, variance of gray)")
+    exact = measure("np.percentile + np.mean + np.var",
+                    lambda: (np.percentile(gray, 25), np.mean(gray), np.var(gray)), args.repeat)
+    fast = measure("uint8_histogram -> quantile/mean/variance",
+                   lambda: (lambda h: (h.quantile(25), h.mean, h.variance))(fast_stats.uint8_histogram(gray)),
+                   args.repeat)
+    print(f"  speedup {exact / fast:.1f}x")
+
+    print("Structural damage (75th percentile of |Laplacian|)")
+    exact = measure("np.percentile", lambda: np.percentile(magnitude, 75), args.repeat)
+    fast = measure("laplacian_magnitude_histogram -> quantile",
+                   lambda: fast_stats.laplacian_magnitude_histogram(magnitude).quantile(75), args.repeat)
+    print(f"  speedup {exact / fast:.1f}x")
+
+    hist = fast_stats.uint8_histogram(gray)
+    lap_hist = fast_stats.laplacian_magnitude_histogram(magnitude)
+    print("Absolute error vs. exact")
+    print(f"  gray p25      {abs(hist.quantile(25) - np.percentile(gray, 25)):.3g}")
+    print(f"  gray variance {abs(hist.variance - np.var(gray)):.3g}")
+    print(f"  |lap| p75     {abs(lap_hist.quantile(75) - np.percentile(magnitude, 75)):.3g}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
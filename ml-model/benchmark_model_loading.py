@@ -0,0 +1,179 @@
+"""
+Benchmark for model loading and per-worker memory of the risk prediction API
+Times each loading step, then starts prefork_server.py with every worker
+loading the models itself (--no-preload) and with the models loaded once
+before forking. For each it reports the time until every worker is ready
+and, after a warm-up of /predict and /predict-batch requests, the memory of
+the workers from /proc/<pid>/smaps_rollup (Linux): RSS, USS (pages only
+that worker holds) and PSS (shared pages split between their users).
+
+Usage:
+    python benchmark_model_loading.py [--workers 4] [--requests 200] [--train-samples 2000]
+
+Models are loaded from models/ when train_model.py has been run; otherwise
+models with the production settings are trained on --train-samples synthetic
+readings and saved to a temporary directory first.
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import joblib
+import numpy as np
+from compiled_ensemble import MANIFEST, CompiledEnsemble, compile_ensemble
+from model_registry import ModelRegistry
+from train_model import DamMonitoringMLModel
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PICKLES = ('random_forest', 'gradient_boosting', 'neural_network', 'scaler')
+
+
+def model_dir(train_samples, scratch):
+    """Directory with the pickles and compiled export (the active version), training models when models/ has none"""
+    path = ModelRegistry(os.path.join(BASE_DIR, 'models')).path()
+    if all(os.path.exists(os.path.join(path, name)) for name in ('random_forest.pkl', f'compiled/{MANIFEST}')):
+        return path, 'models/'
+    model = DamMonitoringMLModel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.train_models(model.generate_training_data(train_samples))
+        model.save_models(scratch)
+    return scratch, f'trained on {train_samples} samples'
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def cold_start_ms(path):
+    """Milliseconds to import api_server (libraries and models) in a fresh interpreter"""
+    script = ('import time; start = time.perf_counter(); import api_server; '
+              'print((time.perf_counter() - start) * 1000)')
+    output = subprocess.run([sys.executable, '-c', script], cwd=BASE_DIR, env=dict(os.environ, DAM_MODEL_DIR=path),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+
+def loading_steps(path):
+    """Milliseconds of each step of loading the models"""
+    models, unpickle = timed(lambda: {name: joblib.load(os.path.join(path, f'{name}.pkl')) for name in PICKLES})
+    compiled = os.path.join(path, 'compiled')
+    return {
+        'import api_server (cold)': cold_start_ms(path),
+        'unpickle sklearn models': unpickle,
+        'compile from the models': timed(lambda: compile_ensemble(
+            models['random_forest'], models['gradient_boosting'], models['neural_network'],
+            scaler=models['scaler']))[1],
+        'read compiled export': timed(lambda: CompiledEnsemble.load(compiled))[1],
+        'memory-map compiled export': timed(lambda: CompiledEnsemble.load(compiled, mmap_mode='r'))[1]
+    }
+
+
+def memory_mb(pid):
+    """RSS, USS and PSS of a process in MB"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0]) / 1024
+    return fields['Rss'], fields['Private_Clean'] + fields['Private_Dirty'], fields['Pss']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def post(port, path, body):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('POST', path, json.dumps(body), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        assert response.status == 200, response.read()
+        response.read()
+    finally:
+        connection.close()
+
+
+def run_server(path, workers, preload, readings, requests):
+    """(seconds until every worker is ready, parent pid, worker pids, memory per pid)"""
+    port = free_port()
+    command = [sys.executable, os.path.join(BASE_DIR, 'prefork_server.py'), '--host', '127.0.0.1',
+               '--port', str(port), '--workers', str(workers)] + ([] if preload else ['--no-preload'])
+    env = dict(os.environ, DAM_MODEL_DIR=path, PYTHONUNBUFFERED='1')
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        ready = []
+        for line in server.stdout:
+            ready += [int(pid) for pid in re.findall(r'Worker (\d+) ready', line)]
+            if len(ready) == workers:
+                break
+        seconds = time.perf_counter() - start
+        if len(ready) < workers:
+            raise RuntimeError('prefork_server.py exited before its workers were ready')
+
+        # Single readings take the compiled path; the batches go through sklearn
+        for index in range(requests):
+            if index % 10:
+                post(port, '/predict', {'sensorData': readings[index % len(readings)]})
+            else:
+                post(port, '/predict-batch', {'sensorData': readings})
+        memory = {pid: memory_mb(pid) for pid in [server.pid] + ready}
+        return seconds, server.pid, ready, memory
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='warm-up requests before measuring memory')
+    parser.add_argument('--batch-rows', type=int, default=1000, help='readings per /predict-batch warm-up request')
+    parser.add_argument('--train-samples', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path, source = model_dir(args.train_samples, scratch)
+        model = DamMonitoringMLModel()
+        state = np.random.get_state()
+        with contextlib.redirect_stdout(io.StringIO()):
+            readings = model.generate_training_data(args.batch_rows)[model.feature_names].to_dict('records')
+        np.random.set_state(state)
+
+        print("=" * 60)
+        print("MODEL LOADING BENCHMARK")
+        print("=" * 60)
+        print(f"Models: {source}")
+        for step, ms in loading_steps(path).items():
+            print(f"{step:>28}: {ms:8.1f} ms")
+
+        print(f"\n{args.workers} workers, memory after {args.requests} requests (MB)")
+        print(f"{'mode':>10} {'ready s':>8} {'worker RSS':>11} {'worker USS':>11} {'worker PSS':>11} "
+              f"{'parent RSS':>11} {'total PSS':>10}")
+        for preload in (False, True):
+            seconds, parent, ready, memory = run_server(path, args.workers, preload, readings, args.requests)
+            rss, uss, pss = np.mean([memory[pid] for pid in ready], axis=0)
+            total = sum(values[2] for values in memory.values())
+            mode = 'preload' if preload else 'no-preload'
+            print(f"{mode:>10} {seconds:>8.2f} {rss:>11.1f} {uss:>11.1f} {pss:>11.1f} "
+                  f"{memory[parent][0]:>11.1f} {total:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
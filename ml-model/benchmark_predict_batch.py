@@ -0,0 +1,94 @@
+"""
+Benchmark for /predict-batch against one /predict request per reading
+Reports rows per second through the Flask app (request parsing, models and
+JSON serialization included)
+
+Usage:
+    python benchmark_predict_batch.py [--single 200] [--batch-sizes 100 1000 10000] [--repeat 3]
+
+Models are loaded from models/ when train_model.py has been run; otherwise
+models with the production settings are trained on --train-samples synthetic
+readings first.
+"""
+
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+import api_server
+from compiled_ensemble import compile_ensemble
+from train_model import DamMonitoringMLModel
+
+
+def ensure_models(train_samples):
+    """Use the server's models, training fresh ones when none were loaded"""
+    if api_server.rf_model is not None:
+        return 'models/'
+    model = DamMonitoringMLModel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.train_models(model.generate_training_data(train_samples))
+    api_server.rf_model = model.rf_model
+    api_server.gb_model = model.gb_model
+    api_server.nn_model = model.nn_model
+    api_server.scaler = model.scaler
+    api_server.compiled_model = compile_ensemble(model.rf_model, model.gb_model, model.nn_model,
+                                                 scaler=model.scaler)
+    return f'trained on {train_samples} samples'
+
+
+def sample_readings(count, seed=0):
+    """Synthetic sensor readings covering every risk level"""
+    model = DamMonitoringMLModel()
+    state = np.random.get_state()
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame = model.generate_training_data(count)
+    np.random.set_state(state)
+    return frame[model.feature_names].sample(frac=1, random_state=seed).to_dict('records')
+
+
+def time_single(client, readings):
+    start = time.perf_counter()
+    for reading in readings:
+        response = client.post('/predict', json={'sensorData': reading})
+        assert response.status_code == 200, response.json
+    return time.perf_counter() - start
+
+
+def time_batch(client, readings, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.post('/predict-batch', json={'sensorData': readings})
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.json
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--single', type=int, default=200, help='readings sent one request each')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--train-samples', type=int, default=2000)
+    args = parser.parse_args()
+
+    source = ensure_models(args.train_samples)
+    readings = sample_readings(max(args.single, *args.batch_sizes))
+    client = api_server.app.test_client()
+
+    print("=" * 60)
+    print("BATCH PREDICTION BENCHMARK")
+    print("=" * 60)
+    print(f"Models: {source}")
+    single = args.single / time_single(client, readings[:args.single])
+    print(f"{'endpoint':>14} {'rows':>7} {'seconds':>9} {'rows/s':>10} {'speedup':>8}")
+    print(f"{'/predict':>14} {args.single:>7} {args.single / single:>9.3f} {single:>10.0f} {1:>7.0f}x")
+    for size in args.batch_sizes:
+        seconds = time_batch(client, readings[:size], args.repeat)
+        rate = size / seconds
+        print(f"{'/predict-batch':>14} {size:>7} {seconds:>9.3f} {rate:>10.0f} {rate / single:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark for resolution-capped (pyramid) dam image analysis
+Reports latency saved and score drift against full-resolution runs
+
+Usage:
+    python benchmark_pyramid.py [--sizes 2 12] [--caps 1024 2048] [--repeat 3]
+"""
+
+import argparse
+import time
+import numpy as np
+from dam_condition_analyzer import DamConditionAnalyzer
+from synthetic_corpus import create_concrete_image
+
+
+def time_analysis(analyzer, image, repeat, **options):
+    """Median latency over repeat runs and the last result"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = analyzer.analyze_image(image, **options)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[2, 12], help='image sizes in megapixels')
+    parser.add_argument('--caps', type=int, nargs='+', default=[1024, 2048], help='analysis_max_side values')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-region-area', type=float, default=16,
+                        help='minimum region area in original pixels (0 counts every component)')
+    args = parser.parse_args()
+
+    analyzer = DamConditionAnalyzer(min_region_area=args.min_region_area or None)
+
+    print("=" * 78)
+    print("PYRAMID ANALYSIS BENCHMARK")
+    print("=" * 78)
+    print(f"{'MP':>6} {'cap':>6} {'latency':>9} {'saved':>7} {'score':>7} {'drift':>7} "
+          f"{'level':>6} {'cracks%':>8} {'moist.':>7} {'damage':>7}")
+
+    for megapixels in args.sizes:
+        image = create_concrete_image(megapixels)
+        full_time, full = time_analysis(analyzer, image, args.repeat)
+        if full['status'] != 'success':
+            print(f"{megapixels:>6} synthetic image rejected: {full['message']}")
+            continue
+
+        rows = [(None, full_time, full)]
+        for cap in args.caps:
+            rows.append((cap, *time_analysis(analyzer, image, args.repeat, analysis_max_side=cap)))
+
+        for cap, latency, result in rows:
+            saved = 1 - latency / full_time
+            drift = result['condition_score'] - full['condition_score']
+            level_match = 'same' if result['overall_condition'] == full['overall_condition'] else 'diff'
+            analysis = result['analysis']
+            print(f"{megapixels:>6} {cap or 'full':>6} {latency * 1000:>7.0f}ms {saved:>7.0%} "
+                  f"{result['condition_score']:>7.1f} {drift:>+7.1f} {level_match:>6} "
+                  f"{analysis['cracks']['coverage']:>8.2f} {analysis['moisture']['areas']:>7} "
+                  f"{analysis['structural_damage']['areas']:>7}")
+
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
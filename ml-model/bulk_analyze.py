@@ -0,0 +1,263 @@
+"""
+Bulk offline analysis of image directories
+Walks directories, analyzes every image with a process pool and appends one
+result per image to a JSONL or CSV file. Progress is checkpointed, so an
+interrupted run resumes where it stopped.
+
+Usage:
+    python bulk_analyze.py ../backend/uploads --output rescore.jsonl [--workers 8]
+    python bulk_analyze.py archive/ --output rescore.csv --analysis-max-side 2048
+    python bulk_analyze.py archive/ --output rescore.csv --restart
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from analysis_pool import AnalysisPool
+from dam_condition_analyzer import DamConditionAnalyzer, analysis_outcome
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+# Flattened detector fields of the CSV output, in report order
+DETECTOR_FIELDS = {
+    'cracks': ('detected', 'severity', 'coverage'),
+    'surface_wear': ('level', 'coverage'),
+    'moisture': ('detected', 'level', 'areas'),
+    'algae_growth': ('detected', 'coverage'),
+    'structural_damage': ('detected', 'severity', 'areas'),
+    'erosion': ('detected', 'level')
+}
+CSV_COLUMNS = (['path', 'bytes', 'status', 'condition_score', 'overall_condition', 'risk_level'] +
+               [f'{name}_{field}' for name, fields in DETECTOR_FIELDS.items() for field in fields] +
+               ['analysis_ms', 'error_type', 'message'])
+
+
+def find_images(paths):
+    """Image files under the given files and directories, each directory walked in name order"""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+
+def csv_row(path, size, result):
+    """One CSV row (dict keyed by CSV_COLUMNS) of a result"""
+    row = {'path': path, 'bytes': size, 'status': result['status'],
+           'error_type': result.get('error_type'), 'message': result.get('message'),
+           'analysis_ms': result.get('timings', {}).get('total')}
+    for key in ('condition_score', 'overall_condition', 'risk_level'):
+        row[key] = result.get(key)
+    for name, fields in DETECTOR_FIELDS.items():
+        values = result.get('analysis', {}).get(name, {})
+        for field in fields:
+            row[f'{name}_{field}'] = values.get(field)
+    return row
+
+
+class ResultWriter:
+    """
+    Append results to a JSONL or CSV file (chosen by extension). The
+    checkpoint file next to it records how many bytes of the output are
+    complete and which analyzer produced them; it is replaced atomically
+    every checkpoint_every results, so after a crash the output is cut back
+    to the last checkpoint and at most that many images are analyzed again.
+    """
+
+    def __init__(self, path, fingerprint, checkpoint_every=50, restart=False):
+        self.path = path
+        self.format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        self.checkpoint_path = path + '.checkpoint'
+        self.fingerprint = fingerprint
+        self.checkpoint_every = checkpoint_every
+        self.completed = set()
+        self._pending = 0
+
+        checkpoint = None if restart or not os.path.exists(path) else self._read_checkpoint()
+        if checkpoint is not None and checkpoint['fingerprint'] != fingerprint:
+            raise ValueError(f'{path} was written by a different analyzer version or settings; '
+                             'use --restart to analyze everything again')
+        if checkpoint is None and not restart and os.path.exists(path) and os.path.getsize(path):
+            raise ValueError(f'{path} exists without a checkpoint; use --restart to overwrite it')
+
+        self._file = open(path, 'r+' if checkpoint else 'w', newline='', encoding='utf-8')
+        if checkpoint:
+            self._file.truncate(checkpoint['bytes'])
+            self._file.seek(0)
+            self.completed = self._read_paths(self._file.read())
+            self._file.seek(checkpoint['bytes'])
+        self._csv = csv.DictWriter(self._file, CSV_COLUMNS) if self.format == 'csv' else None
+        if self._csv and not checkpoint:
+            self._csv.writeheader()
+        self.checkpoint()
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read_paths(self, text):
+        if self.format == 'csv':
+            return {row['path'] for row in csv.DictReader(io.StringIO(text, newline=''))}
+        return {json.loads(line)['path'] for line in text.splitlines() if line}
+
+    def write(self, path, size, result):
+        if self._csv:
+            self._csv.writerow(csv_row(path, size, result))
+        else:
+            self._file.write(json.dumps({'path': path, 'bytes': size, **result}) + '\n')
+        self.completed.add(path)
+        self._pending += 1
+        if self._pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Make everything written so far durable and record it"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'bytes': self._file.tell(),
+                       'completed': len(self.completed)}, f)
+        os.replace(temp, self.checkpoint_path)
+        self._pending = 0
+
+    def close(self):
+        self.checkpoint()
+        self._file.close()
+
+
+class _Throughput:
+    """Counts and rates of a run, reported to a stream every interval seconds"""
+
+    def __init__(self, total, skipped, stream, interval=5.0):
+        self.total = total
+        self.skipped = skipped
+        self.stream = stream
+        self.interval = interval
+        self.outcomes = {'success': 0, 'rejected': 0, 'error': 0}
+        self.bytes = 0
+        self.start = self._last = time.perf_counter()
+
+    @property
+    def done(self):
+        return sum(self.outcomes.values())
+
+    def add(self, size, result):
+        self.outcomes[analysis_outcome(result)] += 1
+        self.bytes += size
+        now = time.perf_counter()
+        if self.stream and now - self._last >= self.interval:
+            self._last = now
+            self.report(now)
+
+    def summary(self, now=None):
+        seconds = (now or time.perf_counter()) - self.start
+        return {
+            'images': self.total,
+            'skipped': self.skipped,
+            'analyzed': self.done,
+            **self.outcomes,
+            'seconds': round(seconds, 3),
+            'images_per_second': round(self.done / seconds, 2) if seconds else None,
+            'megabytes_per_second': round(self.bytes / seconds / 1e6, 2) if seconds else None
+        }
+
+    def report(self, now=None):
+        summary = self.summary(now)
+        remaining = self.total - self.skipped - self.done
+        rate = summary['images_per_second']
+        eta = f', ETA {remaining / rate:.0f}s' if rate and remaining else ''
+        print(f'[{self.skipped + self.done}/{self.total}] {rate} images/s, '
+              f'{summary["megabytes_per_second"]} MB/s, {self.outcomes["rejected"]} rejected, '
+              f'{self.outcomes["error"]} errors{eta}', file=self.stream, flush=True)
+
+
+def bulk_analyze(paths, output, analyzer=None, workers=None, checkpoint_every=50, restart=False,
+                 progress=sys.stderr, progress_every=5.0):
+    """
+    Analyze every image under paths into output and return the run summary.
+    Images already in the output (as of its checkpoint) are skipped unless
+    restart is set. workers <= 1 analyzes in this process.
+    """
+    analyzer = analyzer or DamConditionAnalyzer()
+    workers = workers or os.cpu_count() or 1
+    writer = ResultWriter(output, analyzer.fingerprint, checkpoint_every, restart)
+    images = list(find_images(paths))
+    todo = [path for path in images if path not in writer.completed]
+    throughput = _Throughput(len(images), len(images) - len(todo), progress, progress_every)
+    sizes = {}
+    read_errors = {}
+
+    def payloads():
+        for index, path in enumerate(todo):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                read_errors[index] = e
+                data = b''
+            sizes[index] = len(data)
+            yield data
+
+    pool = AnalysisPool(analyzer, workers=workers) if workers > 1 and len(todo) > 1 else None
+    try:
+        if pool is not None:
+            results = pool.imap_unordered(payloads(), include_timings=True)
+        else:
+            results = ((index, analyzer.analyze_image(data, include_timings=True))
+                       for index, data in enumerate(payloads()))
+        for index, result in results:
+            if index in read_errors:
+                error = read_errors.pop(index)
+                result = {'status': 'error', 'message': str(error), 'error_type': type(error).__name__}
+            size = sizes.pop(index)
+            writer.write(todo[index], size, result)
+            throughput.add(size, result)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.shutdown()
+
+    summary = throughput.summary()
+    if progress:
+        throughput.report()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='image files or directories (walked recursively)')
+    parser.add_argument('--output', required=True, help='results file, .jsonl or .csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--analysis-max-side', type=int, help='cap the detection resolution')
+    parser.add_argument('--precision', choices=('float64', 'float32'), default='float64')
+    parser.add_argument('--checkpoint-every', type=int, default=50, help='results between checkpoints')
+    parser.add_argument('--progress-every', type=float, default=5.0, help='seconds between progress lines')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    args = parser.parse_args()
+
+    analyzer = DamConditionAnalyzer(analysis_max_side=args.analysis_max_side, precision=args.precision)
+    try:
+        summary = bulk_analyze(args.paths, args.output, analyzer, workers=args.workers,
+                               checkpoint_every=args.checkpoint_every, restart=args.restart,
+                               progress_every=args.progress_every)
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Incremental change-detection analysis against a dam's previous inspection
+Fixed cameras photograph the same dam face again and again; only the grid
+cells that changed since the last inspection are re-analyzed
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+from PIL import Image
+import fast_stats
+from dam_condition_analyzer import DETECTORS, DamConditionAnalyzer, analysis_outcome
+from image_context import ImageContext, stride_thumbnail
+from image_decoder import normalize_pil
+from metrics import StageTimer
+from tiled_analyzer import (merge_statistics, results_from_statistics, tile_boxes, tile_damage_regions,
+                            tile_statistics)
+
+# Cells are compared on images reduced by this factor (cell_size must be a multiple)
+COMPARE_FACTOR = 4
+
+# Per-cell statistics as stored arrays; every key of tiled_analyzer.tile_statistics
+_CELL_ARRAYS = ('pixels', 'crack_pixels', 'green_pixels', 'gradient_sum', 'moisture_regions', 'damage_regions')
+
+
+class InspectionStore:
+    """
+    Last inspection of every dam on disk: the reference image (in the frame
+    of the dam's first inspection), per-cell detector statistics and a
+    metadata file with the report. Each save writes a new generation
+    directory and then swaps a CURRENT pointer with an atomic rename, so
+    readers never see a half-written inspection.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _dam_dir(self, dam_name):
+        return os.path.join(self.directory, hashlib.sha256(dam_name.encode('utf-8')).hexdigest()[:24])
+
+    def load(self, dam_name):
+        """(reference image, cell statistics list, metadata) or None"""
+        dam_dir = self._dam_dir(dam_name)
+        try:
+            with open(os.path.join(dam_dir, 'CURRENT'), 'r', encoding='utf-8') as f:
+                generation = os.path.join(dam_dir, f.read().strip())
+            with open(os.path.join(generation, 'inspection.json'), 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            image = np.load(os.path.join(generation, 'reference.npy'))
+            with np.load(os.path.join(generation, 'cells.npz')) as arrays:
+                # Every NpzFile lookup reads the member again; read each once
+                cells = _unpack_cells(dict(arrays), metadata['channels'])
+        except (OSError, ValueError, KeyError):
+            return None
+        return image, cells, metadata
+
+    def save(self, dam_name, image, cells, metadata):
+        dam_dir = self._dam_dir(dam_name)
+        with self._lock:
+            os.makedirs(dam_dir, exist_ok=True)
+            generation = tempfile.mkdtemp(dir=dam_dir, prefix=f'{time.time_ns()}-')
+            np.save(os.path.join(generation, 'reference.npy'), image)
+            np.savez(os.path.join(generation, 'cells.npz'), **_pack_cells(cells))
+            with open(os.path.join(generation, 'inspection.json'), 'w', encoding='utf-8') as f:
+                json.dump(metadata, f)
+            fd, pointer = tempfile.mkstemp(dir=dam_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(os.path.basename(generation))
+            os.replace(pointer, os.path.join(dam_dir, 'CURRENT'))
+            for name in os.listdir(dam_dir):
+                path = os.path.join(dam_dir, name)
+                if path != generation and os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+
+
+def _pack_cells(cells):
+    arrays = {key: np.array([stats[key] for stats in cells]) for key in _CELL_ARRAYS}
+    arrays['gray_hist'] = np.stack([stats['gray_hist'].counts for stats in cells])
+    arrays['laplacian_hist'] = np.stack([stats['laplacian_hist'].counts for stats in cells])
+    return arrays
+
+
+def _unpack_cells(arrays, channels):
+    cells = []
+    for index in range(len(arrays['pixels'])):
+        stats = {key: arrays[key][index].item() for key in _CELL_ARRAYS}
+        stats['channels'] = channels
+        stats['gray_hist'] = fast_stats.Histogram(arrays['gray_hist'][index])
+        stats['laplacian_hist'] = fast_stats.Histogram(arrays['laplacian_hist'][index])
+        cells.append(stats)
+    return cells
+
+
+def register(reference, image):
+    """
+    Translation (dx, dy) in pixels that maps image onto reference, and the
+    phase correlation peak response (near 1 for the same scene, near 0 for
+    unrelated images). Estimated on images reduced by COMPARE_FACTOR.
+    """
+    small_reference = _small_gray(reference).astype(np.float32)
+    small_image = _small_gray(image).astype(np.float32)
+    window = cv2.createHanningWindow(small_reference.shape[::-1], cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(small_reference, small_image, window)
+    return int(round(dx * COMPARE_FACTOR)), int(round(dy * COMPARE_FACTOR)), float(response)
+
+
+def _small_gray(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape
+    size = (max(1, width // COMPARE_FACTOR), max(1, height // COMPARE_FACTOR))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def translate(image, dx, dy):
+    """Shift image content by (-dx, -dy), replicating the edges it uncovers"""
+    if dx == 0 and dy == 0:
+        return image
+    matrix = np.float32([[1, 0, -dx], [0, 1, -dy]])
+    return cv2.warpAffine(image, matrix, (image.shape[1], image.shape[0]), flags=cv2.INTER_NEAREST,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+def cell_differences(reference, image, cell_size):
+    """
+    Mean absolute gray-level difference per grid cell (rows x cols) between
+    two aligned images, on blurred reduced images and after removing the
+    global brightness difference, so daylight changes alone do not mark
+    every cell as changed
+    """
+    small_reference = cv2.GaussianBlur(_small_gray(reference), (0, 0), 1).astype(np.float32)
+    small_image = cv2.GaussianBlur(_small_gray(image), (0, 0), 1).astype(np.float32)
+    small_image += small_reference.mean() - small_image.mean()
+    difference = np.abs(small_image - small_reference)
+
+    step = cell_size // COMPARE_FACTOR
+    rows = np.arange(0, difference.shape[0], step)
+    cols = np.arange(0, difference.shape[1], step)
+    sums = np.add.reduceat(np.add.reduceat(difference, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, difference.shape[0])), np.diff(np.append(cols, difference.shape[1])))
+    return sums / counts
+
+
+class ChangeDetectionAnalyzer:
+    """
+    Analyze a dam photo incrementally against the dam's last inspection.
+
+    The image is split into cell_size cells analyzed like
+    tiled_analyzer.TiledDamAnalyzer tiles (with a halo, producing mergeable
+    statistics). A new image is registered against the stored reference
+    with phase correlation, aligned, and compared cell by cell; only cells
+    whose mean gray-level difference exceeds change_threshold are
+    re-analyzed and the stored statistics of all other cells are reused.
+    The report has the analyze_image schema plus a 'tiles' score grid, a
+    'change_detection' block and a 'delta' against the previous inspection.
+
+    The reference is updated cell by cell, so every cell's stored pixels
+    are the ones its statistics came from, and slow drift is caught once it
+    adds up to the threshold. A first inspection, a failed registration
+    (shift above max_shift of the image size or a peak response below
+    min_response), a different image size or a changed analyzer fingerprint
+    analyze every cell and start a new reference. After a failed
+    registration the delta still compares the whole-image results with the
+    previous inspection. Every image passes analyze_image's full-resolution
+    validation before it is analyzed or stored.
+
+    Structural damage regions depend on the global 75th-percentile
+    Laplacian threshold; stored counts are reused while it is unchanged and
+    every cell is recounted (Laplacian only) when it moves.
+    """
+
+    def __init__(self, analyzer=None, store=None, cell_size=256, halo=16, change_threshold=4.0,
+                 max_shift=0.05, min_response=0.1):
+        if cell_size % COMPARE_FACTOR:
+            raise ValueError(f'cell_size must be a multiple of {COMPARE_FACTOR}')
+        self.analyzer = analyzer or DamConditionAnalyzer()
+        self.store = store or InspectionStore(os.path.join(tempfile.gettempdir(), 'dam_inspections'))
+        self.cell_size = cell_size
+        self.halo = halo
+        self.change_threshold = change_threshold
+        self.max_shift = max_shift
+        self.min_response = min_response
+
+    def analyze(self, dam_name, image_data, include_timings=False):
+        """
+        Analyze image_data (any input analyze_image accepts) as the newest
+        inspection of dam_name and store it as the new reference
+        """
+        analyzer = self.analyzer
+        timer = StageTimer()
+        try:
+            with timer.stage('decode'):
+                encoded = analyzer._encoded_bytes(image_data)
+                if encoded is not None:
+                    image = analyzer._decode_image_bytes(encoded)
+                elif isinstance(image_data, Image.Image):
+                    image = normalize_pil(image_data)
+                else:
+                    image = np.asarray(image_data)
+            result = self._analyze_array(dam_name, image, timer)
+        except Exception as e:
+            result = {'status': 'error', 'message': str(e), 'error_type': type(e).__name__}
+
+        timer.stop()
+        analyzer.record_metrics(timer.timings, analysis_outcome(result))
+        if include_timings:
+            result['timings'] = timer.milliseconds()
+        return result
+
+    def _analyze_array(self, dam_name, image, timer):
+        analyzer = self.analyzer
+        if image.dtype != np.uint8:
+            raise ValueError(f'Expected an 8-bit image, got {image.dtype}')
+        if analyzer.validation_thumbnail_side:
+            thumbnail = stride_thumbnail(image, analyzer.validation_thumbnail_side)
+            if thumbnail is not image:
+                with timer.stage('thumbnail_validation'):
+                    rejection = analyzer._validate_thumbnail(thumbnail)
+                if rejection:
+                    return rejection
+        # Every inspection becomes the next reference, so incremental ones
+        # pass the same full-resolution validation as analyze_image
+        with timer.stage('validation'):
+            is_valid, message = analyzer._validate_dam_image(ImageContext(image, precision=analyzer.precision))
+        if not is_valid:
+            return analyzer._validation_error(message)
+
+        boxes = tile_boxes(image.shape[0], image.shape[1], self.cell_size, self.halo)
+        with timer.stage('load_reference'):
+            previous, reason = self._usable_previous(dam_name, image)
+        change = {'mode': 'full', 'reason': reason}
+        # Inspection the delta is reported against
+        baseline = None
+
+        if previous is not None:
+            reference, cells, metadata = previous
+            with timer.stage('registration'):
+                dx, dy, response = register(reference, image)
+            change['registration'] = {'dx': dx, 'dy': dy, 'response': round(response, 4)}
+            limit = self.max_shift * max(image.shape[:2])
+            if response < self.min_response or max(abs(dx), abs(dy)) > limit:
+                # Same dam, but the views cannot be aligned: analyze in full
+                # and compare the whole-image results only
+                previous, baseline = None, metadata
+                change['reason'] = 'registration failed'
+            else:
+                baseline = metadata
+
+        if previous is None:
+            reference, cells, metadata = image.copy(), [None] * len(boxes), None
+            changed = list(range(len(boxes)))
+        else:
+            with timer.stage('change_detection'):
+                image = translate(image, dx, dy)
+                differences = cell_differences(reference, image, self.cell_size).ravel()
+                changed = [int(index) for index in np.flatnonzero(differences > self.change_threshold)]
+            reference = np.array(reference)
+            change['mode'] = 'incremental'
+            change['reason'] = None
+
+        with timer.stage('detectors'):
+            for index in changed:
+                (y0, y1, x0, x1), (py0, py1, px0, px1) = boxes[index][2]
+                ctx = ImageContext(np.ascontiguousarray(image[py0:py1, px0:px1]), precision=analyzer.precision)
+                core = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+                cells[index] = tile_statistics(analyzer, ctx, core)
+                if metadata is not None:
+                    reference[y0:y1, x0:x1] = image[y0:y1, x0:x1]
+
+            merged = merge_statistics(cells)
+            threshold = float(merged['laplacian_hist'].quantile(75))
+            recount = range(len(boxes)) if metadata is None or metadata['damage_threshold'] != threshold else changed
+            for index in recount:
+                (y0, y1, x0, x1), (py0, py1, px0, px1) = boxes[index][2]
+                ctx = ImageContext(np.ascontiguousarray(reference[py0:py1, px0:px1]), precision=analyzer.precision)
+                core = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+                cells[index]['damage_regions'] = tile_damage_regions(analyzer, ctx, core, threshold)
+            merged['damage_regions'] = sum(stats['damage_regions'] for stats in cells)
+
+        with timer.stage('scoring'):
+            report = analyzer._build_report(results_from_statistics(analyzer, merged, threshold))
+            rows = boxes[-1][0] + 1
+            cols = boxes[-1][1] + 1
+            scores = [round(analyzer._calculate_overall_score(results_from_statistics(analyzer, stats)), 2)
+                      for stats in cells]
+            report['tiles'] = {
+                'tile_size': self.cell_size,
+                'halo': self.halo,
+                'rows': rows,
+                'cols': cols,
+                'scores': np.reshape(scores, (rows, cols)).tolist()
+            }
+            change['cells'] = {'total': len(boxes), 'changed': len(changed), 'reused': len(boxes) - len(changed)}
+            change['changed_cells'] = [[boxes[index][0], boxes[index][1]] for index in changed]
+            report['change_detection'] = change
+            report['delta'] = _delta(baseline, report, changed, boxes, scores, aligned=metadata is not None)
+
+        with timer.stage('store'):
+            self.store.save(dam_name, reference, cells, {
+                'dam_name': dam_name,
+                'timestamp': report['timestamp'],
+                'fingerprint': analyzer.fingerprint,
+                'cell_size': self.cell_size,
+                'halo': self.halo,
+                'shape': list(reference.shape),
+                'channels': cells[0]['channels'],
+                'damage_threshold': threshold,
+                'condition_score': report['condition_score'],
+                'overall_condition': report['overall_condition'],
+                'analysis': report['analysis'],
+                'tile_scores': scores
+            })
+        return report
+
+    def _usable_previous(self, dam_name, image):
+        """Stored inspection that can serve as reference, or (None, reason)"""
+        previous = self.store.load(dam_name)
+        if previous is None:
+            return None, 'no previous inspection'
+        reference, _, metadata = previous
+        if reference.shape != image.shape:
+            return None, 'image size changed'
+        if metadata['fingerprint'] != self.analyzer.fingerprint:
+            return None, 'analyzer changed'
+        if (metadata['cell_size'], metadata['halo']) != (self.cell_size, self.halo):
+            return None, 'cell layout changed'
+        return previous, None
+
+
+def _delta(previous, report, changed, boxes, scores, aligned=True):
+    """
+    What changed since the previous inspection (None for the first one);
+    per-cell changes (None unless aligned) need the views registered
+    """
+    if previous is None:
+        return None
+    detectors = {}
+    for name in DETECTORS:
+        before = previous['analysis'].get(name, {})
+        after = report['analysis'].get(name, {})
+        fields = {field: {'previous': before.get(field), 'current': value}
+                  for field, value in after.items() if before.get(field) != value}
+        if fields:
+            detectors[name] = fields
+    return {
+        'since': previous['timestamp'],
+        'condition_score': {
+            'previous': previous['condition_score'],
+            'current': report['condition_score'],
+            'change': round(report['condition_score'] - previous['condition_score'], 2)
+        },
+        'overall_condition': {'previous': previous['overall_condition'], 'current': report['overall_condition']},
+        'detectors': detectors,
+        'cells': [{'row': boxes[index][0], 'col': boxes[index][1],
+                   'previous_score': previous['tile_scores'][index], 'current_score': scores[index]}
+                  for index in changed] if aligned else None
+    }
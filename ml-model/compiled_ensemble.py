@@ -0,0 +1,278 @@
+"""
+Compiled NumPy evaluator for the risk prediction ensemble
+Flattens the trained Random Forest, Gradient Boosting and MLP models into
+plain arrays (saved as .npy files with a JSON manifest) and computes their
+class probabilities without sklearn's per-call validation and dispatch.
+The StandardScaler can be folded into the arrays, so that raw sensor
+readings are scored without a transform step.
+"""
+
+import json
+import os
+import numpy as np
+
+FORMAT_VERSION = 1
+
+MANIFEST = 'manifest.json'
+
+# Rows x trees traversed per step; keeps the working arrays in cache
+TRAVERSAL_BLOCK = 32768
+
+_ACTIVATIONS = {
+    'identity': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+    'logistic': lambda x: np.divide(1, 1 + np.exp(-x, out=x), out=x)
+}
+
+
+def _flatten_trees(trees):
+    """
+    Nodes of fitted sklearn trees as contiguous arrays: feature, threshold,
+    left child and value per node, and the root of every tree. Nodes are
+    renumbered breadth-first so the children of a node are adjacent (the
+    right child is left + 1). A leaf points to itself with an infinite
+    threshold, so traversing past it stays put.
+    """
+    feature, threshold, left, value, roots = [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        tree = tree.tree_
+        order = [0]
+        position = {0: 0}
+        for node in order:
+            if tree.children_left[node] != -1:
+                for child in (tree.children_left[node], tree.children_right[node]):
+                    position[child] = len(order)
+                    order.append(child)
+        for node in order:
+            if tree.children_left[node] == -1:
+                feature.append(0)
+                threshold.append(np.inf)
+                left.append(offset + position[node])
+            else:
+                feature.append(tree.feature[node])
+                threshold.append(tree.threshold[node])
+                left.append(offset + position[tree.children_left[node]])
+            value.append(tree.value[node, 0])
+        roots.append(offset)
+        offset += len(order)
+    return {
+        'feature': np.array(feature, dtype=np.intp),
+        'threshold': np.array(threshold, dtype=np.float64),
+        'left': np.array(left, dtype=np.intp),
+        'value': np.array(value, dtype=np.float64),
+        'roots': np.array(roots, dtype=np.intp)
+    }
+
+
+def _float_order(values):
+    """float64 values as unsigned integers in the same order"""
+    bits = values.view(np.uint64)
+    return np.where(bits >> np.uint64(63), ~bits, bits | np.uint64(1 << 63))
+
+
+def _from_float_order(keys):
+    bits = np.where(keys >> np.uint64(63), keys & np.uint64((1 << 63) - 1), ~keys)
+    return bits.view(np.float64)
+
+
+def _raw_thresholds(feature, threshold, mean, scale):
+    """
+    Split thresholds in raw units: for each node the largest raw value x
+    whose scaled value float32((x - mean) / scale), as the scaler and trees
+    compute it, is <= the threshold. Scaling and rounding are monotonic, so
+    x <= raw threshold routes every input exactly like the scaled split;
+    the boundary is found by bisection over the ordered float64 values.
+    """
+    split = np.isfinite(threshold)
+    feature, threshold = feature[split], threshold[split]
+    mean, scale = mean[feature], scale[feature]
+    low = _float_order(np.full(len(feature), -np.inf))
+    high = _float_order(np.full(len(feature), np.inf))
+    while (high - low > 1).any():
+        middle = low + (high - low) // np.uint64(2)
+        with np.errstate(over='ignore'):
+            below = ((_from_float_order(middle) - mean) / scale).astype(np.float32) <= threshold
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+    raw = np.full(len(split), np.inf)
+    raw[split] = _from_float_order(low)
+    return raw
+
+
+def compile_ensemble(rf_model, gb_model, nn_model, scaler=None, **info):
+    """
+    CompiledEnsemble of fitted RandomForestClassifier,
+    GradientBoostingClassifier (multiclass, default init) and MLPClassifier
+    models trained on the same classes; info (e.g. trained_date) is kept in
+    the manifest. With the fitted StandardScaler the models were trained
+    behind, the scaling is folded into the tree thresholds and the MLP's
+    first layer and the result takes raw inputs.
+    """
+    classes = np.asarray(rf_model.classes_)
+    for model in (gb_model, nn_model):
+        if not np.array_equal(model.classes_, classes):
+            raise ValueError('Models were trained on different classes')
+    if len(classes) < 3:
+        raise ValueError('compile_ensemble supports multiclass models (3 or more classes)')
+    if nn_model.out_activation_ != 'softmax' or nn_model.activation not in _ACTIVATIONS:
+        raise ValueError(f'Unsupported MLP activation {nn_model.activation!r}')
+    n_features = int(rf_model.n_features_in_)
+    if scaler is not None:
+        mean = np.zeros(n_features) if scaler.mean_ is None else np.asarray(scaler.mean_, dtype=np.float64)
+        scale = np.ones(n_features) if scaler.scale_ is None else np.asarray(scaler.scale_, dtype=np.float64)
+
+    arrays = {}
+    rf = _flatten_trees(rf_model.estimators_)
+    # A tree's class probabilities are its leaf's class fractions
+    rf['value'] /= rf['value'].sum(axis=1, keepdims=True)
+    if scaler is not None:
+        rf['threshold'] = _raw_thresholds(rf['feature'], rf['threshold'], mean, scale)
+    arrays.update({f'rf_{name}': array for name, array in rf.items()})
+
+    # Trees are stored stage by stage, one per class; leaf values are
+    # scaled by the learning rate as in sklearn's predict_stages
+    gb = _flatten_trees(gb_model.estimators_.ravel())
+    gb['value'] = gb['value'][:, 0] * gb_model.learning_rate
+    if scaler is not None:
+        gb['threshold'] = _raw_thresholds(gb['feature'], gb['threshold'], mean, scale)
+    arrays.update({f'gb_{name}': array for name, array in gb.items()})
+    # Raw predictions of the init estimator (class log-priors) do not depend on the input
+    arrays['gb_init'] = gb_model._raw_predict_init(np.zeros((1, n_features)))[0]
+
+    for layer, (coef, intercept) in enumerate(zip(nn_model.coefs_, nn_model.intercepts_)):
+        arrays[f'nn_coef_{layer}'] = np.asarray(coef, dtype=np.float64)
+        arrays[f'nn_intercept_{layer}'] = np.asarray(intercept, dtype=np.float64)
+    if scaler is not None:
+        # ((x - mean) / scale) @ W + b == x @ (W / scale) + (b - (mean / scale) @ W)
+        coef = arrays['nn_coef_0']
+        arrays['nn_intercept_0'] = arrays['nn_intercept_0'] - (mean / scale) @ coef
+        arrays['nn_coef_0'] = coef / scale[:, None]
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'classes': classes.tolist(),
+        'n_features': n_features,
+        'inputs': 'scaled' if scaler is None else 'raw',
+        'rf': {'trees': len(rf_model.estimators_),
+               'depth': max(tree.tree_.max_depth for tree in rf_model.estimators_)},
+        'gb': {'stages': gb_model.estimators_.shape[0],
+               'depth': max(tree.tree_.max_depth for tree in gb_model.estimators_.ravel())},
+        'nn': {'layers': len(nn_model.coefs_), 'activation': nn_model.activation},
+        **info
+    }
+    return CompiledEnsemble(manifest, arrays)
+
+
+class CompiledEnsemble:
+    """
+    Class probabilities of the three ensemble models from flattened arrays.
+    Matches sklearn's predict_proba to about 1e-15 (tree inputs are rounded
+    to float32 as sklearn does). Inputs are scaled features, or raw
+    readings when raw_inputs is set (the scaler was folded in), and must be
+    finite: sklearn's scaler rejects infinite values and its trees route
+    NaN differently.
+    """
+
+    def __init__(self, manifest, arrays):
+        self.manifest = manifest
+        self.arrays = arrays
+        self.classes = np.array(manifest['classes'])
+        self.n_features = manifest['n_features']
+        self.raw_inputs = manifest.get('inputs') == 'raw'
+
+    def predict_proba(self, X):
+        """(rf, gb, nn) class probabilities, each of shape (n_samples, n_classes)"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f'Expected an array of shape (n_samples, {self.n_features}), got {X.shape}')
+        if not np.isfinite(X).all():
+            raise ValueError('Input contains NaN or infinity')
+        if self.raw_inputs:
+            # Folded thresholds already account for the float32 rounding
+            return self._random_forest(X), self._gradient_boosting(X), self._neural_network(X)
+        # sklearn's trees compare float32 inputs against float64 thresholds
+        X32 = X.astype(np.float32).astype(np.float64)
+        return self._random_forest(X32), self._gradient_boosting(X32), self._neural_network(X)
+
+    def _tree_sums(self, X, prefix):
+        """
+        Per-class sums of the values of the leaves each sample reaches,
+        shape (n_samples, n_classes). Leaf values are either class vectors
+        (one per node) or scalars of trees ordered class by class within
+        each stage. The trees are traversed together, a block of samples at
+        a time.
+        """
+        a = self.arrays
+        feature, threshold, left = a[f'{prefix}_feature'], a[f'{prefix}_threshold'], a[f'{prefix}_left']
+        roots, value = a[f'{prefix}_roots'], a[f'{prefix}_value']
+        depth = self.manifest[prefix]['depth']
+        n_samples, n_features = X.shape
+        n_trees = len(roots)
+        n_classes = len(self.classes)
+        sums = np.empty((n_samples, n_classes))
+        block = max(1, TRAVERSAL_BLOCK // n_trees)
+        for start in range(0, n_samples, block):
+            rows = X[start:start + block]
+            flat = rows.ravel()
+            offsets = (np.arange(len(rows)) * n_features)[:, None]
+            node = np.broadcast_to(roots, (len(rows), n_trees))
+            for _ in range(depth):
+                node = left[node] + (flat[offsets + feature[node]] > threshold[node])
+            sums[start:start + block] = value[node].reshape(len(rows), -1, n_classes).sum(axis=1)
+        return sums
+
+    def _random_forest(self, X):
+        return self._tree_sums(X, 'rf') / len(self.arrays['rf_roots'])
+
+    def _gradient_boosting(self, X):
+        return _softmax(self.arrays['gb_init'] + self._tree_sums(X, 'gb'))
+
+    def _neural_network(self, X):
+        activation = _ACTIVATIONS[self.manifest['nn']['activation']]
+        layers = self.manifest['nn']['layers']
+        for layer in range(layers):
+            X = X @ self.arrays[f'nn_coef_{layer}'] + self.arrays[f'nn_intercept_{layer}']
+            if layer < layers - 1:
+                X = activation(X)
+        return _softmax(X)
+
+    def save(self, directory):
+        """
+        One .npy file per array and the manifest, written last. Every file
+        is written under a temporary name and renamed over the old one, so
+        processes that memory-mapped the previous files keep reading them.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self.arrays.items():
+            _replace(os.path.join(directory, f'{name}.npy'), lambda f: np.save(f, array), 'wb')
+        manifest = {**self.manifest, 'arrays': sorted(self.arrays)}
+        _replace(os.path.join(directory, MANIFEST), lambda f: json.dump(manifest, f, indent=2), 'w')
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        """
+        Read a saved ensemble; with mmap_mode='r' the arrays are read-only
+        memory maps, whose pages every process loading the same files shares
+        """
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f'Unsupported compiled model format {manifest.get("format_version")!r}')
+        # Plain ndarray views of the maps avoid np.memmap's per-operation overhead
+        arrays = {name: np.asarray(np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+                  for name in manifest.pop('arrays')}
+        return cls(manifest, arrays)
+
+
+def _replace(path, write, mode):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+        write(f)
+    os.replace(temporary, path)
+
+
+def _softmax(raw):
+    exp = np.exp(raw - raw.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
@@ -3,20 +3,140 @@ Flask API for Dam Physical Condition Analysis
 Provides endpoints for analyzing dam images
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import base64
 import io
+import json
+import threading
+import time
 from PIL import Image
+import os
+import tempfile
 import traceback
 import numpy as np
+from change_detection import ChangeDetectionAnalyzer, InspectionStore
 from dam_condition_analyzer import DamConditionAnalyzer
+from result_cache import AnalysisResultCache
+from analysis_pool import AnalysisPool
+from analysis_jobs import JobManager, JobStore
+from metrics import MetricsRegistry
+from video_analyzer import (DEFAULT_MAX_GAP, DEFAULT_THRESHOLD, FrameSequenceSource, VideoDamAnalyzer,
+                            VideoFrameSource)
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize analyzer
-analyzer = DamConditionAnalyzer()
+# Per-stage latency histograms, exposed at /metrics
+metrics = MetricsRegistry()
+
+# Initialize analyzer with a result cache so duplicate uploads are not re-analyzed
+result_cache = AnalysisResultCache(
+    max_entries=int(os.environ.get('DAM_CACHE_MAX_ENTRIES', 256)),
+    ttl_seconds=int(os.environ.get('DAM_CACHE_TTL_SECONDS', 3600)),
+    disk_dir=os.environ.get('DAM_CACHE_DIR') or None
+)
+# DAM_ANALYSIS_PRECISION=float32 trades float64 gradient maps for int16/float32;
+# DAM_PARALLEL_DETECTORS=1 runs the detectors of one image concurrently;
+# DAM_VALIDATION_THUMBNAIL_SIDE=0 validates every upload at full resolution only
+analyzer = DamConditionAnalyzer(result_cache=result_cache, metrics=metrics,
+                                precision=os.environ.get('DAM_ANALYSIS_PRECISION', 'float64'),
+                                parallel_detectors=os.environ.get('DAM_PARALLEL_DETECTORS', '').lower()
+                                in ('1', 'true', 'yes'),
+                                validation_thumbnail_side=int(os.environ.get('DAM_VALIDATION_THUMBNAIL_SIDE', 384))
+                                or None)
+
+# Worker processes for /batch-analyze; 0 or 1 (the default) analyzes in the
+# request thread. Every API process starts its own pool, so size it for the
+# number of API processes sharing the host
+ANALYSIS_WORKERS = int(os.environ.get('DAM_ANALYSIS_WORKERS', 0))
+analysis_pool = AnalysisPool(analyzer, workers=ANALYSIS_WORKERS) if ANALYSIS_WORKERS > 1 else None
+
+# Asynchronous jobs; the manager is started by create_app() or on first use
+JOBS_DB = os.environ.get('DAM_JOBS_DB',
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analysis_jobs.db'))
+JOB_WORKERS = int(os.environ.get('DAM_JOB_WORKERS', 2))
+job_manager = None
+_job_manager_lock = threading.Lock()
+
+# Incremental analysis against each dam's last inspection (?incremental=1)
+INSPECTIONS_DIR = os.environ.get('DAM_INSPECTIONS_DIR',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inspections'))
+change_analyzer = None
+_change_analyzer_lock = threading.Lock()
+
+# Always attach per-stage timings to responses (otherwise only with ?debug=1)
+DEBUG_TIMINGS = os.environ.get('DAM_DEBUG_TIMINGS', '').lower() in ('1', 'true', 'yes')
+
+METADATA_FIELDS = ('dam_name', 'location', 'dam_type', 'construction_year', 'analysis_max_side', 'detectors',
+                   'incremental')
+
+
+def _form_value(name, value):
+    """Convert numeric multipart/query fields to int (JSON already carries numbers)"""
+    if name in ('construction_year', 'analysis_max_side') and isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+
+def _uploaded_images():
+    """
+    Images sent with the request, as a list of dicts with an 'image' payload
+    and optional metadata fields.
+
+    - application/json: base64 strings, {"image": ...} or {"images": [...]}
+    - multipart/form-data: files under 'image' or 'images', metadata in form
+      fields (repeat a field once per file for batches)
+    - image/* or application/octet-stream: one raw encoded image, metadata
+      in the query string
+
+    Binary payloads are handed to the analyzer as memoryviews of the request
+    bytes and decoded directly into a numpy array, skipping base64 entirely.
+    Returns None when the body carries no images.
+    """
+    mimetype = request.mimetype
+
+    if mimetype == 'multipart/form-data':
+        files = request.files.getlist('images') or request.files.getlist('image')
+        items = []
+        for idx, upload in enumerate(files):
+            item = {'image': memoryview(upload.stream.read())}
+            for name in METADATA_FIELDS:
+                values = request.form.getlist(name)
+                if idx < len(values):
+                    item[name] = _form_value(name, values[idx])
+                elif len(values) == 1:
+                    item[name] = _form_value(name, values[0])
+            items.append(item)
+        return items or None
+
+    if mimetype.startswith('image/') or mimetype == 'application/octet-stream':
+        body = request.get_data(cache=False)
+        if not body:
+            return None
+        item = {'image': memoryview(body)}
+        for name in METADATA_FIELDS:
+            if name in request.args:
+                item[name] = _form_value(name, request.args[name])
+        return [item]
+
+    data = request.get_json(silent=True)
+    if not data:
+        return None
+    if 'images' in data:
+        return data['images']
+    if 'image' in data:
+        return [data]
+    return None
+
+
+def _parse_analysis_max_side(value):
+    """Validate the optional analysis_max_side option; returns (value, error)"""
+    if value is None:
+        return None, None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 64:
+        return None, 'analysis_max_side must be an integer >= 64'
+    return value, None
 
 @app.route('/', methods=['GET'])
 def health():
@@ -38,23 +158,59 @@ def analyze_dam():
         "dam_name": "Dam Name",
         "location": "Location",
         "dam_type": "Concrete/Earthen/Arch",
-        "construction_year": 2000
+        "construction_year": 2000,
+        "analysis_max_side": 2048,       (optional, caps detection resolution)
+        "detectors": ["cracks", "moisture"],  (optional, run only these)
+        "incremental": true              (optional, see below)
     }
+
+    The image may instead be sent as multipart/form-data (file field
+    'image', metadata as form fields) or as a raw image/* body (metadata
+    in the query string).
+
+    With ?debug=1 the response includes a 'timings' block (milliseconds
+    per stage) and a Server-Timing header that also covers serialization.
+
+    With incremental (JSON true, or 1/true/yes as a form or query value) the
+    image is compared with the last inspection of the same dam_name and only
+    the changed grid cells are re-analyzed; the report adds
+    'change_detection' and a 'delta' against the previous inspection.
     """
     try:
-        data = request.get_json()
+        uploads = _uploaded_images()
         
-        if not data or 'image' not in data:
+        if not uploads:
             return jsonify({'error': 'No image data provided'}), 400
+        data = uploads[0]
         
         # Extract metadata
         dam_name = data.get('dam_name', 'Unknown')
         location = data.get('location', 'Unknown')
         dam_type = data.get('dam_type', 'Concrete')
         construction_year = data.get('construction_year')
+
+        analysis_max_side, error = _parse_analysis_max_side(data.get('analysis_max_side'))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Detector subset: a JSON list or a comma-separated form/query value
+        detectors = data.get('detectors')
+        try:
+            detectors = analyzer.select_detectors(detectors) if detectors else None
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
         
         # Analyze image
-        result = analyzer.analyze_image(data['image'])
+        debug = _debug_timings()
+        if _flag(data.get('incremental')):
+            if 'dam_name' not in data:
+                return jsonify({'error': 'incremental analysis requires dam_name'}), 400
+            if detectors or analysis_max_side:
+                return jsonify({'error': 'incremental analysis runs every detector at full resolution'}), 400
+            result = _get_change_analyzer().analyze(dam_name, data['image'], include_timings=debug)
+        else:
+            result = analyzer.analyze_image(data['image'], analysis_max_side=analysis_max_side,
+                                            include_timings=debug, detectors=detectors)
         
         if result.get('status') == 'error':
             return jsonify({'error': result.get('message', 'Analysis failed')}), 400
@@ -81,8 +237,14 @@ def analyze_dam():
                 return force_serializable(obj.tolist())
             return obj
 
+        start = time.perf_counter()
         serializable_result = force_serializable(result)
-        return jsonify(serializable_result), 200
+        response = jsonify(serializable_result)
+        serialization = time.perf_counter() - start
+        metrics.observe('serialization', serialization)
+        if debug:
+            _add_server_timing(response, result['timings'], serialization)
+        return response, 200
     
     except Exception as e:
         print(f"Error in analyze_dam: {str(e)}")
@@ -92,6 +254,105 @@ def analyze_dam():
             'message': str(e)
         }), 500
 
+def _flag(value):
+    """Boolean request field: JSON true or 1/true/yes as a string"""
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def _get_change_analyzer():
+    global change_analyzer
+    with _change_analyzer_lock:
+        if change_analyzer is None:
+            change_analyzer = ChangeDetectionAnalyzer(analyzer, InspectionStore(INSPECTIONS_DIR))
+        return change_analyzer
+
+def _debug_timings():
+    return DEBUG_TIMINGS or request.args.get('debug', '').lower() in ('1', 'true', 'yes')
+
+def _add_server_timing(response, timings, serialization):
+    """Expose stage timings (milliseconds) in a Server-Timing header"""
+    stages = dict(timings, serialization=round(serialization * 1000, 3))
+    response.headers['Server-Timing'] = ', '.join(f'{name};dur={ms}' for name, ms in stages.items())
+
+def _analyze_batch(images, ordered=True, include_timings=False):
+    """
+    (index, result) for every uploaded image, in input order or, with
+    ordered=False, in completion order
+    """
+    # Entries without an image fail on their own, not the whole batch
+    rejected = {}
+    for idx, img_data in enumerate(images):
+        if not isinstance(img_data, dict):
+            rejected[idx] = {'status': 'error', 'message': 'Image entry must be an object', 'error_type': 'ValueError'}
+        elif img_data.get('image') is None:
+            rejected[idx] = {'status': 'error', 'message': 'No image data provided', 'error_type': 'ValueError'}
+    present = [idx for idx in range(len(images)) if idx not in rejected]
+
+    if analysis_pool is not None and len(present) > 1:
+        run = analysis_pool.imap if ordered else analysis_pool.imap_unordered
+        analyzed = ((present[pos], result) for pos, result
+                    in run([images[idx]['image'] for idx in present], include_timings=include_timings))
+    else:
+        analyzed = ((idx, analyzer.analyze_image(images[idx]['image'], include_timings=include_timings))
+                    for idx in present)
+
+    if not ordered:
+        yield from rejected.items()
+        yield from analyzed
+        return
+
+    for idx in range(len(images)):
+        yield (idx, rejected[idx]) if idx in rejected else next(analyzed)
+
+
+def _batch_entry(idx, img_data, result):
+    """Attach dam metadata to a result, or turn a failure into an error entry"""
+    if not isinstance(img_data, dict):
+        img_data = {}
+    dam_name = img_data.get('dam_name', f'Dam_{idx}')
+    if result['status'] == 'error':
+        return False, {'dam_name': dam_name, 'error': result.get('message', 'Unknown error')}
+    result['dam_metadata'] = {
+        'name': dam_name,
+        'location': img_data.get('location', 'Unknown'),
+        'type': img_data.get('dam_type', 'Concrete'),
+        'construction_year': img_data.get('construction_year')
+    }
+    return True, result
+
+
+def _wants_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+
+def _stream_batch(images, include_timings=False):
+    """One NDJSON line per image as it finishes, then a summary line"""
+    successful = failed = 0
+    try:
+        for idx, result in _analyze_batch(images, ordered=False, include_timings=include_timings):
+            ok, entry = _batch_entry(idx, images[idx], result)
+            if ok:
+                successful += 1
+            else:
+                failed += 1
+                entry['status'] = 'error'
+            yield json.dumps({'index': idx, **entry}) + '\n'
+    except Exception as e:
+        print(f"Error in batch_analyze stream: {str(e)}")
+        traceback.print_exc()
+        yield json.dumps({'status': 'error', 'error': 'Batch analysis failed', 'message': str(e)}) + '\n'
+        return
+    yield json.dumps({
+        'status': 'completed',
+        'total': len(images),
+        'successful': successful,
+        'failed': failed
+    }) + '\n'
+
 @app.route('/batch-analyze', methods=['POST'])
 def batch_analyze():
     """
@@ -107,53 +368,44 @@ def batch_analyze():
             ...
         ]
     }
+
+    Images may instead be sent as multipart/form-data, one file per
+    'images' field, with metadata fields repeated in the same order.
+
+    With ?stream=1 or "Accept: application/x-ndjson" the response is
+    newline-delimited JSON: one line per image as soon as it is analyzed
+    (with its "index" in the request), then a summary line with the
+    status, total, successful and failed counts. ?debug=1 adds a
+    'timings' block to every result.
     """
     try:
-        data = request.get_json()
+        images = _uploaded_images()
         
-        if not data or 'images' not in data:
+        if not images:
             return jsonify({'error': 'No image data provided'}), 400
         
+        if _wants_stream():
+            return Response(stream_with_context(_stream_batch(images, _debug_timings())),
+                            mimetype='application/x-ndjson')
+        
         results = []
         errors = []
         
-        for idx, img_data in enumerate(data['images']):
-            try:
-                dam_name = img_data.get('dam_name', f'Dam_{idx}')
-                location = img_data.get('location', 'Unknown')
-                dam_type = img_data.get('dam_type', 'Concrete')
-                construction_year = img_data.get('construction_year')
-                
-                result = analyzer.analyze_image(img_data['image'])
-                
-                if result['status'] != 'error':
-                    result['dam_metadata'] = {
-                        'name': dam_name,
-                        'location': location,
-                        'type': dam_type,
-                        'construction_year': construction_year
-                    }
-                    results.append(result)
-                else:
-                    errors.append({
-                        'dam_name': dam_name,
-                        'error': result.get('message', 'Unknown error')
-                    })
-            
-            except Exception as e:
-                errors.append({
-                    'dam_name': img_data.get('dam_name', f'Dam_{idx}'),
-                    'error': str(e)
-                })
+        for idx, result in _analyze_batch(images, include_timings=_debug_timings()):
+            ok, entry = _batch_entry(idx, images[idx], result)
+            (results if ok else errors).append(entry)
         
-        return jsonify({
+        start = time.perf_counter()
+        response = jsonify({
             'status': 'completed',
-            'total': len(data['images']),
+            'total': len(images),
             'successful': len(results),
             'failed': len(errors),
             'results': results,
             'errors': errors if errors else None
-        }), 200
+        })
+        metrics.observe('serialization', time.perf_counter() - start)
+        return response, 200
     
     except Exception as e:
         print(f"Error in batch_analyze: {str(e)}")
@@ -163,6 +415,215 @@ def batch_analyze():
             'message': str(e)
         }), 500
 
+def _video_source():
+    """
+    Frame source of an /analyze-video request and the temporary file to
+    remove afterwards; (None, None) when the body carries no video.
+    OpenCV reads videos from a path, so uploads are spooled to disk.
+    """
+    sample_every = int(request.values.get('sample_every', 1))
+    if request.mimetype == 'multipart/form-data':
+        frames = request.files.getlist('frames')
+        if frames:
+            fps = float(request.values.get('fps', 1.0))
+            return FrameSequenceSource([memoryview(f.stream.read()) for f in frames], fps=fps,
+                                       sample_every=sample_every), None
+        upload = request.files.get('video')
+        if upload is None:
+            return None, None
+        stream, suffix = upload.stream, os.path.splitext(upload.filename or '')[1]
+    elif request.mimetype.startswith('video/') or request.mimetype == 'application/octet-stream':
+        stream, suffix = request.stream, ''
+    else:
+        return None, None
+
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spool:
+        while True:
+            chunk = stream.read(1 << 20)
+            if not chunk:
+                break
+            spool.write(chunk)
+    if os.path.getsize(spool.name) == 0:
+        os.unlink(spool.name)
+        return None, None
+    return VideoFrameSource(spool.name, sample_every=sample_every), spool.name
+
+@app.route('/analyze-video', methods=['POST'])
+def analyze_video():
+    """
+    Analyze a drone video or a frame sequence
+
+    Send the video as multipart/form-data (file field 'video') or as a raw
+    video/* body, or send the frames as multipart files under 'frames'.
+    Options (form fields or query string):
+        threshold      mean gray-level difference that makes a keyframe
+        max_gap        seconds after which a frame is analyzed regardless
+        sample_every   only consider every n-th frame
+        fps            frame rate of a 'frames' sequence (default 1)
+        detectors      comma-separated detector subset
+
+    Only keyframes are analyzed. The response is a condition timeline (one
+    entry per keyframe) with a summary and throughput in frames per second.
+    With ?stream=1 or "Accept: application/x-ndjson" every keyframe entry is
+    sent as an NDJSON line once analyzed, then the summary line.
+    """
+    spool = None
+    try:
+        try:
+            source, spool = _video_source()
+            video = VideoDamAnalyzer(analyzer,
+                                     threshold=float(request.values.get('threshold', DEFAULT_THRESHOLD)),
+                                     max_gap=float(request.values.get('max_gap', DEFAULT_MAX_GAP)))
+            detectors = request.values.get('detectors')
+            detectors = analyzer.select_detectors(detectors) if detectors else None
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        if source is None:
+            return jsonify({'error': 'No video or frames provided'}), 400
+
+        if _wants_stream():
+            def lines(spool):
+                try:
+                    for entry in video.stream(source, detectors):
+                        yield json.dumps(entry) + '\n'
+                except Exception as e:
+                    print(f"Error in analyze_video stream: {str(e)}")
+                    traceback.print_exc()
+                    yield json.dumps({'status': 'error', 'error': 'Video analysis failed', 'message': str(e)}) + '\n'
+                finally:
+                    if spool:
+                        os.unlink(spool)
+            response = Response(stream_with_context(lines(spool)), mimetype='application/x-ndjson')
+            spool = None
+            return response
+
+        report = video.analyze(source, detectors)
+        return jsonify(report), 200
+
+    except ValueError as e:
+        # Unreadable video
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in analyze_video: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Video analysis failed',
+            'message': str(e)
+        }), 500
+    finally:
+        if spool:
+            os.unlink(spool)
+
+def _get_job_manager():
+    """Create the job manager, resuming jobs left unfinished by the last run"""
+    global job_manager
+    with _job_manager_lock:
+        if job_manager is None:
+            job_manager = JobManager(analyzer, JobStore(JOBS_DB), workers=JOB_WORKERS, pool=analysis_pool)
+        return job_manager
+
+def create_app():
+    """
+    The Flask app, with the job manager started so that unfinished jobs
+    resume without waiting for a /jobs request. WSGI servers should load
+    the app through this, e.g. gunicorn 'dam_analysis_api:create_app()'
+    """
+    _get_job_manager()
+    return app
+
+def _job_response(job):
+    """Job progress, plus results and errors once it has finished"""
+    response = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'total': job['total'],
+        'completed': job['completed'],
+        'successful': job['completed'] - job['failed'],
+        'failed': job['failed']
+    }
+    if job['message']:
+        response['message'] = job['message']
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a batch for background analysis
+    
+    Accepts the same JSON or multipart bodies as /batch-analyze and returns
+    a job id immediately (202). Poll GET /jobs/<id> or stream
+    GET /jobs/<id>/events for progress.
+    """
+    try:
+        images = _uploaded_images()
+        
+        if not images:
+            return jsonify({'error': 'No image data provided'}), 400
+        
+        job_id = _get_job_manager().submit(images)
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'total': len(images),
+            'status_url': f'/jobs/{job_id}',
+            'events_url': f'/jobs/{job_id}/events'
+        }), 202
+    
+    except Exception as e:
+        print(f"Error in submit_job: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Job submission failed',
+            'message': str(e)
+        }), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status; finished jobs include results and errors like /batch-analyze"""
+    manager = _get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = _job_response(job)
+    if job['status'] == 'completed':
+        results = []
+        errors = []
+        for idx, metadata, result in manager.results(job_id):
+            ok, entry = _batch_entry(idx, metadata, result)
+            (results if ok else errors).append(entry)
+        response['results'] = results
+        response['errors'] = errors if errors else None
+    return jsonify(response), 200
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    """NDJSON progress lines until the job completes or fails"""
+    manager = _get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def events(job):
+        yield json.dumps(_job_response(job)) + '\n'
+        while job['status'] in ('queued', 'running'):
+            current = manager.wait_for_change(job_id, job, timeout=15)
+            if current != job:
+                yield json.dumps(_job_response(current)) + '\n'
+            job = current
+    
+    return Response(stream_with_context(events(job)), mimetype='application/x-ndjson')
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Per-stage latency histograms in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Result cache hit/miss counters"""
+    return jsonify(result_cache.stats()), 200
+
 @app.route('/condition-levels', methods=['GET'])
 def get_condition_levels():
     """Get condition level definitions"""
@@ -184,31 +645,37 @@ def get_analysis_factors():
         'factors': [
             {
                 'name': 'Cracks',
+                'detector': 'cracks',
                 'description': 'Surface and structural cracks',
                 'severity_levels': ['None', 'Minor', 'Moderate', 'Severe']
             },
             {
                 'name': 'Surface Wear',
+                'detector': 'surface_wear',
                 'description': 'Material degradation and weathering',
                 'severity_levels': ['None', 'Minor', 'Moderate', 'Severe']
             },
             {
                 'name': 'Moisture/Seepage',
+                'detector': 'moisture',
                 'description': 'Water infiltration and moisture buildup',
                 'levels': ['Low', 'Medium', 'High']
             },
             {
                 'name': 'Algae Growth',
+                'detector': 'algae_growth',
                 'description': 'Biological growth on surface',
                 'metric': 'Coverage percentage'
             },
             {
                 'name': 'Structural Damage',
+                'detector': 'structural_damage',
                 'description': 'Major structural defects and damage',
                 'severity_levels': ['None', 'Minor', 'Moderate', 'Severe']
             },
             {
                 'name': 'Erosion',
+                'detector': 'erosion',
                 'description': 'Surface erosion and material loss',
                 'severity_levels': ['None', 'Minor', 'Moderate', 'Severe']
             }
@@ -271,9 +738,19 @@ if __name__ == '__main__':
     print("  GET  /                    - API information")
     print("  POST /analyze-dam         - Analyze single dam image")
     print("  POST /batch-analyze       - Analyze multiple dam images")
+    print("  POST /analyze-video       - Condition timeline of a drone video")
+    print("  POST /jobs                - Queue a batch for background analysis")
+    print("  GET  /jobs/<id>           - Job status and results")
+    print("  GET  /jobs/<id>/events    - Stream job progress (NDJSON)")
+    print("  GET  /metrics             - Per-stage latency histograms (Prometheus)")
+    print("  GET  /cache/stats         - Result cache hit/miss counters")
     print("  GET  /condition-levels    - Get condition level definitions")
     print("  GET  /analysis-factors    - Get analysis factors")
     print("  GET  /sample-analysis     - Get sample analysis result")
     print("\n" + "="*60)
     
+    # The debug reloader's watcher process only restarts the serving
+    # process (WERKZEUG_RUN_MAIN), which runs the jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     app.run(debug=True, host='0.0.0.0', port=5002)
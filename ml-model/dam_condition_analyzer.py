@@ -6,14 +6,139 @@ Analyzes dam photos to assess structural condition
 import cv2
 import numpy as np
 from PIL import Image
-import io
 import base64
+import bisect
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from image_context import PRECISIONS, ImageContext, pyramid_downscale, stride_thumbnail
+from image_decoder import decode_image, decode_thumbnail, normalize_pil, read_header
+from metrics import StageTimer
+
+# Bump whenever a change alters any report (detectors, thresholds, scoring,
+# validation): with the settings, it forms the analyzer fingerprint that
+# keys cached results and bulk analysis checkpoints
+ANALYZER_VERSION = '1.1.0'
+
+# Detector names, in report order, and the methods that implement them
+DETECTORS = {
+    'cracks': '_detect_cracks',
+    'surface_wear': '_assess_surface_wear',
+    'moisture': '_detect_moisture',
+    'algae_growth': '_detect_algae',
+    'structural_damage': '_detect_structural_damage',
+    'erosion': '_assess_erosion'
+}
+
+# Level ladders (bounds, labels): a value below bounds[i] gets labels[i],
+# a value at or above the last bound gets the last label
+CRACK_SEVERITY = ((1, 3, 7), (None, 'Minor', 'Moderate', 'Severe'))
+SURFACE_WEAR_LEVELS = ((500, 1500, 3000), (None, 'Minor', 'Moderate', 'Severe'))
+MOISTURE_LEVELS = ((5, 15), ('Low', 'Medium', 'High'))
+DAMAGE_SEVERITY = ((1, 3, 6), (None, 'Minor', 'Moderate', 'Severe'))
+EROSION_LEVELS = ((10, 25, 50), (None, 'Minor', 'Moderate', 'Severe'))
+
+# Condition score deductions: (result field, ladder, deduction per label).
+# Algae growth deducts its coverage, at most ALGAE_MAX_DEDUCTION
+SCORE_DEDUCTIONS = {
+    'cracks': ('severity', CRACK_SEVERITY, (0, 10, 25, 40)),
+    'surface_wear': ('level', SURFACE_WEAR_LEVELS, (0, 5, 15, 30)),
+    'moisture': ('level', MOISTURE_LEVELS, (0, 10, 25)),
+    'structural_damage': ('severity', DAMAGE_SEVERITY, (0, 15, 35, 50)),
+    'erosion': ('level', EROSION_LEVELS, (0, 8, 18, 35))
+}
+ALGAE_MAX_DEDUCTION = 20
+
+# Lowest scores of condition levels 3 (Poor) to 0 (Excellent); below the
+# first bound is 4 (Critical)
+CONDITION_BOUNDS = (30, 50, 70, 85)
+
+def grade(value, ladder):
+    """Label of a value on a level ladder"""
+    bounds, labels = ladder
+    return labels[bisect.bisect_right(bounds, value)]
+
+def grade_indices(values, ladder):
+    """Vectorized grade: label indices of an array of values"""
+    return np.searchsorted(ladder[0], values, side='right')
+
+# Rejection thresholds of _validate_dam_image at full resolution
+VALIDATION_LIMITS = {
+    'min_contrast': 10,             # gray level standard deviation
+    'max_saturation': 180,          # mean HSV saturation
+    'max_green_ratio': 0.15,        # vegetation hues
+    'max_light_ratio': 0.20,        # very bright pixels, with saturation
+    'document_saturation': 100,     # below this: a document
+    'min_edge_density': 0.005,
+    'max_laplacian_variance': 40000,
+    'max_edge_density': 0.35
+}
+
+# Thresholds for the thumbnail pass, which only rejects. A JPEG thumbnail
+# is decoded at 1/2-1/8 scale, which averages pixels: contrast and
+# saturation drop, so rejections keep a margin towards the full-resolution
+# verdict. Fine texture and noise do not survive averaging, so the edge
+# and noise checks (None) are left to the full-resolution pass.
+THUMBNAIL_LIMITS = {
+    'min_contrast': 5,
+    'max_saturation': 190,
+    'max_green_ratio': 0.16,
+    'max_light_ratio': 0.22,
+    'document_saturation': 90,
+    'min_edge_density': None,
+    'max_laplacian_variance': None,
+    'max_edge_density': None
+}
+
+# Threads shared by all analyzers in the process for parallel detectors
+_detector_executor = None
+_detector_executor_lock = threading.Lock()
+
+def _get_detector_executor():
+    global _detector_executor
+    with _detector_executor_lock:
+        if _detector_executor is None:
+            # More threads than detectors (six) or cores cannot help
+            workers = min(6, os.cpu_count() or 1)
+            _detector_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dam-detector')
+        return _detector_executor
+
+def analysis_outcome(result):
+    """Metrics label for an analysis result"""
+    if result['status'] == 'success':
+        return 'success'
+    return 'rejected' if result.get('error_type') == 'ValidationError' else 'error'
 
 class DamConditionAnalyzer:
     """Analyze dam physical condition from images"""
     
-    def __init__(self):
+    def __init__(self, analysis_max_side=None, min_region_area=None, result_cache=None, metrics=None,
+                 precision='float64', parallel_detectors=False, validation_thumbnail_side=384):
+        # Longest image side used for detection; None analyzes at native resolution
+        self.analysis_max_side = analysis_max_side
+        # Smallest region (in original-resolution pixels) counted by the moisture
+        # and structural damage detectors; None counts every connected component
+        self.min_region_area = min_region_area
+        # Optional result_cache.AnalysisResultCache consulted before analysis
+        self.result_cache = result_cache
+        # Optional metrics.MetricsRegistry that receives per-stage timings
+        self.metrics = metrics
+        # 'float64' (reference) or 'float32': int16 Laplacian and strip-wise
+        # float32 gradients, see image_context.ImageContext
+        if precision not in PRECISIONS:
+            raise ValueError(f'Unknown precision {precision!r}; expected one of {PRECISIONS}')
+        self.precision = precision
+        # Run the six detectors of one image concurrently on a shared thread
+        # pool; OpenCV releases the GIL, so single-image latency drops on
+        # multi-core hosts
+        self.parallel_detectors = parallel_detectors
+        # Validate a thumbnail about this size first and reject without
+        # decoding or scanning the full image when it fails; images that
+        # pass are validated again at full resolution. None disables it
+        self.validation_thumbnail_side = validation_thumbnail_side
+        self._fingerprint = None
         self.condition_levels = {
             0: {'label': 'Excellent', 'risk': 'Low', 'color': 'green'},
             1: {'label': 'Good', 'risk': 'Low', 'color': 'lightgreen'},
@@ -22,332 +147,537 @@ class DamConditionAnalyzer:
             4: {'label': 'Critical', 'risk': 'Critical', 'color': 'red'}
         }
     
-    def analyze_image(self, image_data):
+    def analyze_image(self, image_data, analysis_max_side=None, include_timings=False, detectors=None):
         """
         Analyze dam image for physical condition
         Returns condition assessment with details
+
+        image_data may be a base64 string (optionally a data URI), encoded
+        image bytes (bytes, bytearray or memoryview), a PIL image or an RGB
+        numpy array.
+
+        analysis_max_side caps the longest side of the image the detectors
+        run on (defaults to the analyzer setting). Larger images are reduced
+        with a Gaussian pyramid after validation.
+
+        With a result cache configured, encoded inputs are looked up by the
+        SHA-256 of their decoded bytes before any image decoding happens.
+
+        Decode, validation, every detector and scoring are timed; timings go
+        to the metrics registry when one is configured, and with
+        include_timings the response gets a 'timings' block in milliseconds.
+
+        detectors limits the analysis to a subset of DETECTORS; only those
+        detectors and the image representations they need are computed.
+        The score then only reflects the requested detectors and the
+        response is marked 'partial'.
+
+        Images more than twice validation_thumbnail_side across are first
+        validated on a thumbnail; JPEG thumbnails are decoded at reduced
+        DCT scale before the full image is decoded.
+
+        Encoded images are decoded by image_decoder: RGB, or 2-D for
+        grayscale sources, with palettes expanded and alpha dropped. Base64
+        decoding and image decoding are timed as separate stages.
         """
+        if analysis_max_side is None:
+            analysis_max_side = self.analysis_max_side
+
+        timer = StageTimer()
         try:
-            # Convert base64 to image
+            detectors = self.select_detectors(detectors)
             if isinstance(image_data, str):
-                image_bytes = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
-                image = Image.open(io.BytesIO(image_bytes))
+                with timer.stage('base64_decode'):
+                    encoded = self._encoded_bytes(image_data)
             else:
-                image = image_data
-            
-            # Convert to numpy array
-            image_array = np.array(image)
+                encoded = self._encoded_bytes(image_data)
+            with timer.stage('cache_lookup'):
+                cache_key, cached = self.lookup_cached_result(encoded, analysis_max_side, detectors)
+            if cached is not None:
+                return self._finish(cached, timer, 'cached', include_timings)
 
-            # --- PRE-VALIDATION: Check if it's likely a dam or relevant structure ---
-            # 1. Aspect Ratio check (optional but dams are usually wider)
-            # 2. Color Profile check (Dams are mostly gray/brown/green)
-            # 3. Roughness/Texture check
-            
-            is_valid, validation_msg = self._validate_dam_image(image_array)
-            if not is_valid:
-                return {
-                    'status': 'error',
-                    'message': validation_msg,
-                    'error_type': 'ValidationError'
-                }
-            
-            # Convert BGR to grayscale if needed
-            if len(image_array.shape) == 3:
-                gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+            header = None
+            thumbnail_checked = False
+            if encoded is not None and self.validation_thumbnail_side:
+                with timer.stage('thumbnail_validation'):
+                    header = read_header(encoded)
+                    thumbnail = self._decode_thumbnail(encoded, header)
+                    rejection = thumbnail is not None and self._validate_thumbnail(thumbnail)
+                if rejection:
+                    self.store_cached_result(cache_key, rejection)
+                    return self._finish(rejection, timer, 'rejected', include_timings)
+                thumbnail_checked = thumbnail is not None
+
+            with timer.stage('decode'):
+                if encoded is not None:
+                    image_array = self._decode_image_bytes(encoded, header)
+                elif isinstance(image_data, Image.Image):
+                    image_array = normalize_pil(image_data)
+                else:
+                    image_array = np.asarray(image_data)
+            result = self._analyze_array(image_array, analysis_max_side, timer, detectors,
+                                         thumbnail_checked=thumbnail_checked)
+            self.store_cached_result(cache_key, result)
+            return self._finish(result, timer, analysis_outcome(result), include_timings)
+        
+        except Exception as e:
+            return self._finish({
+                'status': 'error',
+                'message': str(e),
+                'error_type': type(e).__name__
+            }, timer, 'error', include_timings)
+    
+    def _finish(self, result, timer, outcome, include_timings):
+        """Record stage timings and optionally attach them to the response"""
+        timer.stop()
+        self.record_metrics(timer.timings, outcome)
+        if include_timings:
+            result['timings'] = timer.milliseconds()
+        return result
+    
+    def record_metrics(self, timings, outcome):
+        """Add {stage: seconds} timings and an outcome to the metrics registry"""
+        if self.metrics is not None:
+            self.metrics.observe_all(timings)
+            self.metrics.count_outcome(outcome)
+    
+    def lookup_cached_result(self, image_data, analysis_max_side=None, detectors=None):
+        """
+        Look an encoded input (base64 string or image bytes) up in the result
+        cache. Returns (key, result); key is None when caching does not apply
+        and result is None on a miss.
+        """
+        encoded = self._encoded_bytes(image_data)
+        if self.result_cache is None or encoded is None:
+            return None, None
+        if analysis_max_side is None:
+            analysis_max_side = self.analysis_max_side
+        key = self.result_cache.key(encoded, self.fingerprint, analysis_max_side=analysis_max_side,
+                                    detectors=list(self.select_detectors(detectors)))
+        return key, self.result_cache.get(key)
+    
+    def select_detectors(self, detectors=None):
+        """
+        Validate a detector subset (names from DETECTORS, any order) and
+        return it in report order; None selects every detector
+        """
+        if detectors is None:
+            return tuple(DETECTORS)
+        if isinstance(detectors, str):
+            detectors = [name.strip() for name in detectors.split(',') if name.strip()]
+        unknown = [name for name in detectors if name not in DETECTORS]
+        if unknown or not detectors:
+            raise ValueError(f"Unknown detectors {unknown}; choose from {', '.join(DETECTORS)}"
+                             if unknown else 'At least one detector must be selected')
+        return tuple(name for name in DETECTORS if name in detectors)
+    
+    def store_cached_result(self, key, result):
+        """Cache a result under a key from lookup_cached_result"""
+        # Validation verdicts are as deterministic as full analyses
+        if key is not None and (result['status'] == 'success' or
+                                result.get('error_type') == 'ValidationError'):
+            self.result_cache.put(key, result)
+    
+    def _encoded_bytes(self, image_data):
+        """Encoded image bytes of a base64 string or bytes-like input, else None"""
+        if isinstance(image_data, str):
+            return base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            return image_data
+        return None
+    
+    def _analyze_array(self, image_array, analysis_max_side, timer=None, detectors=None,
+                       thumbnail_checked=False):
+        """
+        Validate and analyze a decoded RGB (or grayscale) image array;
+        thumbnail_checked skips the thumbnail pass when the caller already
+        validated a thumbnail of the same image
+        """
+        # --- PRE-VALIDATION: Check if it's likely a dam or relevant structure ---
+        # 1. Aspect Ratio check (optional but dams are usually wider)
+        # 2. Color Profile check (Dams are mostly gray/brown/green)
+        # 3. Roughness/Texture check
+        
+        # Derived representations (gray, HSV, Laplacian, ...) are shared
+        # between validation and the detectors through one context
+        timer = timer or StageTimer()
+        if self.validation_thumbnail_side and not thumbnail_checked:
+            thumbnail = stride_thumbnail(image_array, self.validation_thumbnail_side)
+            if thumbnail is not image_array:
+                with timer.stage('thumbnail_validation'):
+                    rejection = self._validate_thumbnail(thumbnail)
+                if rejection:
+                    return rejection
+
+        ctx = ImageContext(image_array, precision=self.precision)
+
+        with timer.stage('validation'):
+            is_valid, validation_msg = self._validate_dam_image(ctx)
+        if not is_valid:
+            return self._validation_error(validation_msg)
+
+        if analysis_max_side and max(image_array.shape[:2]) > analysis_max_side:
+            with timer.stage('downscale'):
+                reduced, scale = pyramid_downscale(image_array, analysis_max_side)
+                ctx = ImageContext(reduced, scale=scale, precision=self.precision)
+        
+        # Analyze various aspects; representations only the skipped
+        # detectors need are never computed
+        detectors = {name: getattr(self, DETECTORS[name]) for name in self.select_detectors(detectors)}
+        def run(name, detect):
+            # Shared representations are computed by the first detector
+            # that needs them and counted towards its time
+            with timer.stage(name):
+                return detect(ctx)
+        
+        with timer.stage('detectors'):
+            if self.parallel_detectors:
+                executor = _get_detector_executor()
+                futures = {name: executor.submit(run, name, detect) for name, detect in detectors.items()}
+                results = {name: future.result() for name, future in futures.items()}
             else:
-                gray = image_array
-            
-            # Analyze various aspects
-            results = {
-                'cracks': self._detect_cracks(gray),
-                'surface_wear': self._assess_surface_wear(gray),
-                'moisture': self._detect_moisture(gray),
-                'algae_growth': self._detect_algae(image_array),
-                'structural_damage': self._detect_structural_damage(gray),
-                'erosion': self._assess_erosion(gray)
+                results = {name: run(name, detect) for name, detect in detectors.items()}
+        
+        with timer.stage('scoring'):
+            response = self._build_report(results)
+
+        if ctx.scale < 1:
+            response['analysis_resolution'] = {
+                'width': int(ctx.gray.shape[1]),
+                'height': int(ctx.gray.shape[0]),
+                'scale': float(round(ctx.scale, 4))
             }
-            
-            # Calculate overall condition
+
+        return response
+    
+    @property
+    def fingerprint(self):
+        """
+        Identifies what this analyzer computes: ANALYZER_VERSION and its
+        settings. Cached results are only reused under the same fingerprint.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256(ANALYZER_VERSION.encode('utf-8'))
+            settings = (self.analysis_max_side, self.min_region_area, self.precision, self.validation_thumbnail_side)
+            digest.update(repr(settings).encode('utf-8'))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+    
+    def _decode_image_bytes(self, image_bytes, header=None):
+        """
+        Decode an encoded image (PNG, JPEG, WebP, ...) straight from its
+        bytes, see image_decoder.decode_image
+        """
+        return decode_image(image_bytes, header)
+    
+    def _decode_thumbnail(self, image_bytes, header):
+        """
+        Reduced-scale JPEG decode about validation_thumbnail_side across,
+        or None for other formats, small or unreadable images; those are
+        validated on a thumbnail of the decoded array instead
+        """
+        thumbnail = decode_thumbnail(image_bytes, self.validation_thumbnail_side, header)
+        if thumbnail is None:
+            return None
+        return stride_thumbnail(thumbnail, self.validation_thumbnail_side)
+    
+    def _validate_thumbnail(self, thumbnail):
+        """ValidationError result if the thumbnail fails THUMBNAIL_LIMITS, else None"""
+        is_valid, validation_msg = self._validate_dam_image(ImageContext(thumbnail, precision=self.precision),
+                                                            THUMBNAIL_LIMITS)
+        return None if is_valid else self._validation_error(validation_msg)
+    
+    def _validation_error(self, message):
+        return {
+            'status': 'error',
+            'message': message,
+            'error_type': 'ValidationError'
+        }
+    
+    def analyze_tiled(self, path, tile_size=1024, halo=16, workers=1):
+        """
+        Analyze an image file too large to decode at once, tile by tile
+        See tiled_analyzer.TiledDamAnalyzer
+        """
+        from tiled_analyzer import TiledDamAnalyzer
+        return TiledDamAnalyzer(self, tile_size=tile_size, halo=halo, workers=workers).analyze_file(path)
+    
+    def _build_report(self, results, overall_score=None, condition_level=None):
+        """
+        Score detector results and build the analysis response. Results for
+        a subset of DETECTORS give a partial report scored on that subset.
+        Batch callers pass the score and level computed for the whole batch.
+        """
+        # Calculate overall condition
+        if overall_score is None:
             overall_score = self._calculate_overall_score(results)
             condition_level = self._get_condition_level(overall_score)
-            
+        condition_level = int(condition_level)
+        
+        report = {
+            'status': 'success',
+            'timestamp': datetime.now().isoformat(),
+            'overall_condition': int(condition_level),
+            'condition_score': float(round(overall_score, 2)),  # 0-100
+            'risk_level': self.condition_levels[condition_level]['risk'],
+            'analysis': {name: self._report_detector(name, results[name]) for name in DETECTORS if name in results},
+            'recommendations': self._get_recommendations(condition_level, results),
+            'next_inspection': self._get_next_inspection_date(condition_level)
+        }
+        if len(results) < len(DETECTORS):
+            # The score only reflects the detectors that ran
+            report['partial'] = True
+            report['detectors'] = [name for name in DETECTORS if name in results]
+        return report
+    
+    def _report_detector(self, name, result):
+        """Public fields of one detector result"""
+        if name == 'cracks':
             return {
-                'status': 'success',
-                'timestamp': datetime.now().isoformat(),
-                'overall_condition': int(condition_level),
-                'condition_score': float(round(overall_score, 2)),  # 0-100
-                'risk_level': self.condition_levels[condition_level]['risk'],
-                'analysis': {
-                    'cracks': {
-                        'detected': bool(results['cracks']['detected']),
-                        'severity': results['cracks']['severity'],  # None, Minor, Moderate, Severe
-                        'coverage': float(round(results['cracks']['coverage'], 2))  # percentage
-                    },
-                    'surface_wear': {
-                        'level': results['surface_wear']['level'],  # None, Minor, Moderate, Severe
-                        'coverage': float(round(results['surface_wear']['coverage'], 2))
-                    },
-                    'moisture': {
-                        'detected': bool(results['moisture']['detected']),
-                        'level': results['moisture']['level'],  # Low, Medium, High
-                        'areas': int(results['moisture']['affected_areas'])
-                    },
-                    'algae_growth': {
-                        'detected': bool(results['algae_growth']['detected']),
-                        'coverage': float(round(results['algae_growth']['coverage'], 2))
-                    },
-                    'structural_damage': {
-                        'detected': bool(results['structural_damage']['detected']),
-                        'severity': results['structural_damage']['severity'],
-                        'areas': int(results['structural_damage']['damaged_areas'])
-                    },
-                    'erosion': {
-                        'detected': bool(results['erosion']['detected']),
-                        'level': results['erosion']['level']
-                    }
-                },
-                'recommendations': self._get_recommendations(condition_level, results),
-                'next_inspection': self._get_next_inspection_date(condition_level)
+                'detected': bool(result['detected']),
+                'severity': result['severity'],  # None, Minor, Moderate, Severe
+                'coverage': float(round(result['coverage'], 2))  # percentage
             }
-        
-        except Exception as e:
+        if name == 'surface_wear':
             return {
-                'status': 'error',
-                'message': str(e),
-                'error_type': type(e).__name__
+                'level': result['level'],  # None, Minor, Moderate, Severe
+                'coverage': float(round(result['coverage'], 2))
+            }
+        if name == 'moisture':
+            return {
+                'detected': bool(result['detected']),
+                'level': result['level'],  # Low, Medium, High
+                'areas': int(result['affected_areas'])
             }
+        if name == 'algae_growth':
+            return {
+                'detected': bool(result['detected']),
+                'coverage': float(round(result['coverage'], 2))
+            }
+        if name == 'structural_damage':
+            return {
+                'detected': bool(result['detected']),
+                'severity': result['severity'],
+                'areas': int(result['damaged_areas'])
+            }
+        return {
+            'detected': bool(result['detected']),
+            'level': result['level']
+        }
     
-    def _detect_cracks(self, gray):
+    def _detect_cracks(self, ctx):
         """Detect cracks in dam surface"""
-        # Apply morphological operations
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-        morph = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-        
-        # Edge detection
-        edges = cv2.Canny(morph, 50, 150)
-        
-        # Dilate to connect nearby edges
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        dilated = cv2.dilate(edges, kernel, iterations=2)
+        dilated = self._crack_mask(ctx)
         
         # Calculate metrics
         crack_pixels = np.count_nonzero(dilated)
-        total_pixels = gray.size
-        coverage = (crack_pixels / total_pixels) * 100
-        
-        if coverage < 1:
-            severity = None
-        elif coverage < 3:
-            severity = 'Minor'
-        elif coverage < 7:
-            severity = 'Moderate'
-        else:
-            severity = 'Severe'
+        total_pixels = ctx.pixel_count
+        # Dilated edges keep a fixed width in pixels, so on a reduced image
+        # they cover 1/scale times more of the frame; report native units
+        coverage = (crack_pixels / total_pixels) * 100 * ctx.scale
+        
+        return self._classify_cracks(coverage, crack_pixels / ctx.scale)
+    
+    def _crack_mask(self, ctx):
+        """Dilated crack edge mask"""
+        # Edge detection on the morphologically closed image
+        edges = ctx.crack_edges
         
+        # Dilate to connect nearby edges
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        return cv2.dilate(edges, kernel, iterations=2)
+    
+    def _classify_cracks(self, coverage, crack_pixels):
+        """Map crack coverage (percentage) to severity"""
         return {
             'detected': bool(coverage > 0.5),
-            'severity': severity,
+            'severity': grade(coverage, CRACK_SEVERITY),
             'coverage': float(coverage),
-            'pixel_count': int(crack_pixels)
+            'pixel_count': int(round(crack_pixels))
         }
     
-    def _assess_surface_wear(self, gray):
+    def _assess_surface_wear(self, ctx):
         """Assess surface wear and degradation"""
-        # Calculate histogram
-        hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
-        hist = hist.flatten() / hist.sum()
+        # One histogram pass gives the variance, mean and quantiles
+        hist = ctx.gray_histogram
         
         # Wear increases variance in pixel values
-        variance = np.var(gray)
-        
-        # Map variance to wear level
-        if variance < 500:
-            level = None
-        elif variance < 1500:
-            level = 'Minor'
-        elif variance < 3000:
-            level = 'Moderate'
-        else:
-            level = 'Severe'
+        variance = hist.variance
         
         # Calculate coverage as percentage of varied pixels
-        threshold = np.percentile(gray, 25)
-        wear_pixels = np.count_nonzero(np.abs(gray - np.mean(gray)) > threshold)
-        coverage = (wear_pixels / gray.size) * 100
+        threshold = hist.quantile(25)
+        wear_pixels = hist.count_where(np.abs(hist.values - hist.mean) > threshold)
+        coverage = (wear_pixels / hist.count) * 100
         
+        return self._classify_surface_wear(variance, coverage)
+    
+    def _classify_surface_wear(self, variance, coverage):
+        """Map intensity variance to wear level"""
         return {
-            'level': level,
+            'level': grade(variance, SURFACE_WEAR_LEVELS),
             'variance': float(variance),
             'coverage': coverage
         }
     
-    def _detect_moisture(self, gray):
+    def _detect_moisture(self, ctx):
         """Detect moisture and water damage"""
         # Lower pixel values often indicate moisture
-        darker_regions = np.count_nonzero(gray < 100)
-        moisture_percentage = (darker_regions / gray.size) * 100
-        
-        if moisture_percentage < 5:
-            level = 'Low'
-            detected = False
-        elif moisture_percentage < 15:
-            level = 'Medium'
-            detected = True
-        else:
-            level = 'High'
-            detected = True
+        dark_mask = ctx.gray < 100
+        darker_regions = np.count_nonzero(dark_mask)
+        moisture_percentage = (darker_regions / ctx.pixel_count) * 100
         
         # Estimate affected areas
-        num_labels, labeled_array = cv2.connectedComponents((gray < 100).astype(np.uint8))
+        num_labels = self._count_regions(dark_mask.astype(np.uint8), ctx)
         
+        return self._classify_moisture(moisture_percentage, num_labels)
+    
+    def _classify_moisture(self, moisture_percentage, affected_areas):
+        """Map the share of dark pixels to a moisture level"""
+        level = grade(moisture_percentage, MOISTURE_LEVELS)
         return {
-            'detected': detected,
+            'detected': level != 'Low',
             'level': level,
             'percentage': float(moisture_percentage),
-            'affected_areas': int(num_labels)
+            'affected_areas': int(affected_areas)
         }
     
-    def _detect_algae(self, image):
+    def _detect_algae(self, ctx):
         """Detect algae growth (green discoloration)"""
-        if len(image.shape) != 3:
+        if not ctx.is_color:
             return {'detected': False, 'coverage': 0}
         
-        # Convert to HSV
-        hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+        mask = self._algae_mask(ctx)
+        green_pixels = np.count_nonzero(mask)
+        coverage = (green_pixels / ctx.image.size) * 100
         
+        return self._classify_algae(coverage)
+    
+    def _algae_mask(self, ctx):
+        """Mask of green (algae-colored) pixels"""
         # Green color range
         lower_green = np.array([35, 40, 40])
         upper_green = np.array([90, 255, 255])
         
-        mask = cv2.inRange(hsv, lower_green, upper_green)
-        green_pixels = np.count_nonzero(mask)
-        coverage = (green_pixels / image.size) * 100
-        
+        return cv2.inRange(ctx.hsv, lower_green, upper_green)
+    
+    def _classify_algae(self, coverage):
+        """Algae growth is reported above 2% coverage"""
         return {
             'detected': coverage > 2,
             'coverage': float(coverage)
         }
     
-    def _detect_structural_damage(self, gray):
+    def _detect_structural_damage(self, ctx):
         """Detect major structural damage"""
         # Use Laplacian for edge detection
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        damage_map = np.abs(laplacian)
+        damage_map = ctx.laplacian_magnitude
         
         # High Laplacian values indicate edges/damage
-        threshold = np.percentile(damage_map, 75)
-        damage_pixels = np.count_nonzero(damage_map > threshold)
+        hist = ctx.laplacian_histogram
+        threshold = hist.quantile(75)
+        damage_pixels = hist.count_above(threshold)
         
         # Find connected components
         binary_damage = (damage_map > threshold).astype(np.uint8)
-        num_regions, labeled = cv2.connectedComponents(binary_damage)
+        num_regions = self._count_regions(binary_damage, ctx)
         
-        damage_percentage = (damage_pixels / gray.size) * 100
-        
-        if damage_percentage < 1:
-            severity = None
-        elif damage_percentage < 3:
-            severity = 'Minor'
-        elif damage_percentage < 6:
-            severity = 'Moderate'
-        else:
-            severity = 'Severe'
+        damage_percentage = (damage_pixels / ctx.pixel_count) * 100
         
+        return self._classify_structural_damage(damage_percentage, num_regions)
+    
+    def _classify_structural_damage(self, damage_percentage, damaged_areas):
+        """Map the share of high-Laplacian pixels to damage severity"""
         return {
             'detected': damage_percentage > 0.5,
-            'severity': severity,
-            'damaged_areas': int(num_regions),
+            'severity': grade(damage_percentage, DAMAGE_SEVERITY),
+            'damaged_areas': int(damaged_areas),
             'coverage': float(damage_percentage)
         }
     
-    def _assess_erosion(self, gray):
+    def _count_regions(self, mask, ctx):
+        """
+        Count connected regions in a binary mask, including the background
+        label as cv2.connectedComponents does. With min_region_area set,
+        regions smaller than that many original-resolution pixels are ignored
+        so counts stay comparable across analysis resolutions.
+        """
+        if not self.min_region_area:
+            num_labels, _ = cv2.connectedComponents(mask)
+            return num_labels
+
+        num_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        min_area = self.min_region_area * ctx.scale ** 2
+        return 1 + int(np.count_nonzero(stats[1:, cv2.CC_STAT_AREA] >= min_area))
+    
+    def _assess_erosion(self, ctx):
         """Assess erosion level"""
         # Erosion creates rough texture with varying pixel values
-        # Apply Sobel to detect gradient changes
-        sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        
-        magnitude = np.sqrt(sobelx**2 + sobely**2)
-        erosion_score = np.mean(magnitude)
-        
-        if erosion_score < 10:
-            level = None
-        elif erosion_score < 25:
-            level = 'Minor'
-        elif erosion_score < 50:
-            level = 'Moderate'
-        else:
-            level = 'Severe'
+        # Sobel gradient magnitude captures those changes
+        erosion_score = ctx.gradient_mean
         
+        return self._classify_erosion(erosion_score)
+    
+    def _classify_erosion(self, erosion_score):
+        """Map mean gradient magnitude to erosion level"""
         return {
             'detected': erosion_score > 5,
-            'level': level,
+            'level': grade(erosion_score, EROSION_LEVELS),
             'score': float(erosion_score)
         }
     
     def _calculate_overall_score(self, results):
-        """Calculate overall dam condition score (0-100, 100 is best)"""
+        """
+        Calculate overall dam condition score (0-100, 100 is best)
+        Detectors missing from results (partial analyses) deduct nothing
+        """
         score = 100
         
-        # Cracks impact
-        if results['cracks']['severity'] == 'Minor':
-            score -= 10
-        elif results['cracks']['severity'] == 'Moderate':
-            score -= 25
-        elif results['cracks']['severity'] == 'Severe':
-            score -= 40
-        
-        # Surface wear impact
-        if results['surface_wear']['level'] == 'Minor':
-            score -= 5
-        elif results['surface_wear']['level'] == 'Moderate':
-            score -= 15
-        elif results['surface_wear']['level'] == 'Severe':
-            score -= 30
-        
-        # Moisture impact
-        if results['moisture']['level'] == 'Medium':
-            score -= 10
-        elif results['moisture']['level'] == 'High':
-            score -= 25
-        
-        # Algae growth impact
-        score -= min(results['algae_growth']['coverage'], 20)
-        
-        # Structural damage impact
-        if results['structural_damage']['severity'] == 'Minor':
-            score -= 15
-        elif results['structural_damage']['severity'] == 'Moderate':
-            score -= 35
-        elif results['structural_damage']['severity'] == 'Severe':
-            score -= 50
-        
-        # Erosion impact
-        if results['erosion']['level'] == 'Minor':
-            score -= 8
-        elif results['erosion']['level'] == 'Moderate':
-            score -= 18
-        elif results['erosion']['level'] == 'Severe':
-            score -= 35
+        # Deductions in report order: cracks, surface wear, moisture, algae
+        # growth, structural damage, erosion
+        for name in DETECTORS:
+            if name not in results:
+                continue
+            if name == 'algae_growth':
+                score -= min(results[name]['coverage'], ALGAE_MAX_DEDUCTION)
+                continue
+            field, (_, labels), deductions = SCORE_DEDUCTIONS[name]
+            score -= deductions[labels.index(results[name][field])]
         
         return max(0, min(100, score))
     
+    def _calculate_overall_scores(self, grades):
+        """
+        Vectorized _calculate_overall_score for a batch of images. grades
+        maps detector names to arrays of label indices on their ladders
+        (algae_growth: coverage); missing detectors deduct nothing.
+        Deductions are applied in the same order, so scores are identical.
+        """
+        scores = None
+        for name in DETECTORS:
+            if name not in grades:
+                continue
+            if scores is None:
+                scores = np.full(len(grades[name]), 100.0)
+            if name == 'algae_growth':
+                scores -= np.minimum(grades[name], ALGAE_MAX_DEDUCTION)
+            else:
+                scores -= np.take(SCORE_DEDUCTIONS[name][2], grades[name])
+        return np.clip(scores, 0, 100)
+    
     def _get_condition_level(self, score):
-        """Convert score to condition level (0-4)"""
-        if score >= 85:
-            return 0  # Excellent
-        elif score >= 70:
-            return 1  # Good
-        elif score >= 50:
-            return 2  # Fair
-        elif score >= 30:
-            return 3  # Poor
-        else:
-            return 4  # Critical
+        """Convert score to condition level (0-4: Excellent, Good, Fair, Poor, Critical)"""
+        return 4 - bisect.bisect_right(CONDITION_BOUNDS, score)
+    
+    def _get_condition_levels(self, scores):
+        """Vectorized _get_condition_level"""
+        return 4 - np.searchsorted(CONDITION_BOUNDS, scores, side='right')
     
     def _get_recommendations(self, condition_level, results):
         """Get maintenance recommendations based on analysis"""
         recommendations = []
+        # Skipped detectors (partial analyses) contribute no recommendations
+        partial = len(results) < len(DETECTORS)
+        results = {name: results.get(name, {'detected': False}) for name in DETECTORS}
         
         if results['cracks']['detected']:
             if results['cracks']['severity'] == 'Severe':
@@ -378,7 +708,9 @@ class DamConditionAnalyzer:
             else:
                 recommendations.append('📉 Surface erosion present - Consider protective treatment')
         
-        if not recommendations:
+        if not recommendations and partial:
+            recommendations.append('✅ No issues found by the requested checks - Run a full analysis for an overall assessment')
+        elif not recommendations:
             recommendations.append('✅ Dam appears to be in good condition - Continue regular monitoring')
         
         return recommendations
@@ -399,7 +731,7 @@ class DamConditionAnalyzer:
         else:
             return f'{months_until} month{"s" if months_until > 1 else ""}'
 
-    def _validate_dam_image(self, image_array):
+    def _validate_dam_image(self, ctx, limits=VALIDATION_LIMITS):
         """
         Validates if the image is likely a dam or structural component.
         Checks for:
@@ -408,26 +740,25 @@ class DamConditionAnalyzer:
         3. Structural presence (meaningful edge density)
         4. Not pure random noise
         5. Not text, landscapes, or synthetic images
+        Thresholds come from limits (VALIDATION_LIMITS or THUMBNAIL_LIMITS);
+        checks whose limit is None are skipped.
         """
         # 1. Check for blank or flat color images
-        if len(image_array.shape) == 3:
-            gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-        else:
-            gray = image_array
+        gray = ctx.gray
             
-        std_dev = np.std(gray)
-        if float(std_dev) < 10:
+        std_dev = ctx.gray_histogram.std
+        if float(std_dev) < limits['min_contrast']:
             return False, "Upload relevant image: Input is too flat or contains no visible details."
 
         # 2. Enhanced Color profile validation - Dams are typically gray/brown
-        if len(image_array.shape) == 3:
-            hsv = cv2.cvtColor(image_array, cv2.COLOR_RGB2HSV)
+        if ctx.is_color:
+            hsv = ctx.hsv
             avg_saturation = np.mean(hsv[:,:,1])
             avg_hue = np.mean(hsv[:,:,0])
             
             # Reject images with high green (landscapes) or uniform light colors (text/documents)
             # High saturation indicates flowers, green nature, colorful scenes
-            if float(avg_saturation) > 180:
+            if float(avg_saturation) > limits['max_saturation']:
                 return False, "Upload relevant image: Image appears to be synthetic or irrelevant."
             
             # Green tones (hue 25-90) = grass/trees/vegetation
@@ -437,7 +768,7 @@ class DamConditionAnalyzer:
             green_ratio = green_pixels / hsv.size
             
             # If >15% green, it's likely a landscape
-            if float(green_ratio) > 0.15:
+            if float(green_ratio) > limits['max_green_ratio']:
                 return False, "Upload relevant image: This appears to be a landscape or natural vegetation, not a dam."
             
             # Check for predominantly light colors (documents, text)
@@ -445,25 +776,25 @@ class DamConditionAnalyzer:
             light_ratio = light_pixels / hsv.size
             
             # If >20% very light and low saturation (<100), it's likely text/document
-            if float(light_ratio) > 0.20 and float(avg_saturation) < 100:
+            if float(light_ratio) > limits['max_light_ratio'] and float(avg_saturation) < limits['document_saturation']:
                 return False, "Upload relevant image: This appears to be a document or text image, not a dam."
 
         # 3. Structural presence (Edge Density with coherence check)
-        edges = cv2.Canny(gray, 100, 200)
+        edges = ctx.structure_edges
         edge_density = np.count_nonzero(edges) / gray.size
         
-        if float(edge_density) < 0.005:
+        if limits['min_edge_density'] is not None and float(edge_density) < limits['min_edge_density']:
             return False, "Upload relevant image: No structural details detected in the photo."
         
         # 4. Check for random noise (high-frequency incoherent edges)
         # Laplacian detects fine detail; too much laplacian = noise
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        laplacian_variance = np.var(laplacian)
-        
-        if float(laplacian_variance) > 40000:
-            return False, "Upload relevant image: Image contains too much noise or random patterns."
+        if limits['max_laplacian_variance'] is not None:
+            laplacian_variance = ctx.laplacian_variance
+            
+            if float(laplacian_variance) > limits['max_laplacian_variance']:
+                return False, "Upload relevant image: Image contains too much noise or random patterns."
             
-        if float(edge_density) > 0.35:
+        if limits['max_edge_density'] is not None and float(edge_density) > limits['max_edge_density']:
              return False, "Upload relevant image: The photo is too noisy or busy to be a clear dam structure."
 
         return True, "Valid image"
@@ -0,0 +1,129 @@
+"""
+Histogram-based statistics for image analysis hot paths
+Replaces sort-based np.percentile and multi-pass mean/variance with one histogram
+
+Error bound: a Histogram with bin width w reports every quantile, the mean and
+the standard deviation within w of the exact value (np.percentile with linear
+interpolation, np.mean, np.std) for data inside [lo, hi). With unit-width
+bins over integer data, which covers uint8 images and the Laplacian/Sobel
+responses of uint8 images, every statistic is exact up to float rounding.
+"""
+
+import cv2
+import numpy as np
+
+# cv2.calcHist counts in float32, which is exact up to 2**24 per bin
+_CALC_HIST_CHUNK = 1 << 24
+
+
+class Histogram:
+    """
+    Fixed-bin histogram of one array. Bin i counts values in
+    [lo + i * bin_width, lo + (i + 1) * bin_width); statistics treat every
+    value as the lower edge of its bin.
+    """
+
+    def __init__(self, counts, lo=0, bin_width=1):
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.lo = lo
+        self.bin_width = bin_width
+
+    def __add__(self, other):
+        """Merge histograms with identical binning (e.g. from image tiles)"""
+        return Histogram(self.counts + other.counts, self.lo, self.bin_width)
+
+    @property
+    def values(self):
+        """Representative value of every bin"""
+        return self.lo + np.arange(len(self.counts)) * self.bin_width
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def mean(self):
+        return float((self.counts * self.values).sum() / self.count)
+
+    @property
+    def variance(self):
+        deviation = self.values - self.mean
+        return float((self.counts * deviation * deviation).sum() / self.count)
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+    def quantile(self, q):
+        """q-th percentile (0-100) using np.percentile's linear interpolation"""
+        cumulative = np.cumsum(self.counts)
+        rank = q / 100 * (cumulative[-1] - 1)
+        lower = int(np.floor(rank))
+        low_bin = int(np.searchsorted(cumulative, lower, side='right'))
+        high_bin = int(np.searchsorted(cumulative, lower + 1, side='right')) if rank > lower else low_bin
+        low_value = self.lo + low_bin * self.bin_width
+        high_value = self.lo + high_bin * self.bin_width
+        return low_value + (rank - lower) * (high_value - low_value)
+
+    def count_where(self, mask):
+        """Number of values whose bin satisfies a boolean mask over bin values"""
+        return int(self.counts[mask].sum())
+
+    def count_above(self, threshold):
+        """Number of values strictly greater than threshold"""
+        return self.count_where(self.values > threshold)
+
+
+def _calc_hist(data, bins, hi):
+    """Exact integer histogram of uint8/uint16 data via cv2.calcHist"""
+    flat = data.reshape(-1, 1)
+    counts = np.zeros(bins, dtype=np.int64)
+    for start in range(0, len(flat), _CALC_HIST_CHUNK):
+        chunk = flat[start:start + _CALC_HIST_CHUNK]
+        counts += cv2.calcHist([chunk], [0], None, [bins], [0, hi]).ravel().astype(np.int64)
+    return counts
+
+
+def uint8_histogram(data):
+    """256-bin histogram of uint8 data (exact)"""
+    if data.dtype != np.uint8:
+        raise ValueError(f'Expected uint8 data, got {data.dtype}')
+    if not data.flags.c_contiguous:
+        data = np.ascontiguousarray(data)
+    return Histogram(_calc_hist(data, 256, 256))
+
+
+def fixed_bin_histogram(data, lo, hi, bins):
+    """
+    Histogram of real-valued data over [lo, hi) with equal-width bins.
+    Values outside the range are clamped into the first or last bin, so the
+    error bound only holds for data inside the range.
+    """
+    bin_width = (hi - lo) / bins
+    if lo == 0 and bin_width == 1 and data.dtype in (np.uint8, np.uint16):
+        if not data.flags.c_contiguous:
+            data = np.ascontiguousarray(data)
+        counts = _calc_hist(data, bins, hi)
+        # calcHist drops values >= hi; clamp them into the last bin
+        counts[-1] += data.size - counts.sum()
+        return Histogram(counts, lo, 1)
+
+    if lo == 0 and bin_width == 1:
+        index = data.astype(np.intp).ravel()
+    else:
+        index = ((data - lo) / bin_width).astype(np.intp).ravel()
+    np.clip(index, 0, bins - 1, out=index)
+    return Histogram(np.bincount(index, minlength=bins), lo, bin_width)
+
+
+# |Laplacian| (3x3 aperture) of uint8 data is an integer in [0, 1020]
+LAPLACIAN_MAGNITUDE_RANGE = 1021
+
+
+def laplacian_magnitude_histogram(magnitude):
+    """Unit-bin histogram of absolute Laplacian responses of a uint8 image (exact)"""
+    if magnitude.dtype != np.uint16:
+        # Non-negative integers below 1021 convert losslessly and take the
+        # cv2.calcHist fast path
+        magnitude = magnitude.astype(np.uint16)
+    return fixed_bin_histogram(magnitude, 0, LAPLACIAN_MAGNITUDE_RANGE, LAPLACIAN_MAGNITUDE_RANGE)
@@ -0,0 +1,252 @@
+"""
+Per-request image context for dam condition analysis
+Computes derived image representations lazily and at most once
+"""
+
+import threading
+import cv2
+import numpy as np
+import fast_stats
+
+PRECISIONS = ('float64', 'float32')
+
+# Rows per strip for fused gradient magnitude: about one megapixel of float32
+# scratch per Sobel direction
+_STRIP_PIXELS = 1 << 20
+
+
+def pyramid_downscale(image_array, max_side):
+    """
+    Reduce an image so that its longest side is at most max_side pixels.
+
+    The image is halved with a Gaussian pyramid (cv2.pyrDown) while it stays
+    above the cap, and the remaining factor is covered with an area resize.
+    Returns the reduced image and its linear scale relative to the input.
+    """
+    height, width = image_array.shape[:2]
+    longest = max(height, width)
+    if longest <= max_side:
+        return image_array, 1.0
+
+    reduced = image_array
+    while max(reduced.shape[:2]) >= 2 * max_side:
+        reduced = cv2.pyrDown(reduced)
+
+    current = max(reduced.shape[:2])
+    if current > max_side:
+        factor = max_side / current
+        size = (max(1, round(reduced.shape[1] * factor)), max(1, round(reduced.shape[0] * factor)))
+        reduced = cv2.resize(reduced, size, interpolation=cv2.INTER_AREA)
+
+    return reduced, max(reduced.shape[:2]) / longest
+
+
+def stride_thumbnail(image_array, max_side):
+    """
+    Every n-th pixel of every n-th row, with n chosen so that the longest
+    side is at most about max_side (at most 2 * max_side - 1). Unlike an
+    averaging resize this keeps the pixel value distribution (contrast,
+    saturation, noise) of the full image. Returns the input when n is 1.
+    """
+    step = max(image_array.shape[:2]) // max_side
+    if step < 2:
+        return image_array
+    return np.ascontiguousarray(image_array[::step, ::step])
+
+
+class ImageContext:
+    """
+    Lazily computed, memoized views of one image under analysis.
+
+    Validation and every detector read the representations they need from
+    the same context, so a single analysis converts to grayscale and HSV,
+    runs the Laplacian and the Sobel operators, and extracts edge maps at
+    most once each. Detectors may read one context from several threads;
+    each representation is still computed once.
+
+    precision='float64' computes derivative maps as float64 arrays (the
+    reference). precision='float32' keeps the Laplacian as int16 and never
+    materializes Sobel maps: gradient statistics are computed in float32
+    row strips. Derivatives of uint8 images are small integers, so int16
+    is exact and histogram thresholds do not change; gradient sums differ
+    from float64 by float32 rounding of the per-pixel square root
+    (relative error below 1e-7).
+    """
+
+    def __init__(self, image_array, scale=1.0, precision='float64'):
+        if precision not in PRECISIONS:
+            raise ValueError(f'Unknown precision {precision!r}; expected one of {PRECISIONS}')
+        self.image = image_array
+        # Linear size of the analyzed image relative to the original upload
+        self.scale = scale
+        self.precision = precision
+        self._cache = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def preload(self, **representations):
+        """Adopt representations computed elsewhere (e.g. for a whole batch)"""
+        self._cache.update(representations)
+        return self
+
+    def _memoize(self, key, compute):
+        """Return the cached value for key, computing it on first access"""
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        # One lock per key: threads needing the same representation wait for
+        # the first one, while different representations compute in parallel
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def is_color(self):
+        return len(self.image.shape) == 3
+
+    @property
+    def pixel_count(self):
+        return self.gray.size
+
+    @property
+    def gray(self):
+        """Grayscale image (uint8)"""
+        def compute():
+            if self.is_color:
+                return cv2.cvtColor(self.image, cv2.COLOR_RGB2GRAY)
+            return self.image
+        return self._memoize('gray', compute)
+
+    @property
+    def hsv(self):
+        """HSV image (OpenCV ranges), or None for single-channel input"""
+        def compute():
+            if not self.is_color:
+                return None
+            return cv2.cvtColor(self.image, cv2.COLOR_RGB2HSV)
+        return self._memoize('hsv', compute)
+
+    @property
+    def _compact(self):
+        """int16/float32 maps are exact only for 8-bit input"""
+        return self.precision == 'float32' and self.gray.dtype == np.uint8
+
+    @property
+    def laplacian(self):
+        """Laplacian of the grayscale image (int16 in float32 precision)"""
+        depth = cv2.CV_16S if self._compact else cv2.CV_64F
+        return self._memoize('laplacian', lambda: cv2.Laplacian(self.gray, depth))
+
+    @property
+    def laplacian_magnitude(self):
+        """Absolute Laplacian response (uint16 in float32 precision)"""
+        def compute():
+            if self._compact:
+                # |int16| of values within +-1020 reinterprets losslessly
+                return np.abs(self.laplacian).view(np.uint16)
+            return np.abs(self.laplacian)
+        return self._memoize('laplacian_magnitude', compute)
+
+    @property
+    def laplacian_variance(self):
+        """Variance of the Laplacian response"""
+        def compute():
+            if not self._compact:
+                return float(np.var(self.laplacian))
+            # E[L^2] - E[L]^2 from the |L| histogram and one sum, without
+            # float64 temporaries
+            hist = self.laplacian_histogram
+            mean_square = float((hist.counts * hist.values.astype(np.float64) ** 2).sum()) / hist.count
+            mean = cv2.sumElems(self.laplacian)[0] / hist.count
+            return mean_square - mean * mean
+        return self._memoize('laplacian_variance', compute)
+
+    @property
+    def gray_histogram(self):
+        """Exact unit-bin histogram of the grayscale image (fast_stats.Histogram)"""
+        def compute():
+            if self.gray.dtype == np.uint8:
+                return fast_stats.uint8_histogram(self.gray)
+            top = int(self.gray.max()) + 1
+            return fast_stats.fixed_bin_histogram(self.gray, 0, top, top)
+        return self._memoize('gray_histogram', compute)
+
+    @property
+    def laplacian_histogram(self):
+        """Exact unit-bin histogram of the absolute Laplacian response"""
+        def compute():
+            if self.gray.dtype == np.uint8:
+                return fast_stats.laplacian_magnitude_histogram(self.laplacian_magnitude)
+            top = int(self.laplacian_magnitude.max()) + 1
+            return fast_stats.fixed_bin_histogram(self.laplacian_magnitude, 0, top, top)
+        return self._memoize('laplacian_histogram', compute)
+
+    @property
+    def sobel_x(self):
+        return self._memoize('sobel_x', lambda: cv2.Sobel(self.gray, cv2.CV_64F, 1, 0, ksize=3))
+
+    @property
+    def sobel_y(self):
+        return self._memoize('sobel_y', lambda: cv2.Sobel(self.gray, cv2.CV_64F, 0, 1, ksize=3))
+
+    @property
+    def gradient_magnitude(self):
+        """Sobel gradient magnitude"""
+        return self._memoize(
+            'gradient_magnitude',
+            lambda: np.sqrt(self.sobel_x**2 + self.sobel_y**2)
+        )
+
+    @property
+    def gradient_mean(self):
+        """Mean Sobel gradient magnitude over the image"""
+        def compute():
+            if not self._compact:
+                return float(np.mean(self.gradient_magnitude))
+            return self.gradient_sum() / self.pixel_count
+        return self._memoize('gradient_mean', compute)
+
+    def gradient_sum(self, region=None):
+        """
+        Sum of the Sobel gradient magnitude over region (a (rows, cols)
+        slice pair; default the whole image)
+        """
+        rows, cols = region or (slice(None), slice(None))
+        if not self._compact:
+            return float(self.gradient_magnitude[rows, cols].sum())
+
+        gray = self.gray
+        height = gray.shape[0]
+        y_start, y_stop, _ = rows.indices(height)
+        strip = max(1, _STRIP_PIXELS // max(1, gray.shape[1]))
+        total = 0.0
+        for y0 in range(y_start, y_stop, strip):
+            y1 = min(y_stop, y0 + strip)
+            # One halo row on each side gives the 3x3 kernels the same
+            # neighbourhood as on the full image; image borders are
+            # reflected exactly as a full-image Sobel would
+            top, bottom = max(0, y0 - 1), min(height, y1 + 1)
+            block = gray[top:bottom]
+            gx = cv2.Sobel(block, cv2.CV_32F, 1, 0, ksize=3)
+            gy = cv2.Sobel(block, cv2.CV_32F, 0, 1, ksize=3)
+            magnitude = cv2.magnitude(gx, gy)[y0 - top:y1 - top, cols]
+            total += float(magnitude.sum(dtype=np.float64))
+        return total
+
+    @property
+    def structure_edges(self):
+        """Canny edges used by validation to measure structural detail"""
+        return self._memoize('structure_edges', lambda: cv2.Canny(self.gray, 100, 200))
+
+    @property
+    def crack_edges(self):
+        """Canny edges of the morphologically closed image used for crack detection"""
+        def compute():
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+            morph = cv2.morphologyEx(self.gray, cv2.MORPH_CLOSE, kernel)
+            return cv2.Canny(morph, 50, 150)
+        return self._memoize('crack_edges', compute)
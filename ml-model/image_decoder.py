@@ -0,0 +1,177 @@
+"""
+Format-aware decoding of uploaded images
+Sniffs the format and size from the first bytes, then decodes with the
+fastest path for it straight into the array the analyzer works on
+"""
+
+import io
+from collections import namedtuple
+import cv2
+import numpy as np
+from PIL import Image
+
+# Decoded images are RGB (H x W x 3) or, for grayscale sources, H x W uint8
+ImageHeader = namedtuple('ImageHeader', ['format', 'width', 'height', 'grayscale'])
+
+# PIL modes decoded as single-channel images
+_GRAY_MODES = ('1', 'L', 'LA', 'La', 'I', 'I;16', 'I;16B', 'I;16L', 'F')
+
+# JPEG start-of-frame markers (SOF0-SOF15 without DHT, JPG and DAC)
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# OpenCV >= 4.11 can hand out RGB directly; older builds convert in place
+_IMREAD_COLOR_RGB = getattr(cv2, 'IMREAD_COLOR_RGB', None)
+
+_REDUCED_FLAGS = {
+    (2, False): cv2.IMREAD_REDUCED_COLOR_2, (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (4, False): cv2.IMREAD_REDUCED_COLOR_4, (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (8, False): cv2.IMREAD_REDUCED_COLOR_8, (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8
+}
+
+
+def sniff_format(data):
+    """'jpeg', 'png', 'webp', 'gif', 'bmp', 'tiff' from magic bytes, else None"""
+    head = bytes(data[:12])
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:2] == b'BM':
+        return 'bmp'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    return None
+
+
+def _u16(data, offset, byteorder='big'):
+    return int.from_bytes(bytes(data[offset:offset + 2]), byteorder)
+
+
+def _jpeg_header(data):
+    """Size and component count from the first start-of-frame segment"""
+    pos = 2
+    while pos + 9 < len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+        elif marker in _JPEG_SOF:
+            components = data[pos + 9]
+            return ImageHeader('jpeg', _u16(data, pos + 7), _u16(data, pos + 5), components == 1)
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2
+        else:
+            pos += 2 + _u16(data, pos + 2)
+    return None
+
+
+def _png_header(data):
+    if len(data) < 26 or bytes(data[12:16]) != b'IHDR':
+        return None
+    width = int.from_bytes(bytes(data[16:20]), 'big')
+    height = int.from_bytes(bytes(data[20:24]), 'big')
+    # Color types 0 (gray) and 4 (gray + alpha)
+    return ImageHeader('png', width, height, data[25] in (0, 4))
+
+
+def _webp_header(data):
+    chunk = bytes(data[12:16])
+    if chunk == b'VP8 ' and len(data) >= 30:
+        return ImageHeader('webp', _u16(data, 26, 'little') & 0x3FFF, _u16(data, 28, 'little') & 0x3FFF, False)
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = int.from_bytes(bytes(data[21:25]), 'little')
+        return ImageHeader('webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1, False)
+    if chunk == b'VP8X' and len(data) >= 30:
+        return ImageHeader('webp', int.from_bytes(bytes(data[24:27]), 'little') + 1,
+                           int.from_bytes(bytes(data[27:30]), 'little') + 1, False)
+    return None
+
+
+def read_header(data):
+    """
+    ImageHeader of encoded image bytes without decoding pixels, or None if
+    the data is not a readable image. JPEG, PNG and WebP headers are parsed
+    directly; other formats are read by PIL, which also only parses the header.
+    """
+    image_format = sniff_format(data)
+    parse = {'jpeg': _jpeg_header, 'png': _png_header, 'webp': _webp_header}.get(image_format)
+    if parse is not None:
+        header = parse(data)
+        if header is not None:
+            return header
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        return None
+    return ImageHeader(image_format or image.format.lower(), image.width, image.height, image.mode in _GRAY_MODES)
+
+
+def _imdecode(buffer, flags, grayscale, reduced=False):
+    """cv2.imdecode returning RGB or grayscale; None when OpenCV cannot read the data"""
+    if not grayscale and not reduced and _IMREAD_COLOR_RGB is not None:
+        return cv2.imdecode(buffer, _IMREAD_COLOR_RGB)
+    image = cv2.imdecode(buffer, flags)
+    if image is not None and not grayscale:
+        # OpenCV decodes to BGR; convert in place
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    return image
+
+
+def normalize_pil(image):
+    """RGB or grayscale uint8 array of a PIL image, converting its mode once"""
+    target = 'L' if image.mode in _GRAY_MODES else 'RGB'
+    if image.mode != target:
+        image = image.convert(target)
+    return np.asarray(image)
+
+
+def decode_image(data, header=None):
+    """
+    Decode encoded image bytes (bytes, bytearray or memoryview) into an RGB
+    array, or a 2-D array for grayscale sources.
+
+    The color mode is normalized by the decoder itself: OpenCV expands
+    palettes, drops alpha, reduces 16-bit samples to 8 bits and, where the
+    build supports it, emits RGB directly. The buffer OpenCV allocates is
+    the only copy of the pixels; older OpenCV builds convert BGR to RGB in
+    place. Formats OpenCV cannot read fall back to PIL with a single mode
+    conversion. Raises ValueError for unreadable data.
+    """
+    header = header or read_header(data)
+    if header is None:
+        raise ValueError('Unsupported or corrupt image data')
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    flags = cv2.IMREAD_GRAYSCALE if header.grayscale else cv2.IMREAD_COLOR
+    image = _imdecode(buffer, flags, header.grayscale)
+    if image is not None:
+        return image
+    try:
+        return normalize_pil(Image.open(io.BytesIO(data)))
+    except Exception:
+        raise ValueError('Unsupported or corrupt image data')
+
+
+def decode_thumbnail(data, min_side, header=None):
+    """
+    Decode a JPEG at the smallest DCT scale (1/2, 1/4 or 1/8) that keeps
+    its longest side at least min_side, without decoding the full image.
+    Returns None when no reduced decode applies: other formats (OpenCV
+    decodes PNG and WebP in full even with reduced flags), images smaller
+    than 2 * min_side and unreadable data.
+    """
+    header = header or read_header(data)
+    if header is None or header.format != 'jpeg':
+        return None
+    longest = max(header.width, header.height)
+    factor = next((factor for factor in (8, 4, 2) if longest // factor >= min_side), None)
+    if factor is None:
+        return None
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    return _imdecode(buffer, _REDUCED_FLAGS[factor, header.grayscale], header.grayscale, reduced=True)
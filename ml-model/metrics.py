@@ -0,0 +1,113 @@
+"""
+Latency instrumentation for dam image analysis
+Stage timers, aggregated histograms and Prometheus text exposition
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; decode and detector stages range from well under
+# a millisecond on thumbnails to seconds on 50 MP photos
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StageTimer:
+    """Wall-clock time per named stage of one analysis, in seconds"""
+
+    def __init__(self):
+        self.timings = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def stop(self):
+        """Record the wall-clock time since the timer was created as 'total'"""
+        self.timings['total'] = time.perf_counter() - self._start
+
+    def milliseconds(self):
+        """Timings rounded to microseconds, in milliseconds, for responses"""
+        return {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()}
+
+
+class LatencyHistogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, count of observations <= bound) including +Inf"""
+        running = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of per-stage latency histograms and outcome counters
+    for one API process. Worker processes time their own stages and send
+    the timings back with each result; the parent records them here.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._stages = {}
+        self._outcomes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = LatencyHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_all(self, timings):
+        """Record a {stage: seconds} dict from a StageTimer"""
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    def count_outcome(self, outcome):
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = [
+            '# HELP dam_analysis_stage_seconds Time spent in each dam image analysis stage.',
+            '# TYPE dam_analysis_stage_seconds histogram'
+        ]
+        with self._lock:
+            for stage in sorted(self._stages):
+                histogram = self._stages[stage]
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'dam_analysis_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+                lines.append(f'dam_analysis_stage_seconds_sum{{stage="{stage}"}} {histogram.sum!r}')
+                lines.append(f'dam_analysis_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines.append('# HELP dam_analysis_images_total Analyzed images by outcome.')
+            lines.append('# TYPE dam_analysis_images_total counter')
+            for outcome in sorted(self._outcomes):
+                lines.append(f'dam_analysis_images_total{{outcome="{outcome}"}} {self._outcomes[outcome]}')
+        return '\n'.join(lines) + '\n'
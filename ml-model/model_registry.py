@@ -0,0 +1,236 @@
+"""
+Versioned model registry for the risk prediction API
+Every training run is stored as its own version directory under
+models/versions/ (the pickles, metadata.json and the compiled export), and
+registry.json names the active version and the activation history. Versions
+are written under a staging name and renamed into place, and registry.json
+is replaced atomically, so a server never sees a half-written ensemble.
+"""
+
+import contextlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import warnings
+from collections import namedtuple
+from datetime import datetime
+import joblib
+import numpy as np
+from compiled_ensemble import CompiledEnsemble, compile_ensemble
+
+VERSIONS_DIR = 'versions'
+
+STATE = 'registry.json'
+
+# Version directory names; staging directories start with a dot
+VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+# Everything a prediction reads, swapped as a unit
+ModelSet = namedtuple('ModelSet', ['version', 'rf_model', 'gb_model', 'nn_model', 'scaler', 'compiled_model',
+                                   'metadata'])
+
+
+def load_compiled_model(path, rf_model, gb_model, nn_model, scaler, metadata):
+    """
+    The ensemble flattened into NumPy arrays by train_model.py, or compiled
+    from the loaded models when that export is missing or from another
+    training run. The export is memory-mapped read-only, so server
+    processes share one copy of its pages.
+    """
+    try:
+        compiled = CompiledEnsemble.load(os.path.join(path, 'compiled'), mmap_mode='r')
+        if compiled.manifest.get('trained_date') == metadata.get('trained_date'):
+            return compiled
+        print("[WARN] Compiled models do not match the loaded models; recompiling")
+    except (OSError, ValueError, KeyError):
+        pass
+    return compile_ensemble(rf_model, gb_model, nn_model, scaler=scaler, trained_date=metadata.get('trained_date'))
+
+
+def load_model_set(path, version=None):
+    """ModelSet of the models saved in path by DamMonitoringMLModel.save_models"""
+    rf_model = joblib.load(os.path.join(path, 'random_forest.pkl'))
+    gb_model = joblib.load(os.path.join(path, 'gradient_boosting.pkl'))
+    nn_model = joblib.load(os.path.join(path, 'neural_network.pkl'))
+    scaler = joblib.load(os.path.join(path, 'scaler.pkl'))
+    with open(os.path.join(path, 'metadata.json'), 'r') as f:
+        metadata = json.load(f)
+    compiled_model = load_compiled_model(path, rf_model, gb_model, nn_model, scaler, metadata)
+    return ModelSet(version, rf_model, gb_model, nn_model, scaler, compiled_model, metadata)
+
+
+def warm_up(models):
+    """
+    Run the sklearn and compiled paths once on the mean reading, so the
+    first requests after a swap do not pay for first calls and page faults,
+    and check that every model returns probabilities
+    """
+    n_features = models.scaler.n_features_in_
+    mean = models.scaler.mean_ if models.scaler.mean_ is not None else np.zeros(n_features)
+    raw = np.asarray(mean, dtype=float).reshape(1, -1)
+    with warnings.catch_warnings():
+        # The scaler was fitted on a DataFrame and warns about unnamed columns
+        warnings.simplefilter('ignore', UserWarning)
+        scaled = models.scaler.transform(raw)
+    outputs = [model.predict_proba(scaled) for model in (models.rf_model, models.gb_model, models.nn_model)]
+    outputs += models.compiled_model.predict_proba(raw if models.compiled_model.raw_inputs else scaled)
+    for proba in outputs:
+        if proba.shape != (1, len(models.rf_model.classes_)) or not np.allclose(proba.sum(axis=1), 1):
+            raise ValueError(f'Model version {models.version} does not return class probabilities')
+
+
+def _lock_file(f):
+    """
+    Block until this process holds an exclusive lock on the open file f;
+    returns the function releasing it. Uses flock on POSIX and
+    msvcrt.locking on Windows; elsewhere updates are not locked.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return lambda: fcntl.flock(f, fcntl.LOCK_UN)
+    try:
+        import msvcrt
+    except ImportError:
+        return lambda: None
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            break
+        except OSError:
+            # LK_LOCK gives up after 10 attempts one second apart
+            continue
+    def unlock():
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    return unlock
+
+
+class ModelRegistry:
+    """
+    Model versions under root/versions, with the active one recorded in
+    root/registry.json. A root without registry.json holds the flat layout
+    written by save_models directly, which serves as the active models.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.versions_dir = os.path.join(root, VERSIONS_DIR)
+
+    def state(self):
+        """{'active': version or None, 'history': activated versions, oldest first}"""
+        try:
+            with open(os.path.join(self.root, STATE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'active': None, 'history': []}
+
+    def active(self):
+        return self.state()['active']
+
+    def previous(self):
+        """The version a rollback would return to, or None"""
+        history = self.state()['history']
+        return history[-2] if len(history) > 1 else None
+
+    def path(self, version=None):
+        """Directory of a version, by default the active one (the root for the flat layout)"""
+        version = version or self.active()
+        if version is None:
+            return self.root
+        path = os.path.join(self.versions_dir, version)
+        if not VERSION_PATTERN.match(version) or not os.path.isdir(path):
+            raise KeyError(f'Unknown model version {version!r}')
+        return path
+
+    def versions(self):
+        """Every stored version with its training metadata, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        active = self.active()
+        versions = []
+        for version in sorted(os.listdir(self.versions_dir)):
+            if not VERSION_PATTERN.match(version):
+                continue
+            try:
+                with open(os.path.join(self.versions_dir, version, 'metadata.json'), 'r') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                metadata = {}
+            versions.append({
+                'version': version,
+                'trained_date': metadata.get('trained_date'),
+                'model_version': metadata.get('model_version'),
+                'active': version == active
+            })
+        return versions
+
+    def add(self, save):
+        """
+        Store the models written by save(directory), e.g.
+        DamMonitoringMLModel.save_models, as a new version named after the
+        current time; returns the name. The version directory appears only
+        once save has returned.
+        """
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.versions_dir)
+        try:
+            save(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        base = datetime.now().strftime('%Y%m%d-%H%M%S')
+        version, suffix = base, 2
+        while True:
+            try:
+                os.rename(staging, os.path.join(self.versions_dir, version))
+                return version
+            except OSError:
+                if not os.path.exists(os.path.join(self.versions_dir, version)):
+                    raise
+                version, suffix = f'{base}-{suffix}', suffix + 1
+
+    def activate(self, version):
+        """Make version the active one"""
+        self.path(version)
+        with self._locked():
+            state = self.state()
+            if state['active'] != version:
+                state['active'] = version
+                state['history'].append(version)
+                self._write(state)
+
+    def rollback(self):
+        """Reactivate the version that was active before the current one; returns it"""
+        with self._locked():
+            state = self.state()
+            if len(state['history']) < 2:
+                raise ValueError('No earlier model version to roll back to')
+            state['history'].pop()
+            state['active'] = state['history'][-1]
+            self.path(state['active'])
+            self._write(state)
+        return state['active']
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialize registry updates between processes"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, 'registry.lock'), 'w') as lock:
+            unlock = _lock_file(lock)
+            try:
+                yield
+            finally:
+                unlock()
+
+    def _write(self, state):
+        temporary = os.path.join(self.root, f'{STATE}.{os.getpid()}.tmp')
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(temporary, os.path.join(self.root, STATE))
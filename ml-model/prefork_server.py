@@ -0,0 +1,128 @@
+"""
+Pre-fork server for the risk prediction API
+Loads the models once in a parent process, then forks worker processes
+that serve api_server.app from one shared listening socket. Workers start
+without loading anything and share the parent's pages copy-on-write (the
+compiled ensemble is also memory-mapped read-only), so each holds only the
+memory it writes to while handling requests.
+
+Usage:
+    python prefork_server.py [--host 0.0.0.0] [--port 5001] [--workers 4] [--no-preload]
+
+DAM_API_WORKERS sets the default number of workers (number of CPUs) and
+DAM_MODEL_DIR the model directory. --no-preload makes every worker import
+api_server and load the models itself, as independent server processes do.
+A worker that dies is replaced; SIGINT or SIGTERM lets the workers finish
+their current request and stops the server. Workers follow the model
+registry (see model_registry.py) on their own: a version activated after
+the parent loaded the models is loaded in each worker.
+"""
+
+import argparse
+import gc
+import importlib
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from werkzeug.serving import make_server
+
+# Seconds before a worker that exited unexpectedly is replaced
+RESTART_DELAY = 1.0
+
+
+def _import_api_server():
+    return importlib.import_module('api_server')
+
+
+def serve(host='0.0.0.0', port=5001, workers=None, preload=True):
+    """Serve api_server.app from forked worker processes until SIGINT or SIGTERM"""
+    workers = workers or os.cpu_count() or 1
+    api_server = _import_api_server() if preload else None
+    sock = socket.create_server((host, port), family=socket.AF_INET6 if ':' in host else socket.AF_INET,
+                                backlog=128)
+    if preload:
+        # Objects the collector would otherwise visit (and so write to) in
+        # every worker are moved out of its generations
+        gc.collect()
+        gc.freeze()
+
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(workers):
+        children[_spawn(sock, host, port, api_server)] = slot
+    print(f"[OK] {workers} workers serving on http://{host}:{sock.getsockname()[1]} (parent {os.getpid()})",
+          flush=True)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"[WARN] Worker {pid} exited with status {status}; restarting", flush=True)
+            time.sleep(RESTART_DELAY)
+            if not stopping:
+                children[_spawn(sock, host, port, api_server)] = slot
+    sock.close()
+
+
+def _spawn(sock, host, port, api_server):
+    """Fork a worker serving api_server.app (imported in the worker when None) from sock"""
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        # The parent forwards Ctrl-C as SIGTERM once to every worker
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        api_server = api_server or _import_api_server()
+        # Catch up with a version activated since the parent loaded the
+        # models, before accepting requests, then follow later activations
+        try:
+            api_server.reload_models()
+        except Exception as e:
+            print(f"[ERROR] Could not load the active model version: {e}", flush=True)
+        api_server.start_registry_watcher()
+        server = make_server(host, port, api_server.app, fd=sock.fileno())
+        # shutdown() waits for the request being handled, so it runs off the serving thread
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        print(f"[OK] Worker {os.getpid()} ready", flush=True)
+        server.serve_forever()
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('DAM_API_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--no-preload', action='store_true', help='load the models in every worker')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, preload=not args.no_preload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Content-addressed cache for dam image analysis results
+Duplicate uploads are answered without re-running the detectors
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class AnalysisResultCache:
+    """
+    LRU cache of analysis results keyed by the SHA-256 of the encoded image
+    bytes, the analyzer fingerprint and the analysis options.
+
+    Entries expire after ttl_seconds. With disk_dir set, results are also
+    written there as JSON files so they survive restarts and can be shared
+    between worker processes. Because the analyzer fingerprint is part of
+    every key, changing the analyzer version, its thresholds or its
+    settings invalidates all earlier entries; stale disk files are removed
+    by prune() once their TTL has passed.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=3600, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'evictions': 0, 'expirations': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.prune()
+
+    def key(self, image_bytes, fingerprint, **options):
+        """Cache key for one analysis request"""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(fingerprint.encode('utf-8'))
+        digest.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Cached result (a fresh copy) or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return json.loads(payload)
+                del self._entries[key]
+                self._counters['expirations'] += 1
+
+        payload = self._read_disk(key, now)
+        with self._lock:
+            if payload is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            self._counters['disk_hits'] += 1
+            self._store(key, payload, now)
+        return json.loads(payload)
+
+    def put(self, key, result):
+        """Store a JSON-serializable result"""
+        try:
+            payload = json.dumps(result)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._store(key, payload, time.time())
+        self._write_disk(key, payload)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            hits, misses = self._counters['hits'], self._counters['misses']
+            return {
+                **self._counters,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                'disk_tier': bool(self.disk_dir)
+            }
+
+    def prune(self):
+        """Delete expired files from the disk tier"""
+        if not self.disk_dir:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _store(self, key, payload, now):
+        """Insert under the lock, evicting least recently used entries"""
+        self._entries[key] = (now + self.ttl_seconds, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl_seconds <= now:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, payload):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
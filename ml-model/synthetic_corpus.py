@@ -0,0 +1,170 @@
+"""
+Synthetic dam face images for tests and benchmarks
+Every generator is vectorized, so 48 MP images take seconds rather than minutes
+"""
+
+import numpy as np
+import cv2
+
+# Benchmark corpus variants: extra features drawn over the concrete base
+VARIANTS = {
+    'concrete': {},
+    'cracked': {'cracks': 40},
+    'moisture': {'moisture': 0.2},
+    'algae': {'algae': 0.08}
+}
+
+
+def _image_size(megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    return width, int(width * 3 / 4)
+
+
+def _smooth_noise(rng, height, width, cell, interpolation=cv2.INTER_CUBIC):
+    """Band-limited noise: a coarse random grid upsampled to full size"""
+    grid = rng.standard_normal((max(2, round(height / cell)), max(2, round(width / cell))), dtype=np.float32)
+    return cv2.resize(grid, (width, height), interpolation=interpolation)
+
+
+def _patch_mask(rng, height, width, coverage):
+    """Soft blob mask (0..1) covering roughly `coverage` of the frame"""
+    noise = _smooth_noise(rng, height, width, max(width, height) / 12)
+    threshold = np.quantile(noise[::8, ::8], 1 - coverage)
+    # Feather the blob edges over ~0.3 standard deviations
+    return np.clip((noise - threshold) / 0.3, 0, 1)
+
+
+def create_concrete_image(megapixels, seed=0):
+    """Textured concrete face with dark cracks, generated without pixel loops"""
+    rng = np.random.default_rng(seed)
+    width, height = _image_size(megapixels)
+    side = max(width, height)
+
+    def smooth_noise(cell, interpolation):
+        return _smooth_noise(rng, height, width, cell, interpolation)
+
+    gray = 135 + 18 * smooth_noise(side / 16, cv2.INTER_CUBIC) + 10 * smooth_noise(side / 160, cv2.INTER_LINEAR)
+    gray += 3 * rng.standard_normal((height, width), dtype=np.float32)
+    image = cv2.merge([gray * 1.04, gray, gray * 0.93])
+    image = np.clip(image, 0, 255).astype(np.uint8)
+
+    # Aggregate speckles
+    radius = max(1, round(side / 800))
+    points = (rng.uniform(0, 1, (4000, 2)) * [width, height]).astype(int)
+    for (x, y), value in zip(points, rng.integers(60, 200, 4000)):
+        cv2.circle(image, (int(x), int(y)), radius, (int(value), int(value), int(value * 0.93)), -1)
+
+    # Cracks as random walks
+    draw_cracks(image, rng, 8)
+    return image
+
+
+def draw_cracks(image, rng, count):
+    """Dark random-walk cracks, drawn in place"""
+    height, width = image.shape[:2]
+    side = max(width, height)
+    thickness = max(1, round(side / 500))
+    for _ in range(count):
+        walk = np.cumsum(rng.normal(0, side / 40, (30, 2)), axis=0) + rng.uniform(0, 1, 2) * [width, height]
+        cv2.polylines(image, [walk.astype(np.int32)], False, (45, 45, 42), thickness)
+    return image
+
+
+def add_moisture(image, rng, coverage):
+    """Darken soft patches, as seepage does to a concrete face"""
+    height, width = image.shape[:2]
+    mask = _patch_mask(rng, height, width, coverage)
+    shade = 1 - 0.45 * mask
+    return np.clip(image * shade[..., None], 0, 255).astype(np.uint8)
+
+
+def add_algae(image, rng, coverage):
+    """Tint soft patches dark green"""
+    height, width = image.shape[:2]
+    mask = _patch_mask(rng, height, width, coverage)[..., None]
+    algae = np.array([60, 105, 45], dtype=np.float32)
+    return np.clip(image * (1 - 0.7 * mask) + algae * (0.7 * mask), 0, 255).astype(np.uint8)
+
+
+def create_dam_image(megapixels, seed=0, cracks=0, moisture=0, algae=0):
+    """
+    Concrete face (create_concrete_image) with extra cracks, moisture
+    patches covering `moisture` of the frame and algae covering `algae`
+    """
+    image = create_concrete_image(megapixels, seed)
+    # Features use their own stream so the base image does not depend on them
+    rng = np.random.default_rng([seed, 1])
+    if cracks:
+        draw_cracks(image, rng, cracks)
+    if moisture:
+        image = add_moisture(image, rng, moisture)
+    if algae:
+        image = add_algae(image, rng, algae)
+    return image
+
+
+def create_variant(variant, megapixels, seed=0):
+    """One image of a named corpus variant"""
+    return create_dam_image(megapixels, seed, **VARIANTS[variant])
+
+
+# Uploads validation must reject, mirroring the cases in test_validation_strictness.py
+NON_DAM_KINDS = ('blank', 'gradient', 'landscape', 'document', 'noise', 'colorful', 'portrait')
+
+
+def create_non_dam_image(kind, megapixels, seed=0):
+    """Vectorized non-dam image of the given kind"""
+    rng = np.random.default_rng(seed)
+    width, height = _image_size(megapixels)
+
+    if kind == 'blank':
+        return np.full((height, width, 3), 100, dtype=np.uint8)
+    if kind == 'gradient':
+        ramp = np.linspace(0, 255, width, dtype=np.float32)
+        return np.repeat(np.stack([ramp, ramp * 0.5, 255 - ramp], axis=-1)[None], height, axis=0).astype(np.uint8)
+    if kind == 'landscape':
+        image = np.empty((height, width, 3), dtype=np.float32)
+        image[:height // 2] = (135, 206, 235)
+        image[height // 2:] = (34, 139, 34)
+        image += rng.uniform(-10, 10, image.shape).astype(np.float32)
+        return np.clip(image, 0, 255).astype(np.uint8)
+    if kind == 'document':
+        image = np.full((height, width), 255, dtype=np.uint8)
+        # Lines of text: dark strokes in regularly spaced bands
+        line = max(4, height // 60)
+        rows = (np.arange(height) // line) % 3 == 0
+        ink = rng.random((height, width)) < 0.3
+        image[rows[:, None] & ink & (np.arange(width) > width // 10) & (np.arange(width) < width * 9 // 10)] = 0
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    if kind == 'noise':
+        return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    if kind == 'colorful':
+        hue = (_smooth_noise(rng, height, width, max(width, height) / 6) * 40 + 90) % 180
+        hsv = cv2.merge([hue.astype(np.uint8), np.full((height, width), 230, np.uint8),
+                         np.full((height, width), 200, np.uint8)])
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
+    if kind == 'portrait':
+        image = np.empty((height, width, 3), dtype=np.float32)
+        image[:] = (220, 180, 160)
+        image += rng.uniform(-10, 10, image.shape).astype(np.float32)
+        return np.clip(image, 0, 255).astype(np.uint8)
+    raise ValueError(f'Unknown non-dam image kind {kind!r}')
+
+
+def create_flyover(frame_megapixels, count, pan=0.02, seed=0):
+    """
+    Frames of a camera panning across a cracked dam face, moving pan times
+    the frame width per frame, with sensor noise on every frame
+    """
+    rng = np.random.default_rng([seed, 2])
+    width, height = _image_size(frame_megapixels)
+    step = pan * width
+    span = width + int(np.ceil(step * (count - 1)))
+    # A 4:3 face at least span wide; frames are cut from its top rows
+    face = create_variant('cracked', span * span * 3 / 4 / 1e6, seed)
+    frames = []
+    for index in range(count):
+        x = int(round(index * step))
+        frame = face[:height, x:x + width].astype(np.int16) + rng.integers(-3, 4, (height, width, 3), dtype=np.int16)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
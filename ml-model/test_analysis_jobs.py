@@ -0,0 +1,175 @@
+"""
+Tests for the asynchronous job API and its SQLite store
+"""
+
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import cv2
+import dam_analysis_api
+from dam_condition_analyzer import DamConditionAnalyzer
+from analysis_jobs import JobManager, JobStore
+from synthetic_corpus import create_concrete_image
+
+
+def encode_png(seed=0):
+    ok, buffer = cv2.imencode('.png', cv2.cvtColor(create_concrete_image(0.2, seed=seed), cv2.COLOR_RGB2BGR))
+    assert ok
+    return buffer.tobytes()
+
+
+def wait_until_finished(manager, job_id, timeout=60):
+    deadline = time.time() + timeout
+    job = manager.get(job_id)
+    while job['status'] in ('queued', 'running'):
+        assert time.time() < deadline, job
+        job = manager.wait_for_change(job_id, job)
+    return job
+
+
+def test_job_runs_and_keeps_results():
+    png = encode_png()
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = JobManager(DamConditionAnalyzer(), JobStore(os.path.join(tmp, 'jobs.db')))
+        items = [
+            {'image': png, 'dam_name': 'Binary'},
+            {'image': base64.b64encode(png).decode('utf-8'), 'dam_name': 'Base64'},
+            {'dam_name': 'Missing'},
+            'not an object'
+        ]
+        job_id = manager.submit(items)
+        job = wait_until_finished(manager, job_id)
+        results = manager.results(job_id)
+        manager.shutdown()
+        manager.store.close()
+
+    assert job['status'] == 'completed'
+    assert (job['total'], job['completed'], job['failed']) == (4, 4, 2)
+    assert [idx for idx, _, _ in results] == [0, 1, 2, 3]
+    assert results[0][1] == {'dam_name': 'Binary'}
+    assert results[0][2]['analysis'] == results[1][2]['analysis']
+    assert results[2][2]['status'] == 'error'
+    assert results[3][1:] == ({}, {'status': 'error', 'message': 'Image entry must be an object',
+                                   'error_type': 'ValueError'})
+
+
+def test_queued_jobs_resume_after_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'jobs.db')
+        store = JobStore(path)
+        job_id = store.create([{'image': encode_png(0)}, {'image': encode_png(1)}])
+        # Simulate a crash after the first image was analyzed
+        store.set_status(job_id, 'running')
+        store.record_result(job_id, 0, {'status': 'success', 'analysis': {}})
+        store.close()
+
+        manager = JobManager(DamConditionAnalyzer(), JobStore(path))
+        job = wait_until_finished(manager, job_id)
+        results = manager.results(job_id)
+        manager.shutdown()
+        manager.store.close()
+
+    assert job['status'] == 'completed' and job['completed'] == 2
+    assert results[0][2] == {'status': 'success', 'analysis': {}}
+    assert results[1][2]['status'] == 'success'
+
+
+def test_jobs_are_claimed_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'jobs.db')
+        store = JobStore(path)
+        job_id = store.create([{'image': encode_png(seed)} for seed in range(3)])
+        # Two API processes sharing the store start at the same time
+        managers = [JobManager(DamConditionAnalyzer(), JobStore(path)) for _ in range(2)]
+        job = wait_until_finished(managers[0], job_id)
+        for manager in managers:
+            manager.shutdown()
+            manager.store.close()
+
+        # A running job is taken over only once its lease has expired
+        other = store.create([{'image': encode_png()}])
+        assert store.claim(other, 'first') and not store.claim(other, 'second')
+        assert store.claimable_jobs() == []
+        time.sleep(0.05)
+        assert store.claimable_jobs(lease_seconds=0.01) == [other]
+        assert store.claim(other, 'second', lease_seconds=0.01)
+
+        # Both owners record the item; it is counted once, and the old owner cannot finish the job
+        store.record_result(other, 0, {'status': 'success', 'analysis': {}})
+        store.record_result(other, 0, {'status': 'error'})
+        store.finish(other, 'first', 'completed')
+        taken_over = store.get(other)
+        store.close()
+
+    assert job['status'] == 'completed' and job['completed'] == job['total'] == 3
+    assert (taken_over['status'], taken_over['completed'], taken_over['failed']) == ('running', 1, 0)
+
+
+def test_jobs_resume_when_the_app_starts():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'jobs.db')
+        env = dict(os.environ, DAM_JOBS_DB=path, DAM_ANALYSIS_WORKERS='0')
+
+        def run(script):
+            subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                           check=True, capture_output=True)
+
+        # Importing the app does not touch the job store
+        run('import dam_analysis_api')
+        assert not os.path.exists(path)
+
+        store = JobStore(path)
+        job_id = store.create([{'image': encode_png(), 'dam_name': 'Dam A'}])
+        store.close()
+        # As a WSGI server loads it: no __main__ block and no request
+        run('import dam_analysis_api; dam_analysis_api.create_app(); dam_analysis_api.job_manager.shutdown()')
+        store = JobStore(path)
+        job = store.get(job_id)
+        store.close()
+
+    assert job['status'] == 'completed' and job['completed'] == 1
+
+
+def test_jobs_api_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        original = dam_analysis_api.JOBS_DB
+        dam_analysis_api.JOBS_DB = os.path.join(tmp, 'jobs.db')
+        dam_analysis_api.create_app()
+        try:
+            client = dam_analysis_api.app.test_client()
+            submitted = client.post('/jobs', json={'images': [
+                {'image': base64.b64encode(encode_png()).decode('utf-8'), 'dam_name': 'Dam A'}, 42
+            ]})
+            assert submitted.status_code == 202
+            job_id = submitted.json['job_id']
+
+            events = client.get(f'/jobs/{job_id}/events')
+            lines = [json.loads(line) for line in events.data.decode('utf-8').splitlines()]
+            assert lines[-1]['status'] == 'completed'
+
+            job = client.get(f'/jobs/{job_id}').json
+            assert job['successful'] == 1 and job['errors'] == [{'dam_name': 'Dam_1',
+                                                                 'error': 'Image entry must be an object'}]
+            assert job['results'][0]['dam_metadata']['name'] == 'Dam A'
+            assert client.get('/jobs/unknown').status_code == 404
+        finally:
+            dam_analysis_api.job_manager.shutdown()
+            dam_analysis_api.job_manager.store.close()
+            dam_analysis_api.job_manager = None
+            dam_analysis_api.JOBS_DB = original
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING ANALYSIS JOBS")
+    print("=" * 60)
+    test_job_runs_and_keeps_results()
+    test_queued_jobs_resume_after_restart()
+    test_jobs_are_claimed_once()
+    test_jobs_resume_when_the_app_starts()
+    test_jobs_api_round_trip()
+    print("All analysis job tests passed")
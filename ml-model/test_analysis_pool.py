@@ -0,0 +1,103 @@
+"""
+Tests for the process pool used by /batch-analyze
+"""
+
+import cv2
+from dam_condition_analyzer import DamConditionAnalyzer
+from result_cache import AnalysisResultCache
+from analysis_pool import AnalysisPool
+from metrics import MetricsRegistry
+from synthetic_corpus import create_concrete_image
+
+
+def _encode(image):
+    ok, encoded = cv2.imencode('.png', cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    assert ok
+    return encoded.tobytes()
+
+
+def _without_timestamp(result):
+    return {k: v for k, v in result.items() if k not in ('timestamp', 'next_inspection')}
+
+
+def test_pool_matches_serial_in_order():
+    images = [_encode(create_concrete_image(0.2, seed=seed)) for seed in range(3)]
+    images.insert(1, b'not an image')
+    analyzer = DamConditionAnalyzer()
+    serial = [analyzer.analyze_image(image) for image in images]
+
+    pool = AnalysisPool(DamConditionAnalyzer(), workers=2, max_in_flight=1)
+    try:
+        pooled = list(pool.imap([memoryview(image) for image in images]))
+    finally:
+        pool.shutdown()
+
+    assert [index for index, _ in pooled] == list(range(len(images)))
+    assert pooled[1][1]['status'] == 'error'
+    for expected, (_, result) in zip(serial, pooled):
+        assert _without_timestamp(result) == _without_timestamp(expected)
+
+
+def test_pool_answers_cache_hits_in_parent():
+    image = _encode(create_concrete_image(0.2))
+    cache = AnalysisResultCache()
+    pool = AnalysisPool(DamConditionAnalyzer(result_cache=cache), workers=2)
+    try:
+        first, second = pool.map([image, image])
+        third, = pool.map([image])
+    finally:
+        pool.shutdown()
+
+    assert first['status'] == 'success'
+    assert _without_timestamp(third) == _without_timestamp(first)
+    # Both copies in the first batch were dispatched before either finished
+    assert cache.stats()['hits'] == 1
+
+
+def test_unordered_yields_every_index_once():
+    images = [_encode(create_concrete_image(0.1, seed=seed)) for seed in range(4)]
+    pool = AnalysisPool(DamConditionAnalyzer(), workers=2, max_in_flight=2)
+    try:
+        unordered = dict(pool.imap_unordered(images))
+        ordered = dict(pool.imap(images))
+    finally:
+        pool.shutdown()
+
+    assert sorted(unordered) == list(range(len(images)))
+    for index in ordered:
+        assert unordered[index]['analysis'] == ordered[index]['analysis']
+
+
+def test_worker_timings_reach_parent_metrics():
+    images = [_encode(create_concrete_image(0.2, seed=seed)) for seed in range(2)]
+    registry = MetricsRegistry()
+    pool = AnalysisPool(DamConditionAnalyzer(metrics=registry), workers=2)
+    try:
+        plain = pool.map(images)
+        timed = pool.map(images, include_timings=True)
+    finally:
+        pool.shutdown()
+
+    assert all('timings' not in result for result in plain)
+    assert all(result['timings']['cracks'] > 0 for result in timed)
+    text = registry.render()
+    assert 'dam_analysis_stage_seconds_count{stage="cracks"} 4' in text
+    assert 'dam_analysis_images_total{outcome="success"} 4' in text
+
+
+def test_opencv_threads_split_across_workers():
+    pool = AnalysisPool(DamConditionAnalyzer(), workers=64)
+    assert pool.opencv_threads == 1
+    assert pool.max_in_flight == 128
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING ANALYSIS POOL")
+    print("=" * 60)
+    test_pool_matches_serial_in_order()
+    test_pool_answers_cache_hits_in_parent()
+    test_unordered_yields_every_index_once()
+    test_worker_timings_reach_parent_metrics()
+    test_opencv_threads_split_across_workers()
+    print("All analysis pool tests passed")
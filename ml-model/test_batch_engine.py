@@ -0,0 +1,173 @@
+"""
+Tests for the vectorized batch engine: stacked reports must equal
+analyze_image's, and vectorized statistics and scores the scalar ones
+"""
+
+import base64
+import cv2
+import numpy as np
+import fast_stats
+from batch_engine import BatchDamAnalyzer, FrameStack, HistogramBatch
+from dam_condition_analyzer import DETECTORS, SCORE_DEDUCTIONS, DamConditionAnalyzer
+from image_context import ImageContext
+from synthetic_corpus import VARIANTS, create_non_dam_image, create_variant
+
+
+def strip_volatile(result):
+    return {k: v for k, v in result.items() if k not in ('timestamp', 'next_inspection', 'timings')}
+
+
+def _frames(megapixels=0.1):
+    frames = [create_variant(variant, megapixels, seed=seed) for variant in VARIANTS for seed in (0, 1)]
+    # Invalid frames mixed into the batch are rejected on their own
+    frames.insert(3, create_non_dam_image('document', megapixels))
+    frames.append(create_non_dam_image('blank', megapixels))
+    return frames
+
+
+def _assert_matches_per_image(batch_analyzer, images, **options):
+    reference = DamConditionAnalyzer(validation_thumbnail_side=None, **options)
+    results = batch_analyzer.analyze_batch(images)
+    assert len(results) == len(images)
+    for index, (image, result) in enumerate(zip(images, results)):
+        assert strip_volatile(result) == strip_volatile(reference.analyze_image(image)), index
+
+
+def test_batch_matches_per_image_analysis():
+    frames = _frames()
+    for options in ({}, {'precision': 'float32'}, {'min_region_area': 20}, {'analysis_max_side': 200}):
+        engine = BatchDamAnalyzer(DamConditionAnalyzer(**options), chunk_pixels=1 << 19)
+        _assert_matches_per_image(engine, frames, **options)
+        gray = [cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY) for frame in frames]
+        _assert_matches_per_image(engine, gray, **options)
+
+    results = BatchDamAnalyzer().analyze_batch(frames)
+    assert [r['status'] for r in results].count('error') == 2
+    assert results[3]['error_type'] == 'ValidationError'
+
+
+def test_mixed_sizes_inputs_and_subsets():
+    small = create_variant('cracked', 0.05)
+    images = [create_variant('algae', 0.1), small, create_variant('moisture', 0.1), small.astype(np.float32)]
+    ok, encoded = cv2.imencode('.png', cv2.cvtColor(small, cv2.COLOR_RGB2BGR))
+    images.append(encoded.tobytes())
+    _assert_matches_per_image(BatchDamAnalyzer(), images)
+
+    results = BatchDamAnalyzer().analyze_batch(images[:3], detectors=['moisture', 'erosion'])
+    reference = DamConditionAnalyzer(validation_thumbnail_side=None)
+    for image, result in zip(images, results):
+        assert result['partial'] and result['detectors'] == ['moisture', 'erosion']
+        assert strip_volatile(result) == strip_volatile(reference.analyze_image(image, detectors='moisture,erosion'))
+
+    errors = BatchDamAnalyzer().analyze_batch(['not base64 image data', images[0]])
+    assert errors[0]['status'] == 'error' and errors[1]['status'] == 'success'
+
+
+def test_frames_without_regions_keep_counts():
+    frames = [create_variant(variant, 0.1, seed=1) for variant in ('concrete', 'moisture', 'cracked')]
+    # A washed-out frame is still a dam but has no pixel dark enough for the moisture mask
+    frames.insert(1, np.clip(frames[0] * 0.6 + 100, 0, 255).astype(np.uint8))
+    for options in ({}, {'min_region_area': 20}):
+        _assert_matches_per_image(BatchDamAnalyzer(DamConditionAnalyzer(**options)), frames, **options)
+
+    masks = np.zeros((3, 40, 50), dtype=bool)
+    masks[0, 5:10, 5:10] = masks[2, 5:10, 5:10] = masks[2, 20:30, 20:30] = True
+    assert list(FrameStack(np.zeros((3, 40, 50), dtype=np.uint8)).count_regions(masks)) == [2, 1, 3]
+
+
+def test_large_frames_pass_thumbnail_validation():
+    # Every stride-th pixel is vegetation: the stride thumbnail is green all
+    # over although the full frame is not, so only the thumbnail pass rejects
+    def gridded(seed):
+        frame = create_variant('concrete', 1.5, seed=seed)
+        step = max(frame.shape[:2]) // 384
+        frame[::step, ::step] = (40, 160, 40)
+        return frame
+
+    frames = [gridded(0), gridded(1), create_variant('concrete', 1.5, seed=2)]
+    assert DamConditionAnalyzer(validation_thumbnail_side=None).analyze_image(frames[0])['status'] == 'success'
+    reference = DamConditionAnalyzer()
+    _, jpeg = cv2.imencode('.jpg', cv2.cvtColor(frames[2], cv2.COLOR_RGB2BGR))
+    images = frames + [base64.b64encode(jpeg.tobytes()).decode()]
+
+    results = BatchDamAnalyzer(chunk_pixels=1 << 23).analyze_batch(images)
+    assert [result['status'] for result in results] == ['error', 'error', 'success', 'success']
+    for index, (image, result) in enumerate(zip(images, results)):
+        assert strip_volatile(result) == strip_volatile(reference.analyze_image(image)), index
+
+
+def test_batch_timings_are_per_image():
+    frames = [create_variant('concrete', 0.1, seed=seed) for seed in range(4)]
+    results = BatchDamAnalyzer().analyze_batch(frames, include_timings=True)
+    for result in results:
+        timings = result['timings']
+        assert set(DETECTORS) <= set(timings)
+        assert timings['total'] >= timings['validation'] + timings['detectors']
+
+
+def test_histogram_batch_matches_histogram():
+    rng = np.random.default_rng(3)
+    rows = [rng.integers(0, 256, size=(60, 80), dtype=np.uint8) for _ in range(3)]
+    rows.append(np.full((60, 80), 7, dtype=np.uint8))
+    batch = HistogramBatch([fast_stats.uint8_histogram(row).counts for row in rows])
+    for q in (0, 25, 75, 100):
+        quantiles = batch.quantile(q)
+        for index, row in enumerate(rows):
+            assert quantiles[index] == fast_stats.uint8_histogram(row).quantile(q)
+    for index, row in enumerate(rows):
+        hist = fast_stats.uint8_histogram(row)
+        assert batch.mean[index] == hist.mean
+        assert batch.variance[index] == hist.variance
+        assert batch.count_above(np.full(4, 100.5))[index] == hist.count_above(100.5)
+
+
+def test_stacked_filters_match_per_frame():
+    frames = np.stack([create_variant('cracked', 0.05, seed=seed) for seed in range(3)])
+    for precision in ('float64', 'float32'):
+        stack = FrameStack(frames, precision=precision)
+        for index, frame in enumerate(frames):
+            ctx = ImageContext(frame, precision=precision)
+            assert np.array_equal(stack.laplacian[index], ctx.laplacian)
+            assert stack.laplacian_variance[index] == ctx.laplacian_variance
+            if precision == 'float64':
+                assert stack.gradient_means[index] == ctx.gradient_mean
+            else:
+                # float32 cv2.magnitude rounds differently with buffer alignment
+                assert abs(stack.gradient_means[index] - ctx.gradient_mean) <= 1e-9 * ctx.gradient_mean
+        masks = stack.gray < 100
+        expected = [cv2.connectedComponents(mask.astype(np.uint8))[0] for mask in masks]
+        assert list(stack.count_regions(masks)) == expected
+
+
+def test_vectorized_scores_match_scalar():
+    analyzer = DamConditionAnalyzer()
+    rng = np.random.default_rng(0)
+    ladders = {'cracks': 4, 'surface_wear': 4, 'moisture': 3, 'structural_damage': 4, 'erosion': 4}
+    grades = {name: rng.integers(0, size, 200) for name, size in ladders.items()}
+    grades['algae_growth'] = rng.uniform(0, 30, 200)
+    scores = analyzer._calculate_overall_scores(grades)
+    levels = analyzer._get_condition_levels(scores)
+
+    for index in range(200):
+        results = {}
+        for name, (field, (_, labels), _) in SCORE_DEDUCTIONS.items():
+            results[name] = {field: labels[grades[name][index]]}
+        results['algae_growth'] = {'coverage': grades['algae_growth'][index]}
+        score = analyzer._calculate_overall_score(results)
+        assert scores[index] == score
+        assert levels[index] == analyzer._get_condition_level(score)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING BATCH ENGINE")
+    print("=" * 60)
+    test_batch_matches_per_image_analysis()
+    test_mixed_sizes_inputs_and_subsets()
+    test_frames_without_regions_keep_counts()
+    test_large_frames_pass_thumbnail_validation()
+    test_batch_timings_are_per_image()
+    test_histogram_batch_matches_histogram()
+    test_stacked_filters_match_per_frame()
+    test_vectorized_scores_match_scalar()
+    print("All batch engine tests passed")
@@ -0,0 +1,69 @@
+"""
+Tests for NDJSON streaming from /batch-analyze
+"""
+
+import base64
+import json
+import cv2
+from dam_analysis_api import app
+from synthetic_corpus import create_concrete_image
+
+
+def encode_base64(seed):
+    ok, buffer = cv2.imencode('.png', cv2.cvtColor(create_concrete_image(0.2, seed=seed), cv2.COLOR_RGB2BGR))
+    assert ok
+    return base64.b64encode(buffer.tobytes()).decode('utf-8')
+
+
+def test_stream_matches_buffered_batch():
+    images = [{'image': encode_base64(seed), 'dam_name': f'Dam {seed}'} for seed in range(2)]
+    images.append({'dam_name': 'Missing'})
+    client = app.test_client()
+
+    buffered = client.post('/batch-analyze', json={'images': images}).json
+    response = client.post('/batch-analyze?stream=1', json={'images': images})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+
+    summary = lines[-1]
+    assert summary == {key: buffered[key] for key in ('status', 'total', 'successful', 'failed')}
+    per_image = {line['index']: line for line in lines[:-1]}
+    assert sorted(per_image) == [0, 1, 2]
+    assert per_image[2]['status'] == 'error' and per_image[2]['dam_name'] == 'Missing'
+    for idx in (0, 1):
+        assert per_image[idx]['analysis'] == buffered['results'][idx]['analysis']
+        assert per_image[idx]['dam_metadata']['name'] == f'Dam {idx}'
+
+
+def test_malformed_entries_fail_alone():
+    images = [{'image': encode_base64(0), 'dam_name': 'Dam 0'}, 'not an object', None]
+    client = app.test_client()
+
+    response = client.post('/batch-analyze', json={'images': images})
+    assert response.status_code == 200
+    assert (response.json['successful'], response.json['failed']) == (1, 2)
+    assert [error['dam_name'] for error in response.json['errors']] == ['Dam_1', 'Dam_2']
+
+    lines = [json.loads(line) for line in client.post('/batch-analyze?stream=1', json={'images': images})
+             .data.decode('utf-8').splitlines()]
+    assert sorted(line['index'] for line in lines[:-1] if line['status'] == 'error') == [1, 2]
+    assert lines[-1]['failed'] == 2
+
+
+def test_accept_header_selects_stream():
+    client = app.test_client()
+    response = client.post('/batch-analyze', json={'images': [{'image': encode_base64(0)}]},
+                           headers={'Accept': 'application/x-ndjson'})
+    lines = response.data.decode('utf-8').splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[-1])['successful'] == 1
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING BATCH STREAMING")
+    print("=" * 60)
+    test_stream_matches_buffered_batch()
+    test_malformed_entries_fail_alone()
+    test_accept_header_selects_stream()
+    print("All batch streaming tests passed")
@@ -0,0 +1,67 @@
+"""
+Tests for binary (multipart and raw image/*) uploads to the dam analysis API
+"""
+
+import base64
+import io
+import cv2
+from dam_analysis_api import app
+from synthetic_corpus import create_concrete_image
+
+
+def encode_png():
+    image = create_concrete_image(0.3)
+    ok, buffer = cv2.imencode('.png', cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    assert ok
+    return buffer.tobytes()
+
+
+def test_binary_uploads_match_base64():
+    png = encode_png()
+    client = app.test_client()
+
+    as_json = client.post('/analyze-dam', json={
+        'image': 'data:image/png;base64,' + base64.b64encode(png).decode('utf-8'),
+        'dam_name': 'Test Dam'
+    })
+    as_multipart = client.post('/analyze-dam', data={
+        'image': (io.BytesIO(png), 'dam.png'),
+        'dam_name': 'Test Dam',
+        'construction_year': '1998'
+    }, content_type='multipart/form-data')
+    as_raw = client.post('/analyze-dam?dam_name=Test%20Dam', data=png, content_type='image/png')
+
+    for response in (as_json, as_multipart, as_raw):
+        assert response.status_code == 200, response.json
+        assert response.json['dam_metadata']['name'] == 'Test Dam'
+        assert response.json['analysis'] == as_json.json['analysis']
+    assert as_multipart.json['dam_metadata']['construction_year'] == 1998
+
+
+def test_batch_multipart_upload():
+    png = encode_png()
+    response = app.test_client().post('/batch-analyze', data={
+        'images': [(io.BytesIO(png), 'a.png'), (io.BytesIO(b'not an image'), 'b.png')],
+        'dam_name': ['First', 'Second']
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.json['total'] == 2
+    assert response.json['successful'] == 1
+    assert response.json['results'][0]['dam_metadata']['name'] == 'First'
+    assert response.json['errors'][0]['dam_name'] == 'Second'
+
+
+def test_empty_raw_body_is_rejected():
+    response = app.test_client().post('/analyze-dam', data=b'', content_type='image/jpeg')
+    assert response.status_code == 400
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING BINARY UPLOADS")
+    print("=" * 60)
+    test_binary_uploads_match_base64()
+    test_batch_multipart_upload()
+    test_empty_raw_body_is_rejected()
+    print("All binary upload tests passed")
@@ -0,0 +1,138 @@
+"""
+Tests for bulk offline analysis with checkpoint/resume
+"""
+
+import csv
+import json
+import os
+import tempfile
+import cv2
+from bulk_analyze import CSV_COLUMNS, bulk_analyze, find_images
+from dam_condition_analyzer import DamConditionAnalyzer
+from synthetic_corpus import create_dam_image, create_non_dam_image
+
+
+def _archive(root):
+    """Five dam photos and a document in nested directories, a truncated JPEG and a text file"""
+    os.makedirs(os.path.join(root, 'b', 'nested'))
+    images = {
+        'a1.png': create_dam_image(0.1, seed=1, cracks=4),
+        'a2.jpg': create_dam_image(0.1, seed=2, moisture=0.1),
+        'b/b1.png': create_dam_image(0.1, seed=3),
+        'b/nested/b2.png': create_dam_image(0.1, seed=4, algae=0.1),
+        'b/nested/doc.png': create_non_dam_image('document', 0.1),
+        'c.webp': create_dam_image(0.1, seed=5)
+    }
+    for name, image in images.items():
+        assert cv2.imwrite(os.path.join(root, name), cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    with open(os.path.join(root, 'broken.jpg'), 'wb') as f:
+        f.write(b'\xff\xd8 truncated')
+    with open(os.path.join(root, 'notes.txt'), 'w') as f:
+        f.write('not an image')
+    return images
+
+
+def _rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f]
+
+
+def test_jsonl_results_and_summary():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'archive')
+        images = _archive(root)
+        output = os.path.join(tmp, 'results.jsonl')
+        summary = bulk_analyze([root], output, workers=1, progress=None)
+        rows = {os.path.relpath(row['path'], root): row for row in _rows(output)}
+
+    assert len(rows) == summary['images'] == summary['analyzed'] == 7
+    assert (summary['success'], summary['rejected'], summary['error']) == (5, 1, 1)
+    assert summary['images_per_second'] > 0
+    assert rows['b/nested/doc.png']['error_type'] == 'ValidationError'
+    assert rows['broken.jpg']['status'] == 'error'
+
+    ok, encoded = cv2.imencode('.png', cv2.cvtColor(images['a1.png'], cv2.COLOR_RGB2BGR))
+    expected = DamConditionAnalyzer().analyze_image(encoded.tobytes())
+    assert rows['a1.png']['analysis'] == expected['analysis']
+    assert rows['a1.png']['bytes'] > 0 and 'total' in rows['a1.png']['timings']
+
+
+def test_resume_after_interruption():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'archive')
+        _archive(root)
+        output = os.path.join(tmp, 'results.jsonl')
+        analyzer = DamConditionAnalyzer()
+        analyze_image = analyzer.analyze_image
+        calls = []
+
+        def interrupted(*args, **kwargs):
+            if len(calls) == 4:
+                raise KeyboardInterrupt
+            calls.append(1)
+            return analyze_image(*args, **kwargs)
+        analyzer.analyze_image = interrupted
+        try:
+            bulk_analyze([root], output, analyzer, workers=1, checkpoint_every=2, progress=None)
+        except KeyboardInterrupt:
+            pass
+        assert len(_rows(output)) == 4
+
+        # A crash while writing leaves a partial line after the checkpoint
+        with open(output, 'a', encoding='utf-8') as f:
+            f.write('{"path": "half-written')
+        summary = bulk_analyze([root], output, DamConditionAnalyzer(), workers=1, progress=None)
+        assert (summary['skipped'], summary['analyzed']) == (4, 3)
+        paths = [row['path'] for row in _rows(output)]
+        assert sorted(paths) == sorted(find_images([root]))
+
+        summary = bulk_analyze([root], output, DamConditionAnalyzer(), workers=1, progress=None)
+        assert (summary['skipped'], summary['analyzed']) == (7, 0)
+
+
+def test_csv_output_and_analyzer_change():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'archive')
+        _archive(root)
+        output = os.path.join(tmp, 'results.csv')
+        bulk_analyze([root], output, workers=1, progress=None)
+        rows = _rows(output)
+        assert list(rows[0]) == CSV_COLUMNS
+        success = next(row for row in rows if row['path'].endswith('a1.png'))
+        assert success['status'] == 'success' and success['cracks_detected'] == 'True'
+        assert float(success['analysis_ms']) > 0
+
+        # Results of other analyzer settings are not mixed into the same file
+        try:
+            bulk_analyze([root], output, DamConditionAnalyzer(precision='float32'), workers=1, progress=None)
+            assert False, 'resumed with a different analyzer'
+        except ValueError as e:
+            assert '--restart' in str(e)
+        summary = bulk_analyze([root], output, DamConditionAnalyzer(precision='float32'), workers=1,
+                               restart=True, progress=None)
+        assert summary['skipped'] == 0 and len(_rows(output)) == 7
+
+
+def test_process_pool_matches_serial():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'archive')
+        _archive(root)
+        serial = os.path.join(tmp, 'serial.jsonl')
+        pooled = os.path.join(tmp, 'pooled.jsonl')
+        bulk_analyze([root], serial, workers=1, progress=None)
+        bulk_analyze([root], pooled, workers=2, progress=None)
+        by_path = lambda rows: {row['path']: (row['status'], row.get('analysis')) for row in rows}
+        assert by_path(_rows(serial)) == by_path(_rows(pooled))
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING BULK ANALYSIS")
+    print("=" * 60)
+    test_jsonl_results_and_summary()
+    test_resume_after_interruption()
+    test_csv_output_and_analyzer_change()
+    test_process_pool_matches_serial()
+    print("All bulk analysis tests passed")
@@ -0,0 +1,171 @@
+"""
+Tests for incremental change-detection analysis against previous inspections
+"""
+
+import io
+import os
+import tempfile
+import cv2
+import numpy as np
+import dam_analysis_api
+from change_detection import ChangeDetectionAnalyzer, InspectionStore, register, translate
+from dam_condition_analyzer import DamConditionAnalyzer
+from synthetic_corpus import create_non_dam_image, create_variant
+
+SCENE = create_variant('concrete', 1.2, seed=3)
+
+
+def _shot(dx=0, dy=0, brightness=0, patch=None, seed=0):
+    """A 1000x800 view of SCENE offset by (dx, dy) with sensor noise, optionally with a dark patch"""
+    rng = np.random.default_rng(seed)
+    image = SCENE[40 + dy:840 + dy, 40 + dx:1040 + dx].astype(np.int16)
+    image += brightness + rng.integers(-3, 4, image.shape)
+    if patch:
+        y, x = patch
+        image[y:y + 150, x:x + 200] -= 60
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def test_registration_recovers_shift():
+    dx, dy, response = register(_shot(), _shot(dx=8, dy=-4, seed=1))
+    assert (dx, dy) == (-8, 4)
+    assert response > 0.5
+    # Aligned, the views differ only by their sensor noise
+    aligned = translate(_shot(dx=8, dy=-4, seed=1), dx, dy)
+    difference = cv2.absdiff(aligned, _shot())[20:-20, 20:-20]
+    assert difference.max() <= 6
+
+
+def test_unchanged_inspection_reuses_every_cell():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = ChangeDetectionAnalyzer(store=InspectionStore(tmp))
+        first = engine.analyze('Test Dam', _shot(), include_timings=True)
+        assert first['status'] == 'success'
+        assert first['change_detection']['mode'] == 'full'
+        assert first['change_detection']['reason'] == 'no previous inspection'
+        assert first['change_detection']['cells'] == {'total': 16, 'changed': 16, 'reused': 0}
+        assert first['delta'] is None
+        assert 'validation' in first['timings']
+
+        # Camera moved slightly and the light changed: nothing to re-analyze
+        second = engine.analyze('Test Dam', _shot(dx=8, dy=-4, brightness=10, seed=1))
+        assert second['change_detection']['mode'] == 'incremental'
+        assert second['change_detection']['registration']['dx'] == -8
+        assert second['change_detection']['cells']['changed'] == 0
+        assert second['analysis'] == first['analysis']
+        assert second['delta']['condition_score']['change'] == 0
+        assert second['delta']['detectors'] == {} and second['delta']['cells'] == []
+
+
+def test_local_change_reanalyzes_nearby_cells():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = ChangeDetectionAnalyzer(store=InspectionStore(tmp))
+        first = engine.analyze('Test Dam', _shot())
+        report = engine.analyze('Test Dam', _shot(patch=(420, 560), seed=1))
+
+    change = report['change_detection']
+    assert change['mode'] == 'incremental'
+    assert change['changed_cells'] == [[1, 2], [2, 2]]
+    assert change['cells'] == {'total': 16, 'changed': 2, 'reused': 14}
+    assert [(cell['row'], cell['col']) for cell in report['delta']['cells']] == [(1, 2), (2, 2)]
+    assert report['delta']['since'] == first['timestamp']
+    for name, fields in report['delta']['detectors'].items():
+        for field, values in fields.items():
+            assert values == {'previous': first['analysis'][name][field],
+                              'current': report['analysis'][name][field]}
+    # The dark patch's edges read as cracks
+    assert report['delta']['detectors']['cracks']['coverage']['current'] > first['analysis']['cracks']['coverage']
+
+    # Close to analyzing the new image from scratch
+    full = DamConditionAnalyzer().analyze_image(_shot(patch=(420, 560), seed=1))
+    assert abs(report['condition_score'] - full['condition_score']) < 2
+
+
+def test_fallback_to_full_analysis():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = InspectionStore(tmp)
+        ChangeDetectionAnalyzer(store=store).analyze('Test Dam', _shot())
+        resized = cv2.resize(_shot(), (800, 640), interpolation=cv2.INTER_AREA)
+        report = ChangeDetectionAnalyzer(store=store).analyze('Test Dam', resized)
+        assert report['change_detection']['reason'] == 'image size changed'
+
+        ChangeDetectionAnalyzer(store=store).analyze('Test Dam', _shot())
+        other = ChangeDetectionAnalyzer(DamConditionAnalyzer(precision='float32'), store=store)
+        assert other.analyze('Test Dam', _shot())['change_detection']['reason'] == 'analyzer changed'
+
+        previous = store.load('Test Dam')[2]
+        rotated = np.ascontiguousarray(_shot()[::-1, ::-1])
+        report = other.analyze('Test Dam', rotated)
+        assert report['change_detection']['mode'] == 'full'
+        # Unaligned views are still compared with the previous inspection as a whole
+        assert report['change_detection']['reason'] == 'registration failed'
+        assert report['delta']['since'] == previous['timestamp']
+        assert report['delta']['condition_score']['previous'] == previous['condition_score']
+        assert report['delta']['cells'] is None
+
+        # Another dam has its own reference
+        report = other.analyze('Other Dam', _shot())
+        assert report['change_detection']['reason'] == 'no previous inspection'
+
+
+def test_store_round_trip_and_rejection():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = InspectionStore(tmp)
+        engine = ChangeDetectionAnalyzer(store=store)
+        assert store.load('Test Dam') is None
+        report = engine.analyze('Test Dam', _shot())
+        image, cells, metadata = store.load('Test Dam')
+        assert np.array_equal(image, _shot())
+        assert len(cells) == 16
+        assert metadata['condition_score'] == report['condition_score']
+        assert metadata['tile_scores'] == sum(report['tiles']['scores'], [])
+
+        # A rejected upload leaves the stored inspection alone
+        rejected = engine.analyze('Test Dam', create_non_dam_image('document', 0.8))
+        assert rejected['status'] == 'error' and rejected['error_type'] == 'ValidationError'
+        assert store.load('Test Dam')[2]['timestamp'] == report['timestamp']
+        assert len(os.listdir(store._dam_dir('Test Dam'))) == 2
+
+        # So does one that only full-resolution validation rejects, even
+        # though it registers against the stored view
+        rng = np.random.default_rng(0)
+        noisy = np.clip(_shot() + rng.integers(-100, 101, _shot().shape), 0, 255).astype(np.uint8)
+        expected = DamConditionAnalyzer().analyze_image(noisy)
+        assert expected['status'] == 'error'
+        assert engine.analyze('Test Dam', noisy) == expected
+        assert store.load('Test Dam')[2]['timestamp'] == report['timestamp']
+
+
+def test_incremental_api():
+    ok, buffer = cv2.imencode('.png', cv2.cvtColor(_shot(), cv2.COLOR_RGB2BGR))
+    client = dam_analysis_api.app.test_client()
+    original = dam_analysis_api.change_analyzer
+    with tempfile.TemporaryDirectory() as tmp:
+        dam_analysis_api.change_analyzer = ChangeDetectionAnalyzer(dam_analysis_api.analyzer, InspectionStore(tmp))
+        try:
+            responses = [client.post('/analyze-dam', data={
+                'image': (io.BytesIO(buffer.tobytes()), 'dam.png'),
+                'dam_name': 'Test Dam',
+                'incremental': 'true'
+            }, content_type='multipart/form-data') for _ in range(2)]
+            missing_name = client.post('/analyze-dam?incremental=1', data=buffer.tobytes(), content_type='image/png')
+        finally:
+            dam_analysis_api.change_analyzer = original
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert [response.json['change_detection']['mode'] for response in responses] == ['full', 'incremental']
+    assert responses[1].json['dam_metadata']['name'] == 'Test Dam'
+    assert missing_name.status_code == 400
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING CHANGE DETECTION")
+    print("=" * 60)
+    test_registration_recovers_shift()
+    test_unchanged_inspection_reuses_every_cell()
+    test_local_change_reanalyzes_nearby_cells()
+    test_fallback_to_full_analysis()
+    test_store_round_trip_and_rejection()
+    test_incremental_api()
+    print("All change detection tests passed")
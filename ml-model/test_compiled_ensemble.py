@@ -0,0 +1,234 @@
+"""
+Tests for the compiled NumPy evaluator of the risk prediction ensemble
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.neural_network import MLPClassifier
+import api_server
+from compiled_ensemble import CompiledEnsemble, compile_ensemble
+from model_registry import load_model_set
+from train_model import DamMonitoringMLModel
+
+
+def _train(activation='relu'):
+    """Small models of the production types, fitted as train_model.py fits them"""
+    model = DamMonitoringMLModel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame = model.generate_training_data(800)
+    raw = frame[model.feature_names].to_numpy()
+    scaled = model.scaler.fit_transform(raw)
+    labels = frame['riskLevel'].to_numpy()
+    model.rf_model = RandomForestClassifier(n_estimators=12, max_depth=8, min_samples_leaf=2,
+                                            random_state=0).fit(scaled, labels)
+    model.gb_model = GradientBoostingClassifier(n_estimators=15, max_depth=3, random_state=0).fit(scaled, labels)
+    model.nn_model = MLPClassifier(hidden_layer_sizes=(16, 8), activation=activation, max_iter=300,
+                                   random_state=0).fit(scaled, labels)
+    return model, raw
+
+
+MODEL, RAW = _train()
+SCALED = MODEL.scaler.transform(RAW)
+
+
+def _inputs(scaled):
+    """Training rows, rows far outside the training range and rows sitting exactly on split thresholds"""
+    rng = np.random.default_rng(0)
+    thresholds = MODEL.rf_model.estimators_[0].tree_
+    on_split = np.zeros((len(thresholds.feature), scaled.shape[1]))
+    internal = thresholds.feature >= 0
+    on_split[np.flatnonzero(internal), thresholds.feature[internal]] = thresholds.threshold[internal]
+    return np.vstack([scaled, rng.normal(0, 5, (200, scaled.shape[1])), on_split])
+
+
+def _assert_matches_sklearn(compiled, X, model=MODEL):
+    """Compiled probabilities for X against the scaler and sklearn models"""
+    rf, gb, nn = compiled.predict_proba(X)
+    if compiled.raw_inputs:
+        X = model.scaler.transform(X)
+    assert np.abs(rf - model.rf_model.predict_proba(X)).max() < 1e-9
+    assert np.abs(gb - model.gb_model.predict_proba(X)).max() < 1e-9
+    assert np.abs(nn - model.nn_model.predict_proba(X)).max() < 1e-9
+
+
+def test_matches_sklearn():
+    compiled = compile_ensemble(MODEL.rf_model, MODEL.gb_model, MODEL.nn_model)
+    X = _inputs(SCALED)
+    _assert_matches_sklearn(compiled, X)
+    # Single rows and blocks smaller than a batch give the same answers
+    _assert_matches_sklearn(compiled, X[:1])
+    rows = np.vstack([np.hstack(compiled.predict_proba(X[i:i + 1])) for i in range(0, 50)])
+    assert np.abs(rows - np.hstack(compiled.predict_proba(X[:50]))).max() < 1e-12
+
+    model, raw = _train(activation='tanh')
+    _assert_matches_sklearn(compile_ensemble(model.rf_model, model.gb_model, model.nn_model),
+                            model.scaler.transform(raw), model)
+
+
+def test_folded_scaler_matches_pipeline():
+    compiled = compile_ensemble(MODEL.rf_model, MODEL.gb_model, MODEL.nn_model, scaler=MODEL.scaler)
+    assert compiled.raw_inputs and compiled.manifest['inputs'] == 'raw'
+    rng = np.random.default_rng(1)
+    outliers = RAW.mean(axis=0) + rng.normal(0, 10, (200, RAW.shape[1])) * RAW.std(axis=0)
+    _assert_matches_sklearn(compiled, np.vstack([RAW, outliers]))
+
+    # Readings on, just above and just below every folded split are routed like their scaled values
+    feature, threshold = compiled.arrays['gb_feature'], compiled.arrays['gb_threshold']
+    split = np.isfinite(threshold)
+    rows = np.repeat(RAW[:1], 3 * split.sum(), axis=0)
+    for block, values in enumerate((threshold[split], np.nextafter(threshold[split], np.inf),
+                                    np.nextafter(threshold[split], -np.inf))):
+        rows[block * split.sum() + np.arange(split.sum()), feature[split]] = values
+    _assert_matches_sklearn(compiled, rows)
+    assert np.array_equal(compiled._gradient_boosting(rows),
+                          compile_ensemble(MODEL.rf_model, MODEL.gb_model, MODEL.nn_model)._gradient_boosting(
+                              MODEL.scaler.transform(rows).astype(np.float32).astype(np.float64)))
+
+    model, raw = _train(activation='logistic')
+    _assert_matches_sklearn(compile_ensemble(model.rf_model, model.gb_model, model.nn_model, scaler=model.scaler),
+                            raw, model)
+
+    try:
+        compiled.predict_proba(np.full((1, RAW.shape[1]), np.nan))
+        assert False, 'accepted a missing value'
+    except ValueError:
+        pass
+
+
+def test_predict_risk_uses_folded_models():
+    sensor_data = dict(zip(MODEL.feature_names, RAW[3].tolist()))
+    expected = MODEL.predict_risk(sensor_data)
+    original = MODEL.compiled_model
+    try:
+        MODEL.compiled_model = compile_ensemble(MODEL.rf_model, MODEL.gb_model, MODEL.nn_model, scaler=MODEL.scaler)
+        result = MODEL.predict_risk(sensor_data)
+    finally:
+        MODEL.compiled_model = original
+    for key in expected['probabilities']:
+        assert abs(result['probabilities'][key] - expected['probabilities'][key]) < 1e-9
+    assert result['riskLevel'] == expected['riskLevel'] and result['models'] == expected['models']
+
+
+def test_save_and_load():
+    with tempfile.TemporaryDirectory() as tmp:
+        compile_ensemble(MODEL.rf_model, MODEL.gb_model, MODEL.nn_model, trained_date='2026-01-01').save(tmp)
+        loaded = CompiledEnsemble.load(tmp)
+        assert loaded.manifest['trained_date'] == '2026-01-01'
+        assert loaded.manifest['rf']['trees'] == 12 and loaded.manifest['gb']['stages'] == 15
+        _assert_matches_sklearn(loaded, SCALED)
+
+        # Memory-mapped arrays are read-only, and a new export replaces the
+        # files without touching the ones already mapped
+        mapped = CompiledEnsemble.load(tmp, mmap_mode='r')
+        assert not any(array.flags.writeable for array in mapped.arrays.values())
+        before = np.hstack(mapped.predict_proba(SCALED))
+        model, _ = _train(activation='tanh')
+        compile_ensemble(model.rf_model, model.gb_model, model.nn_model).save(tmp)
+        assert np.array_equal(np.hstack(mapped.predict_proba(SCALED)), before)
+        assert not np.array_equal(np.hstack(CompiledEnsemble.load(tmp, mmap_mode='r').predict_proba(SCALED)), before)
+        assert not [name for name in os.listdir(tmp) if name.endswith('.tmp')]
+
+        with open(os.path.join(tmp, 'manifest.json')) as f:
+            manifest = json.load(f)
+        manifest['format_version'] = 99
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            CompiledEnsemble.load(tmp)
+            assert False, 'loaded an unknown format'
+        except ValueError:
+            pass
+
+    try:
+        compile_ensemble(MODEL.rf_model, MODEL.gb_model, MODEL.nn_model).predict_proba(SCALED[:, :5])
+        assert False, 'accepted the wrong number of features'
+    except ValueError:
+        pass
+
+
+class _Unavailable:
+    def predict_proba(self, X):
+        raise AssertionError('sklearn model used')
+
+
+def test_api_uses_compiled_model_for_small_batches():
+    # Scaler applied by the server, then folded into the models
+    compiled = compile_ensemble(MODEL.rf_model, MODEL.gb_model, MODEL.nn_model)
+    readings = [dict(zip(MODEL.feature_names, row)) for row in RAW[:20].tolist()]
+    names = ('rf_model', 'gb_model', 'nn_model', 'scaler', 'compiled_model', 'COMPILED_MAX_ROWS')
+    original = {name: getattr(api_server, name) for name in names}
+    client = api_server.app.test_client()
+    try:
+        api_server.scaler = MODEL.scaler
+        api_server.COMPILED_MAX_ROWS = 20
+        api_server.rf_model = api_server.gb_model = api_server.nn_model = _Unavailable()
+        api_server.compiled_model = compiled
+        scaled = client.post('/predict-batch', json={'sensorData': readings})
+        api_server.compiled_model = compile_ensemble(MODEL.rf_model, MODEL.gb_model, MODEL.nn_model,
+                                                     scaler=MODEL.scaler)
+        single = client.post('/predict', json={'sensorData': readings[0]})
+        small = client.post('/predict-batch', json={'sensorData': readings})
+        assert single.status_code == small.status_code == scaled.status_code == 200
+
+        # Larger batches are answered by sklearn
+        api_server.rf_model, api_server.gb_model, api_server.nn_model = MODEL.rf_model, MODEL.gb_model, MODEL.nn_model
+        api_server.COMPILED_MAX_ROWS = 10
+        large = client.post('/predict-batch', json={'sensorData': readings})
+    finally:
+        for name, value in original.items():
+            setattr(api_server, name, value)
+
+    assert single.json['data']['riskScore'] == small.json['data']['results'][0]['riskScore']
+    for folded, unfolded in zip(small.json['data']['results'], scaled.json['data']['results']):
+        assert abs(folded['prediction'].pop('probability') - unfolded['prediction'].pop('probability')) < 1e-9
+        assert folded == unfolded
+    for compiled_result, sklearn_result in zip(small.json['data']['results'], large.json['data']['results']):
+        assert compiled_result['riskLevel'] == sklearn_result['riskLevel']
+        assert abs(compiled_result['riskScore'] - sklearn_result['riskScore']) <= 0.01
+
+
+def test_train_model_exports_compiled_models():
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            MODEL.save_models(tmp)
+        with open(os.path.join(tmp, 'metadata.json')) as f:
+            metadata = json.load(f)
+        try:
+            exported = load_model_set(tmp).compiled_model
+            assert exported.manifest['trained_date'] == metadata['trained_date']
+            assert 'arrays' not in exported.manifest and exported.raw_inputs
+            _assert_matches_sklearn(exported, RAW)
+            loaded = DamMonitoringMLModel()
+            with contextlib.redirect_stdout(io.StringIO()):
+                loaded.load_models(tmp)
+            assert loaded.compiled_model.raw_inputs
+
+            # An export from another training run is not used
+            with open(os.path.join(tmp, 'metadata.json'), 'w') as f:
+                json.dump({**metadata, 'trained_date': 'later'}, f)
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert load_model_set(tmp).compiled_model.manifest['trained_date'] == 'later'
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                MODEL.save_models(tmp, fold_scaler=False)
+            assert not CompiledEnsemble.load(os.path.join(tmp, 'compiled')).raw_inputs
+        finally:
+            MODEL.compiled_model = None
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING COMPILED ENSEMBLE")
+    print("=" * 60)
+    test_matches_sklearn()
+    test_folded_scaler_matches_pipeline()
+    test_predict_risk_uses_folded_models()
+    test_save_and_load()
+    test_api_uses_compiled_model_for_small_batches()
+    test_train_model_exports_compiled_models()
+    print("All compiled ensemble tests passed")
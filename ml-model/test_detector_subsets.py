@@ -0,0 +1,86 @@
+"""
+Tests for analyzing a subset of detectors
+"""
+
+import base64
+import cv2
+import dam_condition_analyzer
+from dam_condition_analyzer import DETECTORS, DamConditionAnalyzer
+from image_context import ImageContext
+from dam_analysis_api import app
+from synthetic_corpus import create_variant
+
+
+def test_subset_matches_full_analysis():
+    image = create_variant('moisture', 0.5)
+    analyzer = DamConditionAnalyzer()
+    full = analyzer.analyze_image(image)
+    subset = analyzer.analyze_image(image, detectors=['moisture', 'cracks'])
+
+    assert subset['partial'] is True
+    assert subset['detectors'] == ['cracks', 'moisture']
+    assert list(subset['analysis']) == ['cracks', 'moisture']
+    for name in subset['detectors']:
+        assert subset['analysis'][name] == full['analysis'][name]
+    assert 'partial' not in full and list(full['analysis']) == list(DETECTORS)
+
+
+def test_partial_score_only_counts_requested_detectors():
+    analyzer = DamConditionAnalyzer()
+    results = {'cracks': {'detected': True, 'severity': 'Moderate', 'coverage': 5.0}}
+    assert analyzer._calculate_overall_score(results) == 75
+    recommendations = analyzer._get_recommendations(1, results)
+    assert len(recommendations) == 1 and 'cracks' in recommendations[0]
+
+
+def test_skipped_detectors_are_not_computed():
+    contexts = []
+
+    class RecordingContext(ImageContext):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            contexts.append(self)
+
+    dam_condition_analyzer.ImageContext = RecordingContext
+    try:
+        DamConditionAnalyzer().analyze_image(create_variant('concrete', 0.3), detectors=['cracks'])
+    finally:
+        dam_condition_analyzer.ImageContext = ImageContext
+
+    computed = set(contexts[-1]._cache)
+    assert 'crack_edges' in computed
+    assert not computed & {'sobel_x', 'sobel_y', 'gradient_magnitude', 'gradient_mean'}
+
+
+def test_unknown_detector_is_rejected():
+    result = DamConditionAnalyzer().analyze_image(create_variant('concrete', 0.1), detectors=['cracks', 'rust'])
+    assert result['status'] == 'error' and 'rust' in result['message']
+
+
+def test_api_accepts_detector_lists_and_strings():
+    ok, buffer = cv2.imencode('.png', cv2.cvtColor(create_variant('concrete', 0.3), cv2.COLOR_RGB2BGR))
+    png = buffer.tobytes()
+    client = app.test_client()
+
+    as_json = client.post('/analyze-dam', json={
+        'image': base64.b64encode(png).decode('utf-8'),
+        'detectors': ['erosion']
+    })
+    as_raw = client.post('/analyze-dam?detectors=erosion,cracks', data=png, content_type='image/png')
+    invalid = client.post('/analyze-dam?detectors=rust', data=png, content_type='image/png')
+
+    assert as_json.status_code == 200 and list(as_json.json['analysis']) == ['erosion']
+    assert as_raw.json['detectors'] == ['cracks', 'erosion']
+    assert invalid.status_code == 400 and 'rust' in invalid.json['error']
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING DETECTOR SUBSETS")
+    print("=" * 60)
+    test_subset_matches_full_analysis()
+    test_partial_score_only_counts_requested_detectors()
+    test_skipped_detectors_are_not_computed()
+    test_unknown_detector_is_rejected()
+    test_api_accepts_detector_lists_and_strings()
+    print("All detector subset tests passed")
@@ -0,0 +1,59 @@
+"""
+Tests for histogram-based statistics against exact numpy results
+"""
+
+import numpy as np
+import cv2
+import fast_stats
+
+
+def test_uint8_statistics_are_exact():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        data = rng.integers(0, rng.integers(1, 257), rng.integers(1, 5000)).astype(np.uint8)
+        hist = fast_stats.uint8_histogram(data)
+        assert hist.count == data.size
+        assert abs(hist.mean - np.mean(data)) < 1e-9
+        assert abs(hist.variance - np.var(data)) < 1e-6
+        for q in (0, 25, 50, 75, 100):
+            assert abs(hist.quantile(q) - np.percentile(data, q)) < 1e-9
+
+
+def test_laplacian_threshold_is_exact():
+    gray = np.random.default_rng(1).integers(0, 256, (300, 400), dtype=np.uint8)
+    magnitude = np.abs(cv2.Laplacian(gray, cv2.CV_64F))
+    hist = fast_stats.laplacian_magnitude_histogram(magnitude)
+    threshold = hist.quantile(75)
+    assert threshold == np.percentile(magnitude, 75)
+    assert hist.count_above(threshold) == np.count_nonzero(magnitude > threshold)
+
+
+def test_fixed_bin_error_bound():
+    data = np.random.default_rng(2).gamma(2.0, 30.0, 20000)
+    lo, hi, bins = 0.0, float(data.max()) + 1, 512
+    hist = fast_stats.fixed_bin_histogram(data, lo, hi, bins)
+    width = (hi - lo) / bins
+    for q in (1, 25, 50, 75, 99):
+        assert abs(hist.quantile(q) - np.percentile(data, q)) < width
+    assert abs(hist.mean - data.mean()) < width
+    assert abs(hist.std - data.std()) < width
+
+
+def test_histograms_merge():
+    rng = np.random.default_rng(3)
+    a = rng.integers(0, 256, 1000, dtype=np.uint8)
+    b = rng.integers(0, 256, 3000, dtype=np.uint8)
+    merged = fast_stats.uint8_histogram(a) + fast_stats.uint8_histogram(b)
+    both = np.concatenate([a, b])
+    assert merged.quantile(25) == np.percentile(both, 25)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING FAST STATISTICS")
+    print("=" * 60)
+    test_uint8_statistics_are_exact()
+    test_laplacian_threshold_is_exact()
+    test_fixed_bin_error_bound()
+    test_histograms_merge()
+    print("All fast statistics tests passed")
@@ -0,0 +1,63 @@
+"""
+Tests for the shared per-request image context
+"""
+
+import numpy as np
+import cv2
+from image_context import ImageContext
+from dam_condition_analyzer import DamConditionAnalyzer
+
+
+def create_structure_image():
+    """Structured image that passes validation"""
+    img = np.zeros((500, 500, 3), dtype=np.uint8)
+    cv2.rectangle(img, (50, 100), (450, 400), (120, 120, 120), -1)
+    cv2.line(img, (100, 200), (400, 200), (80, 80, 80), 3)
+    cv2.line(img, (100, 250), (400, 250), (80, 80, 80), 3)
+    cv2.line(img, (100, 300), (400, 300), (80, 80, 80), 3)
+    cv2.circle(img, (250, 250), 20, (60, 60, 60), -1)
+    return img
+
+
+def test_representations_are_computed_once():
+    ctx = ImageContext(create_structure_image())
+    for name in ['gray', 'hsv', 'laplacian', 'laplacian_magnitude',
+                 'sobel_x', 'sobel_y', 'gradient_magnitude',
+                 'structure_edges', 'crack_edges']:
+        first = getattr(ctx, name)
+        assert getattr(ctx, name) is first, name
+
+
+def test_representations_match_opencv():
+    img = create_structure_image()
+    ctx = ImageContext(img)
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    assert np.array_equal(ctx.gray, gray)
+    assert np.array_equal(ctx.hsv, cv2.cvtColor(img, cv2.COLOR_RGB2HSV))
+    assert np.array_equal(ctx.laplacian, cv2.Laplacian(gray, cv2.CV_64F))
+    assert np.array_equal(ctx.structure_edges, cv2.Canny(gray, 100, 200))
+
+
+def test_grayscale_input():
+    gray = cv2.cvtColor(create_structure_image(), cv2.COLOR_RGB2GRAY)
+    ctx = ImageContext(gray)
+    assert not ctx.is_color
+    assert ctx.gray is gray
+    assert ctx.hsv is None
+
+
+def test_analyzer_uses_context():
+    result = DamConditionAnalyzer().analyze_image(create_structure_image())
+    assert result['status'] == 'success'
+    assert result['analysis']['cracks']['severity'] == 'Moderate'
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING IMAGE CONTEXT")
+    print("=" * 60)
+    test_representations_are_computed_once()
+    test_representations_match_opencv()
+    test_grayscale_input()
+    test_analyzer_uses_context()
+    print("All image context tests passed")
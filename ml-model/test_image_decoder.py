@@ -0,0 +1,100 @@
+"""
+Tests for format-aware image decoding
+"""
+
+import base64
+import io
+import numpy as np
+from PIL import Image
+from dam_condition_analyzer import DamConditionAnalyzer
+from image_decoder import decode_image, decode_thumbnail, read_header, sniff_format
+from synthetic_corpus import create_concrete_image
+
+
+def _save(image, fmt, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **params)
+    return buffer.getvalue()
+
+
+def test_headers_without_decoding():
+    image = Image.fromarray(create_concrete_image(0.2))
+    for fmt, name in (('JPEG', 'jpeg'), ('PNG', 'png'), ('WEBP', 'webp'), ('BMP', 'bmp'), ('TIFF', 'tiff')):
+        header = read_header(_save(image, fmt))
+        assert header.format == name
+        assert (header.width, header.height) == image.size
+        assert not header.grayscale
+    lossless = read_header(_save(image, 'WEBP', lossless=True))
+    assert (lossless.width, lossless.height) == image.size
+    assert read_header(_save(image.convert('L'), 'JPEG')).grayscale
+    assert read_header(_save(image.convert('LA'), 'PNG')).grayscale
+    assert sniff_format(b'not an image') is None
+    assert read_header(b'not an image') is None
+
+
+def test_modes_normalized_in_one_decode():
+    rgb = create_concrete_image(0.2)
+    image = Image.fromarray(rgb)
+    # Alpha is dropped and palettes are expanded
+    assert np.array_equal(decode_image(_save(image.convert('RGBA'), 'PNG')), rgb)
+    paletted = image.convert('P')
+    assert np.array_equal(decode_image(_save(paletted, 'PNG')), np.asarray(paletted.convert('RGB')))
+    # Grayscale sources stay single-channel, 16-bit samples are reduced to 8 bits
+    gray = np.asarray(image.convert('L'))
+    assert np.array_equal(decode_image(_save(image.convert('LA'), 'PNG')), gray)
+    wide = Image.fromarray(gray.astype(np.uint16) * 257)
+    assert np.array_equal(decode_image(_save(wide, 'PNG')), gray)
+    # Lossless formats round-trip exactly
+    for fmt in ('BMP', 'TIFF', 'GIF'):
+        decoded = decode_image(_save(image if fmt != 'GIF' else paletted, fmt))
+        assert decoded.shape == rgb.shape and decoded.dtype == np.uint8
+
+
+def test_jpeg_matches_pil_decode():
+    data = _save(Image.fromarray(create_concrete_image(0.3)), 'JPEG', quality=90)
+    assert np.array_equal(decode_image(data), np.asarray(Image.open(io.BytesIO(data))))
+
+
+def test_thumbnail_decode_only_for_large_jpegs():
+    image = Image.fromarray(create_concrete_image(2))
+    thumbnail = decode_thumbnail(_save(image, 'JPEG'), 384)
+    # 1632 x 1224 decodes at 1/4 scale
+    assert thumbnail.shape == (306, 408, 3)
+    assert decode_thumbnail(_save(image.convert('L'), 'JPEG'), 384).shape == (306, 408)
+    assert decode_thumbnail(_save(image, 'JPEG'), 1000) is None
+    assert decode_thumbnail(_save(image, 'PNG', compress_level=1), 384) is None
+
+
+def test_base64_and_bytes_uploads_agree():
+    analyzer = DamConditionAnalyzer()
+    image = Image.fromarray(create_concrete_image(0.3)).convert('RGBA')
+    data = _save(image, 'PNG')
+    from_bytes = analyzer.analyze_image(data, include_timings=True)
+    from_base64 = analyzer.analyze_image(base64.b64encode(data).decode('ascii'), include_timings=True)
+    assert from_bytes['status'] == 'success'
+    assert from_base64['analysis'] == from_bytes['analysis']
+    assert 'base64_decode' in from_base64['timings']
+    assert 'base64_decode' not in from_bytes['timings']
+    assert from_bytes['timings']['decode'] > 0
+
+    # PIL images are normalized the same way
+    assert analyzer.analyze_image(image)['analysis'] == from_bytes['analysis']
+
+
+def test_corrupt_data_is_an_error():
+    result = DamConditionAnalyzer().analyze_image(b'\xff\xd8\xff' + b'\x00' * 64)
+    assert result['status'] == 'error'
+    assert result['error_type'] == 'ValueError'
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING IMAGE DECODER")
+    print("=" * 60)
+    test_headers_without_decoding()
+    test_modes_normalized_in_one_decode()
+    test_jpeg_matches_pil_decode()
+    test_thumbnail_decode_only_for_large_jpegs()
+    test_base64_and_bytes_uploads_agree()
+    test_corrupt_data_is_an_error()
+    print("All image decoder tests passed")
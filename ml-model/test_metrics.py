@@ -0,0 +1,88 @@
+"""
+Tests for stage timing instrumentation and the /metrics endpoint
+"""
+
+import base64
+import cv2
+from metrics import MetricsRegistry, StageTimer
+from dam_condition_analyzer import DamConditionAnalyzer
+from dam_analysis_api import app
+from synthetic_corpus import create_concrete_image
+
+STAGES = ('decode', 'validation', 'cracks', 'surface_wear', 'moisture', 'algae_growth',
+          'structural_damage', 'erosion', 'scoring', 'total')
+
+
+def encode_png():
+    ok, buffer = cv2.imencode('.png', cv2.cvtColor(create_concrete_image(0.2), cv2.COLOR_RGB2BGR))
+    assert ok
+    return buffer.tobytes()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.05, 2.0):
+        registry.observe('decode', seconds)
+    registry.count_outcome('success')
+    text = registry.render()
+
+    assert 'dam_analysis_stage_seconds_bucket{stage="decode",le="0.01"} 1' in text
+    assert 'dam_analysis_stage_seconds_bucket{stage="decode",le="0.1"} 3' in text
+    assert 'dam_analysis_stage_seconds_bucket{stage="decode",le="+Inf"} 4' in text
+    assert 'dam_analysis_stage_seconds_count{stage="decode"} 4' in text
+    assert 'dam_analysis_images_total{outcome="success"} 1' in text
+
+
+def test_analyzer_times_every_stage():
+    registry = MetricsRegistry()
+    analyzer = DamConditionAnalyzer(metrics=registry)
+    result = analyzer.analyze_image(encode_png(), include_timings=True)
+
+    assert result['status'] == 'success'
+    assert set(STAGES) <= set(result['timings'])
+    detectors = sum(result['timings'][name] for name in STAGES[1:-1])
+    assert detectors <= result['timings']['total']
+    text = registry.render()
+    for stage in STAGES:
+        assert f'dam_analysis_stage_seconds_count{{stage="{stage}"}} 1' in text
+
+    # Timings stay out of results unless asked for
+    assert 'timings' not in analyzer.analyze_image(encode_png())
+
+
+def test_stage_timer_accumulates_repeated_stages():
+    timer = StageTimer()
+    with timer.stage('decode'):
+        pass
+    first = timer.timings['decode']
+    with timer.stage('decode'):
+        pass
+    assert timer.timings['decode'] >= first
+    timer.stop()
+    assert timer.timings['total'] >= timer.timings['decode']
+
+
+def test_metrics_endpoint_and_debug_flag():
+    client = app.test_client()
+    image = base64.b64encode(encode_png()).decode('utf-8')
+
+    plain = client.post('/analyze-dam', json={'image': image})
+    debug = client.post('/analyze-dam?debug=1', json={'image': image})
+    assert 'timings' not in plain.json
+    assert 'cache_lookup' in debug.json['timings']
+    assert 'serialization;dur=' in debug.headers['Server-Timing']
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    assert 'dam_analysis_stage_seconds_count{stage="serialization"}' in response.data.decode('utf-8')
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING METRICS")
+    print("=" * 60)
+    test_histogram_buckets_are_cumulative()
+    test_analyzer_times_every_stage()
+    test_stage_timer_accumulates_repeated_stages()
+    test_metrics_endpoint_and_debug_flag()
+    print("All metrics tests passed")
@@ -0,0 +1,236 @@
+"""
+Tests for the versioned model registry and hot model swaps in the risk prediction API
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.neural_network import MLPClassifier
+import api_server
+from model_registry import ModelRegistry
+from train_model import DamMonitoringMLModel
+
+READING = {'waterLevel': 88, 'pressure': 95, 'seepage': 6, 'rainfall': 70}
+
+
+def _model(seed):
+    """Small models of the production types; different seeds predict differently"""
+    model = DamMonitoringMLModel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame = model.generate_training_data(600)
+    scaled = model.scaler.fit_transform(frame[model.feature_names].to_numpy())
+    labels = frame['riskLevel'].to_numpy()
+    model.rf_model = RandomForestClassifier(n_estimators=5 + seed, max_depth=5, random_state=seed).fit(scaled, labels)
+    model.gb_model = GradientBoostingClassifier(n_estimators=5, max_depth=2, random_state=seed).fit(scaled, labels)
+    model.nn_model = MLPClassifier(hidden_layer_sizes=(8,), max_iter=100, random_state=seed).fit(scaled, labels)
+    return model
+
+
+MODELS = [_model(seed) for seed in (1, 2)]
+
+
+def _add(registry, model):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return registry.add(model.save_models)
+
+
+@contextlib.contextmanager
+def _server(registry):
+    """api_server following registry, with its original models restored afterwards"""
+    original = (api_server.registry, api_server.ADMIN_TOKEN, api_server.active_models())
+    api_server.registry, api_server.ADMIN_TOKEN = registry, 'secret'
+    client = api_server.app.test_client()
+    client.environ_base['HTTP_X_ADMIN_TOKEN'] = 'secret'
+    try:
+        yield client
+    finally:
+        api_server.registry, api_server.ADMIN_TOKEN = original[:2]
+        api_server.install_models(original[2])
+
+
+def test_versions_activate_and_rollback():
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ModelRegistry(tmp)
+        assert registry.path() == tmp and registry.active() is None and registry.versions() == []
+        first, second = _add(registry, MODELS[0]), _add(registry, MODELS[1])
+        assert first != second and registry.active() is None
+        assert [entry['version'] for entry in registry.versions()] == [first, second]
+        assert os.path.exists(os.path.join(registry.path(second), 'compiled', 'manifest.json'))
+
+        registry.activate(first)
+        registry.activate(second)
+        assert registry.active() == second and registry.previous() == first
+        assert [entry['active'] for entry in registry.versions()] == [False, True]
+        assert registry.rollback() == first and registry.active() == first
+        try:
+            registry.rollback()
+            assert False, 'rolled back past the first activation'
+        except ValueError:
+            pass
+
+        for version in ('missing', '../versions', '.staging-x'):
+            try:
+                registry.activate(version)
+                assert False, version
+            except KeyError:
+                pass
+
+        # A failed save leaves no version behind
+        def fail(path):
+            raise RuntimeError('disk full')
+        try:
+            registry.add(fail)
+        except RuntimeError:
+            pass
+        assert len(os.listdir(registry.versions_dir)) == 2
+
+
+def test_registry_without_fcntl():
+    # Windows has no fcntl; the registry must still import and update
+    original = sys.modules.get('fcntl')
+    sys.modules['fcntl'] = None
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = ModelRegistry(tmp)
+            first, second = _add(registry, MODELS[0]), _add(registry, MODELS[1])
+            registry.activate(first)
+            registry.activate(second)
+            assert registry.rollback() == first
+    finally:
+        if original is None:
+            del sys.modules['fcntl']
+        else:
+            sys.modules['fcntl'] = original
+
+
+def test_models_endpoint_activates_and_rolls_back():
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ModelRegistry(tmp)
+        first, second = _add(registry, MODELS[0]), _add(registry, MODELS[1])
+        registry.activate(first)
+        with _server(registry) as client:
+            api_server.reload_models()
+            listing = client.get('/models').json['data']
+            assert listing['active'] == listing['loaded'] == first
+            before = client.post('/predict', json={'sensorData': READING}).json['data']['probabilities']
+
+            response = client.post(f'/models/{second}/activate')
+            assert response.status_code == 200 and response.json['data']['loaded'] == second
+            assert registry.active() == second
+            after = client.post('/predict', json={'sensorData': READING}).json['data']['probabilities']
+            assert after != before
+
+            response = client.post('/models/rollback')
+            assert response.status_code == 200 and response.json['data']['loaded'] == first
+            assert client.post('/predict', json={'sensorData': READING}).json['data']['probabilities'] == before
+            assert client.post('/models/rollback').status_code == 400
+
+            assert client.post('/models/missing/activate').status_code == 404
+            # A broken version is rejected and the served models stay in place
+            os.remove(os.path.join(registry.path(second), 'random_forest.pkl'))
+            response = client.post(f'/models/{second}/activate')
+            assert response.status_code == 400 and response.json['success'] is False
+            assert registry.active() == api_server.loaded_version == first
+
+            assert client.get('/models', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+            # Without a configured token, nobody can switch models
+            api_server.ADMIN_TOKEN = None
+            assert client.post('/models/rollback').status_code == 403
+            assert client.get('/models').status_code == 403
+            assert registry.active() == api_server.loaded_version == first
+
+
+def test_stale_loads_are_not_installed():
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ModelRegistry(tmp)
+        first, second, third = [_add(registry, model) for model in MODELS + MODELS[:1]]
+        registry.activate(first)
+        original_warm_up = api_server.warm_up
+        with _server(registry) as client:
+            api_server.reload_models()
+            try:
+                # The watcher loads second while an admin activates third
+                registry.activate(second)
+                def activate_meanwhile(models):
+                    api_server.warm_up = original_warm_up
+                    original_warm_up(models)
+                    assert client.post(f'/models/{third}/activate').status_code == 200
+                api_server.warm_up = activate_meanwhile
+                assert api_server.reload_models() is None
+                assert registry.active() == api_server.loaded_version == third
+
+                # The version disappears while it is loaded
+                def delete_meanwhile(models):
+                    original_warm_up(models)
+                    shutil.rmtree(registry.path(models.version))
+                api_server.warm_up = delete_meanwhile
+                response = client.post(f'/models/{second}/activate')
+                assert response.status_code == 404 and response.json['success'] is False
+                assert registry.active() == api_server.loaded_version == third
+                api_server.warm_up = original_warm_up
+
+                def read_only(state):
+                    raise OSError('Read-only file system')
+                registry._write = read_only
+                response = client.post(f'/models/{first}/activate')
+                assert response.status_code == 500 and 'Read-only' in response.json['error']
+                assert registry.active() == api_server.loaded_version == third
+            finally:
+                api_server.warm_up = original_warm_up
+
+
+def test_requests_see_one_version_during_swaps():
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ModelRegistry(tmp)
+        versions = [_add(registry, model) for model in MODELS]
+        registry.activate(versions[0])
+        with _server(registry) as client:
+            expected = {}
+            for version in versions:
+                registry.activate(version)
+                # Activated elsewhere, e.g. by train_model.py; picked up by the registry watcher
+                assert api_server.reload_models() in (version, None) and api_server.loaded_version == version
+                data = client.post('/predict-batch', json={'sensorData': [READING] * 3}).json['data']
+                expected[version] = [result['riskScore'] for result in data['results']]
+            assert expected[versions[0]] != expected[versions[1]]
+
+            results, errors, done = [], [], threading.Event()
+
+            def requests():
+                thread_client = api_server.app.test_client()
+                while not done.is_set():
+                    response = thread_client.post('/predict-batch', json={'sensorData': [READING] * 3})
+                    if response.status_code != 200:
+                        errors.append(response.json)
+                    else:
+                        results.append([result['riskScore'] for result in response.json['data']['results']])
+
+            threads = [threading.Thread(target=requests) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            try:
+                for index in range(6):
+                    assert client.post(f'/models/{versions[index % 2]}/activate').status_code == 200
+            finally:
+                done.set()
+                for thread in threads:
+                    thread.join()
+        assert not errors and results
+        assert all(scores in expected.values() for scores in results)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING MODEL REGISTRY")
+    print("=" * 60)
+    test_versions_activate_and_rollback()
+    test_registry_without_fcntl()
+    test_models_endpoint_activates_and_rolls_back()
+    test_stale_loads_are_not_installed()
+    test_requests_see_one_version_during_swaps()
+    print("All model registry tests passed")
@@ -0,0 +1,73 @@
+"""
+Tests for running the detectors of one image concurrently
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import dam_condition_analyzer
+from image_context import ImageContext
+from dam_condition_analyzer import DamConditionAnalyzer
+from synthetic_corpus import VARIANTS, create_concrete_image, create_variant
+
+
+def strip_volatile(result):
+    return {k: v for k, v in result.items() if k not in ('timestamp', 'next_inspection', 'timings')}
+
+
+def test_parallel_matches_serial():
+    serial = DamConditionAnalyzer()
+    parallel = DamConditionAnalyzer(parallel_detectors=True)
+    # Six threads even on single-core hosts, so detectors really interleave
+    shared = dam_condition_analyzer._detector_executor
+    dam_condition_analyzer._detector_executor = ThreadPoolExecutor(max_workers=6)
+    try:
+        for variant in VARIANTS:
+            image = create_variant(variant, 0.5, seed=3)
+            assert strip_volatile(parallel.analyze_image(image)) == strip_volatile(serial.analyze_image(image)), \
+                variant
+
+        # Downscaled contexts start empty, so detectors race for every representation
+        image = create_concrete_image(2)
+        assert (strip_volatile(parallel.analyze_image(image, analysis_max_side=800)) ==
+                strip_volatile(serial.analyze_image(image, analysis_max_side=800)))
+    finally:
+        dam_condition_analyzer._detector_executor.shutdown()
+        dam_condition_analyzer._detector_executor = shared
+
+
+def test_context_computes_once_under_contention():
+    ctx = ImageContext(create_concrete_image(0.2))
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def compute():
+        calls.append(threading.get_ident())
+        return object()
+
+    def read():
+        barrier.wait()
+        return ctx._memoize('shared', compute)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        values = list(executor.map(lambda _: read(), range(8)))
+    assert len(calls) == 1
+    assert all(value is values[0] for value in values)
+
+
+def test_parallel_timings_cover_every_detector():
+    result = DamConditionAnalyzer(parallel_detectors=True).analyze_image(create_concrete_image(0.3),
+                                                                         include_timings=True)
+    timings = result['timings']
+    for name in ('cracks', 'surface_wear', 'moisture', 'algae_growth', 'structural_damage', 'erosion'):
+        assert name in timings
+    assert timings['detectors'] <= timings['total']
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING PARALLEL DETECTORS")
+    print("=" * 60)
+    test_parallel_matches_serial()
+    test_context_computes_once_under_contention()
+    test_parallel_timings_cover_every_detector()
+    print("All parallel detector tests passed")
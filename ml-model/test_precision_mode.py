@@ -0,0 +1,86 @@
+"""
+Tests for the float32/int16 precision mode against the float64 reference
+"""
+
+import os
+import tempfile
+import tracemalloc
+import numpy as np
+from image_context import ImageContext
+from dam_condition_analyzer import DamConditionAnalyzer
+from tiled_analyzer import TiledDamAnalyzer
+from synthetic_corpus import VARIANTS, create_concrete_image, create_variant
+
+
+def strip_volatile(result):
+    return {k: v for k, v in result.items() if k not in ('timestamp', 'next_inspection')}
+
+
+def test_context_statistics_match_float64():
+    image = create_concrete_image(1.5, seed=2)
+    reference = ImageContext(image)
+    compact = ImageContext(image, precision='float32')
+
+    assert compact.laplacian.dtype == np.int16
+    assert np.array_equal(compact.laplacian, reference.laplacian)
+    assert np.array_equal(compact.laplacian_histogram.counts, reference.laplacian_histogram.counts)
+    assert abs(compact.laplacian_variance - reference.laplacian_variance) <= 1e-9 * reference.laplacian_variance
+    assert abs(compact.gradient_mean - reference.gradient_mean) <= 1e-6 * reference.gradient_mean
+
+    region = (slice(37, 811), slice(5, 400))
+    expected = reference.gradient_sum(region)
+    assert abs(compact.gradient_sum(region) - expected) <= 1e-6 * expected
+    assert 'gradient_magnitude' not in compact._cache
+
+
+def test_analysis_matches_float64_on_corpus():
+    reference = DamConditionAnalyzer()
+    compact = DamConditionAnalyzer(precision='float32')
+    for variant in VARIANTS:
+        for megapixels in (0.3, 2):
+            image = create_variant(variant, megapixels, seed=1)
+            assert strip_volatile(compact.analyze_image(image)) == strip_volatile(reference.analyze_image(image)), \
+                (variant, megapixels)
+
+
+def test_float32_halves_peak_memory():
+    image = create_concrete_image(2)
+    peaks = {}
+    for precision in ('float64', 'float32'):
+        analyzer = DamConditionAnalyzer(precision=precision)
+        tracemalloc.start()
+        analyzer.analyze_image(image)
+        peaks[precision] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert peaks['float32'] < 0.5 * peaks['float64'], peaks
+
+
+def test_tiled_float32_matches_float64():
+    image = create_concrete_image(0.5)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ortho.npy')
+        np.save(path, image)
+        reference = TiledDamAnalyzer(tile_size=256).analyze_file(path)
+        compact = TiledDamAnalyzer(DamConditionAnalyzer(precision='float32'), tile_size=256).analyze_file(path)
+    assert compact['analysis'] == reference['analysis']
+
+
+def test_unknown_precision_is_rejected():
+    try:
+        DamConditionAnalyzer(precision='float16')
+    except ValueError as e:
+        assert 'precision' in str(e)
+    else:
+        raise AssertionError('float16 precision was accepted')
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING PRECISION MODE")
+    print("=" * 60)
+    test_context_statistics_match_float64()
+    test_analysis_matches_float64_on_corpus()
+    test_float32_halves_peak_memory()
+    test_tiled_float32_matches_float64()
+    test_unknown_precision_is_rejected()
+    print("All precision mode tests passed")
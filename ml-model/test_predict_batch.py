@@ -0,0 +1,108 @@
+"""
+Tests for the vectorized /predict-batch endpoint of the risk prediction API
+"""
+
+import contextlib
+import io
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import StandardScaler
+import api_server
+from train_model import DamMonitoringMLModel
+
+
+def _train():
+    """Small models of the production types on synthetic readings"""
+    model = DamMonitoringMLModel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame = model.generate_training_data(800)
+    features = frame[model.feature_names].to_numpy()
+    scaler = StandardScaler().fit(features)
+    scaled = scaler.transform(features)
+    labels = frame['riskLevel'].to_numpy()
+    return {
+        'rf_model': RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0).fit(scaled, labels),
+        'gb_model': GradientBoostingClassifier(n_estimators=10, max_depth=3, random_state=0).fit(scaled, labels),
+        'nn_model': MLPClassifier(hidden_layer_sizes=(16, 8), max_iter=300, random_state=0).fit(scaled, labels),
+        'scaler': scaler
+    }, frame[model.feature_names].to_dict('records')
+
+
+MODELS, READINGS = _train()
+
+
+@contextlib.contextmanager
+def _models(**overrides):
+    """Install the test models (and any overrides) as the server's globals"""
+    values = {**MODELS, **overrides}
+    original = {name: getattr(api_server, name) for name in values}
+    for name, value in values.items():
+        setattr(api_server, name, value)
+    try:
+        yield api_server.app.test_client()
+    finally:
+        for name, value in original.items():
+            setattr(api_server, name, value)
+
+
+def _without_timestamps(data):
+    return {key: value for key, value in data.items() if key not in ('timestamp', 'modelVersion')}
+
+
+def test_batch_matches_single_predictions():
+    readings = READINGS[:60] + [
+        {},
+        {'waterLevel': 95, 'rainfall': 120},
+        {'pressure': 130, 'seepage': 11, 'structuralStress': 92, 'waterLevel': 97}
+    ]
+    with _models() as client:
+        batch = client.post('/predict-batch', json={'sensorData': readings})
+        singles = [client.post('/predict', json={'sensorData': reading}).json['data'] for reading in readings]
+
+    assert batch.status_code == 200
+    data = batch.json['data']
+    assert data['count'] == len(readings) == len(data['results'])
+    assert 'timestamp' in data and 'modelVersion' in data
+    for result, single in zip(data['results'], singles):
+        # The MLP's matrix products may round differently by the last bit in a batch
+        assert abs(result['prediction'].pop('probability') - single['prediction'].pop('probability')) < 1e-12
+        assert result == _without_timestamps(single)
+    # Every risk level and recommendation path is exercised
+    assert {result['riskLevel'] for result in data['results']} == {0, 1, 2, 3}
+    assert any(len(result['recommendations']) > 3 for result in data['results'])
+
+
+def test_recommendations_match_generate_recommendations():
+    rows = np.array([[api_server.feature_defaults[name] for name in api_server.feature_names]] * 8, dtype=float)
+    rows[1:, api_server.feature_names.index('waterLevel')] = 90
+    rows[2:, api_server.feature_names.index('rainfall')] = 85.25
+    levels = np.array([0, 1, 2, 3, 0, 1, 2, 3])
+    batch = api_server.batch_recommendations(rows, levels)
+    for row, level, recommendations in zip(rows, levels, batch):
+        sensor_data = dict(zip(api_server.feature_names, row.tolist()))
+        assert recommendations == api_server.generate_recommendations(sensor_data, int(level))
+
+
+def test_invalid_batches():
+    with _models(MAX_BATCH_ROWS=5) as client:
+        for body in ({}, {'sensorData': []}, {'sensorData': {'waterLevel': 50}}, {'sensorData': [1, 2]},
+                     {'sensorData': [{'waterLevel': 'high'}]}, {'sensorData': [{}, {'ph': None}]},
+                     {'sensorData': [{}] * 6}):
+            response = client.post('/predict-batch', json=body)
+            assert response.status_code == 400, body
+            assert response.json['success'] is False
+        assert 'reading 1' in client.post('/predict-batch', json={'sensorData': [{}, {'ph': None}]}).json['error']
+
+    with _models(rf_model=None) as client:
+        assert client.post('/predict-batch', json={'sensorData': [{}]}).status_code == 500
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING BATCH PREDICTION")
+    print("=" * 60)
+    test_batch_matches_single_predictions()
+    test_recommendations_match_generate_recommendations()
+    test_invalid_batches()
+    print("All batch prediction tests passed")
@@ -0,0 +1,144 @@
+"""
+Tests for the pre-fork server of the risk prediction API
+"""
+
+import contextlib
+import io
+import json
+import os
+import queue
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.neural_network import MLPClassifier
+from benchmark_model_loading import free_port, memory_mb
+from model_registry import ModelRegistry
+from train_model import DamMonitoringMLModel
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Enables the /models endpoints of the servers started by the tests
+ADMIN_TOKEN = 'test-token'
+
+
+def _save_models(path, seed=0):
+    """Small models of the production types, saved as train_model.py saves them"""
+    model = DamMonitoringMLModel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame = model.generate_training_data(600)
+        scaled = model.scaler.fit_transform(frame[model.feature_names].to_numpy())
+        labels = frame['riskLevel'].to_numpy()
+        model.rf_model = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=seed).fit(scaled, labels)
+        model.gb_model = GradientBoostingClassifier(n_estimators=10, max_depth=3, random_state=seed).fit(scaled, labels)
+        model.nn_model = MLPClassifier(hidden_layer_sizes=(16,), max_iter=200, random_state=seed).fit(scaled, labels)
+        model.save_models(path)
+
+
+class _Server:
+    """prefork_server.py in a subprocess, with its output read on a thread"""
+
+    def __init__(self, model_dir, workers, *options, env=None):
+        self.port = free_port()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(BASE_DIR, 'prefork_server.py'), '--host', '127.0.0.1',
+             '--port', str(self.port), '--workers', str(workers), *options],
+            env=dict(os.environ, DAM_MODEL_DIR=model_dir, PYTHONUNBUFFERED='1', **(env or {})),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        self.lines = queue.Queue()
+        threading.Thread(target=lambda: [self.lines.put(line) for line in self.process.stdout], daemon=True).start()
+
+    def wait_for(self, pattern, count=1, timeout=60):
+        """Matches of pattern in the next output lines, until count were seen"""
+        matches = []
+        deadline = time.monotonic() + timeout
+        while len(matches) < count:
+            matches += re.findall(pattern, self.lines.get(timeout=max(0.1, deadline - time.monotonic())))
+        return matches
+
+    def request(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(f'http://127.0.0.1:{self.port}{path}', data=data,
+                                         headers={'Content-Type': 'application/json', 'X-Admin-Token': ADMIN_TOKEN})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        return self.process.wait(30)
+
+
+def test_preloaded_workers_serve_and_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        _save_models(tmp)
+        server = _Server(tmp, 2)
+        try:
+            workers = [int(pid) for pid in server.wait_for(r'Worker (\d+) ready', 2)]
+            status, health = server.request('/health')
+            assert status == 200 and health['models_loaded'] is True
+            for _ in range(4):
+                status, prediction = server.request('/predict', {'sensorData': {'waterLevel': 95, 'rainfall': 120}})
+                assert status == 200 and prediction['success'] is True
+            # Workers share the parent's pages instead of loading their own copy
+            parent_rss = memory_mb(server.process.pid)[0]
+            assert all(memory_mb(pid)[1] < parent_rss for pid in workers)
+
+            os.kill(workers[0], signal.SIGKILL)
+            replacement = int(server.wait_for(r'Worker (\d+) ready')[0])
+            assert replacement not in workers
+            assert server.request('/predict', {'sensorData': {}})[0] == 200
+        finally:
+            assert server.stop() == 0
+        for pid in workers[1:] + [replacement]:
+            assert not os.path.exists(f'/proc/{pid}')
+
+
+def test_workers_load_models_without_preload():
+    with tempfile.TemporaryDirectory() as tmp:
+        _save_models(tmp)
+        server = _Server(tmp, 2, '--no-preload')
+        try:
+            assert len(server.wait_for(r'Worker (\d+) ready', 2)) == 2
+            status, batch = server.request('/predict-batch', {'sensorData': [{}, {'waterLevel': 95}]})
+            assert status == 200 and batch['data']['count'] == 2
+        finally:
+            assert server.stop() == 0
+
+
+def test_workers_follow_registry_activations():
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ModelRegistry(tmp)
+        first = registry.add(_save_models)
+        second = registry.add(lambda path: _save_models(path, seed=1))
+        registry.activate(first)
+        server = _Server(tmp, 2, env={'DAM_MODEL_POLL_SECONDS': '0.2', 'DAM_ADMIN_TOKEN': ADMIN_TOKEN})
+        try:
+            workers = [int(pid) for pid in server.wait_for(r'Worker (\d+) ready', 2)]
+            assert server.request('/models')[1]['data']['loaded'] == first
+
+            # Activated by another process (train_model.py); workers switch without a restart
+            registry.activate(second)
+            server.wait_for(r'Switched to model version', 2)
+            assert {server.request('/models')[1]['data']['loaded'] for _ in range(6)} == {second}
+
+            # A replacement worker forked from the parent catches up before serving
+            os.kill(workers[0], signal.SIGKILL)
+            server.wait_for(r'Worker (\d+) ready')
+            assert {server.request('/models')[1]['data']['loaded'] for _ in range(6)} == {second}
+        finally:
+            assert server.stop() == 0
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING PRE-FORK SERVER")
+    print("=" * 60)
+    test_preloaded_workers_serve_and_restart()
+    test_workers_load_models_without_preload()
+    test_workers_follow_registry_activations()
+    print("All pre-fork server tests passed")
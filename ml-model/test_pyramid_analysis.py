@@ -0,0 +1,64 @@
+"""
+Tests for resolution-capped (pyramid) analysis
+"""
+
+import numpy as np
+from image_context import pyramid_downscale
+from dam_condition_analyzer import DamConditionAnalyzer
+from synthetic_corpus import create_concrete_image
+
+
+def test_pyramid_downscale_caps_longest_side():
+    image = np.zeros((1500, 4000, 3), dtype=np.uint8)
+    reduced, scale = pyramid_downscale(image, 1024)
+    assert reduced.shape[:2] == (384, 1024)
+    assert abs(scale - 1024 / 4000) < 1e-9
+
+    same, scale = pyramid_downscale(image, 4000)
+    assert same is image and scale == 1.0
+
+
+def test_capped_analysis_reports_resolution():
+    image = create_concrete_image(2)
+    analyzer = DamConditionAnalyzer()
+
+    full = analyzer.analyze_image(image)
+    capped = analyzer.analyze_image(image, analysis_max_side=1024)
+
+    assert full['status'] == 'success' and capped['status'] == 'success'
+    assert 'analysis_resolution' not in full
+    assert capped['analysis_resolution']['width'] == 1024
+    assert capped['overall_condition'] == full['overall_condition']
+
+
+def test_cap_above_image_size_is_identical():
+    image = create_concrete_image(0.3)
+    analyzer = DamConditionAnalyzer()
+    full = analyzer.analyze_image(image)
+    capped = analyzer.analyze_image(image, analysis_max_side=4096)
+    assert full['analysis'] == capped['analysis']
+
+
+def test_min_region_area_filters_small_regions():
+    mask = np.zeros((100, 100), dtype=np.uint8)
+    mask[10:20, 10:20] = 1
+    mask[50, 50] = 1
+    ctx = type('Ctx', (), {'scale': 1.0})()
+
+    assert DamConditionAnalyzer()._count_regions(mask, ctx) == 3
+    assert DamConditionAnalyzer(min_region_area=4)._count_regions(mask, ctx) == 2
+
+    # A 10x10 region at half scale stands for 400 original pixels
+    ctx.scale = 0.5
+    assert DamConditionAnalyzer(min_region_area=500)._count_regions(mask, ctx) == 1
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING PYRAMID ANALYSIS")
+    print("=" * 60)
+    test_pyramid_downscale_caps_longest_side()
+    test_capped_analysis_reports_resolution()
+    test_cap_above_image_size_is_identical()
+    test_min_region_area_filters_small_regions()
+    print("All pyramid analysis tests passed")
@@ -0,0 +1,94 @@
+"""
+Tests for the content-addressed analysis result cache
+"""
+
+import os
+import tempfile
+import time
+import cv2
+import dam_condition_analyzer
+from dam_condition_analyzer import DamConditionAnalyzer
+from result_cache import AnalysisResultCache
+from synthetic_corpus import create_concrete_image
+
+
+def encode_png(megapixels=0.5):
+    image = create_concrete_image(megapixels)
+    return cv2.imencode('.png', cv2.cvtColor(image, cv2.COLOR_RGB2BGR))[1].tobytes()
+
+
+def test_duplicate_upload_is_served_from_cache():
+    cache = AnalysisResultCache()
+    analyzer = DamConditionAnalyzer(result_cache=cache)
+    png = encode_png()
+
+    start = time.perf_counter()
+    first = analyzer.analyze_image(png)
+    miss_time = time.perf_counter() - start
+    start = time.perf_counter()
+    second = analyzer.analyze_image(memoryview(png))
+    hit_time = time.perf_counter() - start
+
+    assert first == second
+    assert hit_time < miss_time / 10
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    # Callers may annotate results without affecting the cache
+    second['dam_metadata'] = {'name': 'Edited'}
+    assert 'dam_metadata' not in analyzer.analyze_image(png)
+
+
+def test_options_and_fingerprint_are_part_of_the_key():
+    cache = AnalysisResultCache()
+    png = encode_png()
+    DamConditionAnalyzer(result_cache=cache).analyze_image(png)
+    DamConditionAnalyzer(result_cache=cache).analyze_image(png, analysis_max_side=256)
+    DamConditionAnalyzer(min_region_area=9, result_cache=cache).analyze_image(png)
+    assert cache.stats()['misses'] == 3 and cache.stats()['hits'] == 0
+
+
+def test_fingerprint_follows_version_and_settings():
+    fingerprint = DamConditionAnalyzer().fingerprint
+    assert DamConditionAnalyzer().fingerprint == fingerprint
+    assert DamConditionAnalyzer(precision='float32').fingerprint != fingerprint
+    original = dam_condition_analyzer.ANALYZER_VERSION
+    dam_condition_analyzer.ANALYZER_VERSION = original + '-next'
+    try:
+        assert DamConditionAnalyzer().fingerprint != fingerprint
+    finally:
+        dam_condition_analyzer.ANALYZER_VERSION = original
+
+
+def test_lru_eviction_and_ttl():
+    cache = AnalysisResultCache(max_entries=2, ttl_seconds=0.2)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, {'value': key})
+    assert cache.get('a') is None
+    assert cache.get('c') == {'value': 'c'}
+    assert cache.stats()['evictions'] == 1
+
+    time.sleep(0.25)
+    assert cache.get('c') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_disk_tier_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        AnalysisResultCache(disk_dir=tmp).put('abc123', {'status': 'success'})
+        assert os.path.exists(os.path.join(tmp, 'ab', 'abc123.json'))
+
+        restarted = AnalysisResultCache(disk_dir=tmp)
+        assert restarted.get('abc123') == {'status': 'success'}
+        assert restarted.stats()['disk_hits'] == 1
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING RESULT CACHE")
+    print("=" * 60)
+    test_duplicate_upload_is_served_from_cache()
+    test_options_and_fingerprint_are_part_of_the_key()
+    test_fingerprint_follows_version_and_settings()
+    test_lru_eviction_and_ttl()
+    test_disk_tier_survives_restart()
+    print("All result cache tests passed")
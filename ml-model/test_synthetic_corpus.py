@@ -0,0 +1,50 @@
+"""
+Tests for the synthetic benchmark corpus and baseline comparison
+"""
+
+import numpy as np
+from dam_condition_analyzer import DamConditionAnalyzer
+from synthetic_corpus import VARIANTS, create_concrete_image, create_dam_image, create_variant
+from benchmark_analyzer import compare, run_benchmark
+
+
+def test_variants_pass_validation_and_show_their_features():
+    analyzer = DamConditionAnalyzer()
+    results = {variant: analyzer.analyze_image(create_variant(variant, 0.3)) for variant in VARIANTS}
+    for variant, result in results.items():
+        assert result['status'] == 'success', (variant, result.get('message'))
+
+    concrete = results['concrete']['analysis']
+    assert results['moisture']['analysis']['moisture']['level'] == 'High'
+    assert concrete['moisture']['level'] == 'Low'
+    assert results['algae']['analysis']['algae_growth']['detected']
+    assert not concrete['algae_growth']['detected']
+
+
+def test_features_do_not_change_the_base_image():
+    base = create_concrete_image(0.2, seed=5)
+    assert np.array_equal(create_dam_image(0.2, seed=5), base)
+    assert not np.array_equal(create_dam_image(0.2, seed=5, cracks=10), base)
+
+
+def test_compare_flags_regressions():
+    results = run_benchmark([0.1], ['concrete'], repeat=1, isolate=False, log=lambda line: None)
+    case = results['cases'][0]
+    assert case['status'] == 'success'
+    assert {'decode', 'cracks', 'total'} <= set(case['stages_ms'])
+
+    slower = {'cases': [dict(case, latency_ms={'median': case['latency_ms']['median'] * 2})]}
+    _, regressions = compare(slower, results, tolerance=0.15)
+    assert len(regressions) == 1 and 'latency' in regressions[0]
+    _, regressions = compare(results, results, tolerance=0.15)
+    assert regressions == []
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING SYNTHETIC CORPUS")
+    print("=" * 60)
+    test_variants_pass_validation_and_show_their_features()
+    test_features_do_not_change_the_base_image()
+    test_compare_flags_regressions()
+    print("All synthetic corpus tests passed")
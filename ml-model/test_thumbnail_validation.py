@@ -0,0 +1,125 @@
+"""
+Tests for thumbnail-first validation: verdicts must agree with validation
+at full resolution, and rejected uploads must skip the full decode
+"""
+
+import base64
+import cv2
+import numpy as np
+from dam_condition_analyzer import DamConditionAnalyzer
+from image_context import stride_thumbnail
+from synthetic_corpus import NON_DAM_KINDS, VARIANTS, create_non_dam_image, create_variant
+
+
+def _encode(image, ext):
+    ok, encoded = cv2.imencode(ext, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    assert ok
+    return encoded.tobytes()
+
+
+def _corpus(megapixels):
+    images = [(variant, create_variant(variant, megapixels)) for variant in VARIANTS]
+    return images + [(kind, create_non_dam_image(kind, megapixels)) for kind in NON_DAM_KINDS]
+
+
+def _verdict(result):
+    return result['status'], result.get('message')
+
+
+def measure_agreement(sizes=(1, 6), inputs=('array', '.jpg', '.png')):
+    """
+    Validation verdicts with and without the thumbnail pass on the
+    synthetic corpus. Returns (agreement ratio, disagreeing cases).
+    """
+    reference = DamConditionAnalyzer(validation_thumbnail_side=None)
+    thumbnail_first = DamConditionAnalyzer()
+    cases = 0
+    disagreements = []
+    for megapixels in sizes:
+        for name, image in _corpus(megapixels):
+            for kind in inputs:
+                data = image if kind == 'array' else _encode(image, kind)
+                # One cheap detector: only the validation verdict matters here
+                expected = _verdict(reference.analyze_image(data, detectors='erosion'))
+                actual = _verdict(thumbnail_first.analyze_image(data, detectors='erosion'))
+                cases += 1
+                if actual != expected:
+                    disagreements.append((megapixels, name, kind, expected, actual))
+    return (cases - len(disagreements)) / cases, disagreements
+
+
+def test_thumbnail_verdicts_match_full_resolution():
+    agreement, disagreements = measure_agreement()
+    assert agreement == 1.0, disagreements
+
+
+def test_valid_image_analysis_unchanged():
+    image = _encode(create_variant('cracked', 2), '.jpg')
+    reference = DamConditionAnalyzer(validation_thumbnail_side=None).analyze_image(image)
+    result = DamConditionAnalyzer().analyze_image(image)
+    assert result['status'] == 'success'
+    for key in ('timestamp', 'next_inspection'):
+        reference.pop(key)
+        result.pop(key)
+    assert result == reference
+
+
+def test_jpeg_rejection_skips_full_decode():
+    analyzer = DamConditionAnalyzer()
+
+    def full_decode(image_bytes):
+        raise AssertionError('full image decoded')
+    analyzer._decode_image_bytes = full_decode
+
+    image = _encode(create_non_dam_image('landscape', 2), '.jpg')
+    result = analyzer.analyze_image(image, include_timings=True)
+    assert result['error_type'] == 'ValidationError'
+    assert 'landscape' in result['message']
+    assert 'thumbnail_validation' in result['timings']
+    assert 'validation' not in result['timings']
+
+    # Base64 uploads take the same path
+    encoded = 'data:image/jpeg;base64,' + base64.b64encode(image).decode('ascii')
+    assert analyzer.analyze_image(encoded)['message'] == result['message']
+
+
+def test_array_rejection_skips_full_validation():
+    result = DamConditionAnalyzer().analyze_image(create_non_dam_image('document', 2), include_timings=True)
+    assert 'document' in result['message']
+    assert 'validation' not in result['timings']
+
+
+def test_small_images_and_disabled_thumbnail():
+    small = create_non_dam_image('blank', 0.3)
+    result = DamConditionAnalyzer().analyze_image(small, include_timings=True)
+    assert 'thumbnail_validation' not in result['timings']
+    assert 'validation' in result['timings']
+
+    large = create_non_dam_image('blank', 2)
+    result = DamConditionAnalyzer(validation_thumbnail_side=None).analyze_image(large, include_timings=True)
+    assert 'thumbnail_validation' not in result['timings']
+
+
+def test_stride_thumbnail_size():
+    image = np.zeros((3000, 4000, 3), dtype=np.uint8)
+    assert stride_thumbnail(image, 384).shape == (300, 400, 3)
+    assert stride_thumbnail(image, 384).flags['C_CONTIGUOUS']
+    small = np.zeros((500, 700, 3), dtype=np.uint8)
+    assert stride_thumbnail(small, 384) is small
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING THUMBNAIL-FIRST VALIDATION")
+    print("=" * 60)
+    agreement, disagreements = measure_agreement()
+    print(f"Verdict agreement with full-resolution validation: {agreement:.1%}")
+    for case in disagreements:
+        print(f"  - {case}")
+    test_thumbnail_verdicts_match_full_resolution()
+    test_valid_image_analysis_unchanged()
+    test_jpeg_rejection_skips_full_decode()
+    test_array_rejection_skips_full_validation()
+    test_small_images_and_disabled_thumbnail()
+    test_stride_thumbnail_size()
+    print("All thumbnail validation tests passed")
@@ -0,0 +1,95 @@
+"""
+Tests for the tiled analysis engine against whole-image analysis
+"""
+
+import os
+import tempfile
+import types
+import numpy as np
+import tiled_analyzer
+from dam_condition_analyzer import DamConditionAnalyzer
+from tiled_analyzer import RasterioTileSource, TiledDamAnalyzer
+from synthetic_corpus import create_concrete_image
+
+
+def test_tiled_matches_whole_image():
+    image = create_concrete_image(1)
+    analyzer = DamConditionAnalyzer()
+    full = analyzer.analyze_image(image)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ortho.npy')
+        np.save(path, image)
+        tiled = TiledDamAnalyzer(analyzer, tile_size=300).analyze_file(path)
+
+    assert tiled['status'] == 'success'
+    assert tiled['condition_score'] == full['condition_score']
+    for name in ('cracks', 'surface_wear', 'algae_growth', 'erosion'):
+        assert tiled['analysis'][name] == full['analysis'][name], name
+    assert tiled['analysis']['moisture']['level'] == full['analysis']['moisture']['level']
+    # Regions that straddle tile seams may be split
+    full_areas = full['analysis']['structural_damage']['areas']
+    assert abs(tiled['analysis']['structural_damage']['areas'] - full_areas) <= 0.01 * full_areas
+
+    height, width = image.shape[:2]
+    assert tiled['tiles']['rows'] == -(-height // 300)
+    assert tiled['tiles']['cols'] == -(-width // 300)
+    assert tiled['image_size'] == {'width': width, 'height': height}
+
+
+def test_parallel_tiles_match_serial():
+    image = create_concrete_image(0.5)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ortho.npy')
+        np.save(path, image)
+        serial = TiledDamAnalyzer(tile_size=256).analyze_file(path)
+        parallel = TiledDamAnalyzer(tile_size=256, workers=2).analyze_file(path)
+
+    assert serial['analysis'] == parallel['analysis']
+    assert serial['tiles']['scores'] == parallel['tiles']['scores']
+
+
+class _Dataset:
+    """Stand-in for an open rasterio dataset, as rasterio is optional"""
+
+    height, width, count = 64, 64, 3
+
+    def __init__(self, dtype):
+        self.dtypes = (dtype,) * self.count
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_rasters_deeper_than_8_bits_are_rejected():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ortho.npy')
+        np.save(path, create_concrete_image(0.1).astype(np.uint16) * 256)
+        result = TiledDamAnalyzer().analyze_file(path)
+    assert result['status'] == 'error' and result['error_type'] == 'ValueError'
+
+    original = tiled_analyzer.rasterio
+    try:
+        for dtype in ('uint16', 'float32'):
+            dataset = _Dataset(dtype)
+            tiled_analyzer.rasterio = types.SimpleNamespace(open=lambda path: dataset)
+            try:
+                RasterioTileSource('ortho.tif')
+                assert False, dtype
+            except ValueError as e:
+                assert dtype in str(e) and dataset.closed
+        tiled_analyzer.rasterio = types.SimpleNamespace(open=lambda path: _Dataset('uint8'))
+        assert RasterioTileSource('ortho.tif').channels == 3
+    finally:
+        tiled_analyzer.rasterio = original
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING TILED ANALYSIS")
+    print("=" * 60)
+    test_tiled_matches_whole_image()
+    test_parallel_tiles_match_serial()
+    test_rasters_deeper_than_8_bits_are_rejected()
+    print("All tiled analysis tests passed")
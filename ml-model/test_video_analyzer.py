@@ -0,0 +1,195 @@
+"""
+Tests for drone video / frame-sequence analysis with keyframe sampling
+"""
+
+import io
+import json
+import os
+import tempfile
+import cv2
+import numpy as np
+import video_analyzer
+from dam_analysis_api import app
+from dam_condition_analyzer import DamConditionAnalyzer
+from synthetic_corpus import create_flyover
+from video_analyzer import FrameSequenceSource, KeyframeSelector, VideoDamAnalyzer, VideoFrameSource, frame_sample
+
+
+def _flight(hold=20, moving=40):
+    """A camera hovering for `hold` frames, then panning 0.5% of the frame per frame"""
+    frames = create_flyover(0.1, moving + 1, pan=0.005)
+    return [frames[0]] * hold + frames[1:]
+
+
+def _encode(frames, ext):
+    encoded = []
+    for frame in frames:
+        ok, buffer = cv2.imencode(ext, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        assert ok
+        encoded.append(buffer.tobytes())
+    return encoded
+
+
+def _write_video(frames, path, fps=30):
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    for frame in frames:
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    writer.release()
+
+
+def test_selector_skips_near_identical_frames():
+    frames = _flight()
+    selector = KeyframeSelector()
+    keyframes = [index for index, frame in enumerate(frames)
+                 if selector.offer(frame_sample(frame)[0], index / 30)[0]]
+    # Hovering frames are skipped; the pan gives a keyframe about every 5%
+    assert keyframes[0] == 0
+    assert all(index > 20 for index in keyframes[1:])
+    assert 3 <= len(keyframes) <= 8
+
+    # Unchanged frames are still analyzed every max_gap seconds
+    selector = KeyframeSelector(max_gap=5)
+    sample = frame_sample(frames[0])[0]
+    assert [seconds for seconds in range(12) if selector.offer(sample, seconds)[0]] == [0, 5, 10]
+
+
+def test_video_timeline():
+    frames = _flight()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'flight.avi')
+        _write_video(frames, path)
+        report = VideoDamAnalyzer().analyze(VideoFrameSource(path))
+
+    assert report['status'] == 'completed'
+    assert report['frames'] == report['sampled_frames'] == len(frames)
+    assert report['keyframes'] == len(report['timeline']) < len(frames) // 4
+    assert report['analyzed'] == report['keyframes']
+    assert report['throughput']['frames_per_second'] > 0
+    assert set(report['timings']) >= {'read', 'selection', 'analysis', 'total'}
+
+    scores = [entry['condition_score'] for entry in report['timeline']]
+    assert report['condition']['min_score'] == min(scores)
+    worst = next(entry for entry in report['timeline'] if entry['frame'] == report['condition']['worst_frame'])
+    assert worst['condition_score'] == min(scores)
+    for name, count in report['detections'].items():
+        assert count == sum(name in entry['detected'] for entry in report['timeline'])
+
+
+def test_keyframe_reports_match_analyze_image():
+    frames = _flight(hold=2, moving=20)
+    report = VideoDamAnalyzer(batch_size=3).analyze(FrameSequenceSource(_encode(frames, '.png'), fps=30))
+    analyzer = DamConditionAnalyzer()
+    for entry in report['timeline']:
+        expected = analyzer.analyze_image(frames[entry['frame']])
+        assert entry['analysis'] == expected['analysis']
+        assert entry['condition_score'] == expected['condition_score']
+
+
+def test_keyframes_without_dark_regions_match_analyze_image():
+    frames = _flight(hold=1, moving=20)[::10]
+    # A washed-out frame (sun glare) has empty moisture masks within the batch
+    frames.insert(1, np.clip(frames[0] * 0.6 + 100, 0, 255).astype(np.uint8))
+    report = VideoDamAnalyzer(max_gap=1, batch_size=4).analyze(FrameSequenceSource(_encode(frames, '.png')))
+    assert [entry['frame'] for entry in report['timeline']] == list(range(len(frames)))
+    analyzer = DamConditionAnalyzer()
+    for entry in report['timeline']:
+        expected = analyzer.analyze_image(frames[entry['frame']])
+        assert entry['analysis'] == expected['analysis'], entry['frame']
+    assert report['timeline'][1]['analysis']['moisture']['areas'] == 1
+
+
+def test_skipped_jpeg_frames_are_not_fully_decoded():
+    frames = _flight(hold=10, moving=0)
+    encoded = _encode(frames, '.jpg')
+    original = video_analyzer.decode_image
+
+    def full_decode(data, header=None):
+        raise AssertionError('frame decoded in full for sampling')
+    video_analyzer.decode_image = full_decode
+    try:
+        report = VideoDamAnalyzer().analyze(FrameSequenceSource(encoded, fps=10, sample_every=2))
+    finally:
+        video_analyzer.decode_image = original
+    assert report['frames'] == 10
+    assert report['sampled_frames'] == 5
+    assert report['keyframes'] == 1
+
+
+def test_rejected_frames_in_timeline():
+    blank = np.full((240, 320, 3), 100, dtype=np.uint8)
+    frames = _flight(hold=1, moving=0) + [blank]
+    report = VideoDamAnalyzer().analyze(FrameSequenceSource(_encode(frames, '.png')))
+    assert [entry['status'] for entry in report['timeline']] == ['success', 'rejected']
+    assert report['rejected'] == 1 and report['analyzed'] == 1
+
+
+def test_corrupt_frames_are_skipped():
+    encoded = _encode(_flight(hold=1, moving=20)[::10], '.png')
+    encoded.insert(1, b'not an image')
+    with tempfile.TemporaryDirectory() as tmp:
+        for index, data in enumerate(encoded):
+            with open(os.path.join(tmp, f'{index:03d}.png'), 'wb') as f:
+                f.write(data)
+        # A file removed after the sequence was listed cannot be read
+        paths = [os.path.join(tmp, f'{index:03d}.png') for index in range(len(encoded) + 1)]
+        report = VideoDamAnalyzer(max_gap=1).analyze(FrameSequenceSource(paths))
+
+    assert report['status'] == 'completed'
+    assert [entry['frame'] for entry in report['corrupt_frames']] == [1, 4]
+    assert report['corrupt'] == 2 and report['sampled_frames'] == 5
+    assert [entry['frame'] for entry in report['timeline']] == [0, 2, 3]
+    assert all(entry['status'] == 'success' for entry in report['timeline'])
+
+
+def test_analyze_video_endpoint():
+    frames = _flight(hold=5, moving=10)
+    client = app.test_client()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'flight.avi')
+        _write_video(frames, path)
+        with open(path, 'rb') as f:
+            video = f.read()
+
+    response = client.post('/analyze-video?detectors=cracks,erosion', data={
+        'video': (io.BytesIO(video), 'flight.avi')
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.json
+    assert response.json['frames'] == len(frames)
+    assert response.json['timeline'][0]['analysis'].keys() == {'cracks', 'erosion'}
+
+    streamed = client.post('/analyze-video?stream=1', data={
+        'frames': [(io.BytesIO(data), f'{i:03d}.png') for i, data in enumerate(_encode(frames, '.png'))],
+        'fps': '30'
+    }, content_type='multipart/form-data')
+    lines = [json.loads(line) for line in streamed.data.decode().splitlines()]
+    assert lines[-1]['status'] == 'completed'
+    assert len(lines) - 1 == lines[-1]['keyframes']
+
+    for fps in ('0', '-2', 'nan'):
+        response = client.post('/analyze-video', data={
+            'frames': [(io.BytesIO(_encode(frames[:1], '.png')[0]), '000.png')], 'fps': fps
+        }, content_type='multipart/form-data')
+        assert response.status_code == 400 and 'fps' in response.json['error'], fps
+    corrupt = client.post('/analyze-video', data={
+        'frames': [(io.BytesIO(data), f'{i:03d}.png') for i, data in enumerate(_encode(frames[:2], '.png') + [b'x'])]
+    }, content_type='multipart/form-data')
+    assert corrupt.status_code == 200 and corrupt.json['corrupt'] == 1
+
+    assert client.post('/analyze-video', data=b'', content_type='video/mp4').status_code == 400
+    assert client.post('/analyze-video', data=b'not a video', content_type='video/mp4').status_code == 400
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING VIDEO ANALYZER")
+    print("=" * 60)
+    test_selector_skips_near_identical_frames()
+    test_video_timeline()
+    test_keyframe_reports_match_analyze_image()
+    test_keyframes_without_dark_regions_match_analyze_image()
+    test_skipped_jpeg_frames_are_not_fully_decoded()
+    test_rejected_frames_in_timeline()
+    test_corrupt_frames_are_skipped()
+    test_analyze_video_endpoint()
+    print("All video analyzer tests passed")
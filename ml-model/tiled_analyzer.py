@@ -0,0 +1,319 @@
+"""
+Tiled, memory-bounded dam condition analysis
+Streams overlapping tiles of very large orthomosaics from disk
+
+Usage:
+    python tiled_analyzer.py orthomosaic.npy [--tile-size 1024] [--halo 16] [--workers 4]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image
+import fast_stats
+from image_context import ImageContext
+from dam_condition_analyzer import DamConditionAnalyzer
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+
+class NpyTileSource:
+    """Memory-mapped .npy array (H, W) or (H, W, C); tiles are read on demand"""
+
+    def __init__(self, path):
+        self.array = np.load(path, mmap_mode='r')
+        if self.array.dtype != np.uint8:
+            raise ValueError(f'Expected an 8-bit image array, got {self.array.dtype}')
+        self.height, self.width = self.array.shape[:2]
+        self.channels = self.array.shape[2] if self.array.ndim == 3 else 1
+
+    def read(self, y0, y1, x0, x1):
+        return np.ascontiguousarray(self.array[y0:y1, x0:x1])
+
+
+class RasterioTileSource:
+    """Windowed reads from GeoTIFF and other GDAL rasters (requires rasterio)"""
+
+    def __init__(self, path):
+        self.dataset = rasterio.open(path)
+        self.height, self.width = self.dataset.height, self.dataset.width
+        self.bands = [1, 2, 3] if self.dataset.count >= 3 else [1]
+        self.channels = len(self.bands) if len(self.bands) == 3 else 1
+        # The detectors' thresholds are 8-bit gray levels; 12/16-bit and
+        # float rasters have no single right rescaling, so refuse them
+        dtypes = {self.dataset.dtypes[band - 1] for band in self.bands}
+        if dtypes != {'uint8'}:
+            self.dataset.close()
+            raise ValueError(f"Expected an 8-bit raster, got {', '.join(sorted(dtypes))}; "
+                             "convert it first (e.g. gdal_translate -ot Byte -scale)")
+
+    def read(self, y0, y1, x0, x1):
+        window = Window(x0, y0, x1 - x0, y1 - y0)
+        data = self.dataset.read(self.bands, window=window)
+        if self.channels == 1:
+            return np.ascontiguousarray(data[0])
+        return np.ascontiguousarray(np.transpose(data, (1, 2, 0)))
+
+
+class PILTileSource:
+    """
+    Fallback for formats PIL can open. PIL decodes the whole raster on first
+    access, so only the analysis (not the decode) is memory-bounded; convert
+    to .npy or install rasterio for images that do not fit in memory.
+    """
+
+    def __init__(self, path):
+        Image.MAX_IMAGE_PIXELS = None
+        image = Image.open(path)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        self.array = np.asarray(image)
+        self.height, self.width = self.array.shape[:2]
+        self.channels = 3 if self.array.ndim == 3 else 1
+
+    def read(self, y0, y1, x0, x1):
+        return np.ascontiguousarray(self.array[y0:y1, x0:x1])
+
+
+def open_tile_source(path):
+    """Pick the most memory-friendly reader for the file"""
+    if path.lower().endswith('.npy'):
+        return NpyTileSource(path)
+    if rasterio is not None:
+        return RasterioTileSource(path)
+    return PILTileSource(path)
+
+
+class TiledDamAnalyzer:
+    """
+    Run DamConditionAnalyzer detectors tile by tile over an image on disk.
+
+    Each tile is read with a halo of neighbouring pixels so the morphology,
+    Canny, Sobel and Laplacian kernels see the same neighbourhood they would
+    on the full image; only the tile core is counted. Detectors produce
+    mergeable statistics (pixel counts, histograms, sums) that are combined
+    into the same result schema as analyze_image. Peak memory depends on
+    tile size and worker count, not on image size.
+
+    Structural damage uses a global 75th-percentile threshold, so damage
+    regions are counted in a second pass once the merged Laplacian histogram
+    is known. A region is attributed to the tile whose core contains the top
+    left corner of its bounding box; regions larger than the halo that cross
+    tile seams may still be split.
+    """
+
+    def __init__(self, analyzer=None, tile_size=1024, halo=16, workers=1):
+        self.analyzer = analyzer or DamConditionAnalyzer()
+        self.tile_size = tile_size
+        self.halo = halo
+        self.workers = workers
+
+    def analyze_file(self, path):
+        """Analyze an image file tile by tile; returns the analyze_image schema plus a tile score grid"""
+        try:
+            source = open_tile_source(path)
+            boxes = self._tile_boxes(source.height, source.width)
+
+            tile_stats = self._map(path, _tile_statistics, boxes)
+            merged = merge_statistics(tile_stats)
+            damage_threshold = merged['laplacian_hist'].quantile(75)
+            region_counts = self._map(path, _tile_damage_regions, boxes, damage_threshold)
+            merged['damage_regions'] = sum(region_counts)
+
+            results = results_from_statistics(self.analyzer, merged, damage_threshold)
+            response = self.analyzer._build_report(results)
+
+            rows = -(-source.height // self.tile_size)
+            cols = -(-source.width // self.tile_size)
+            scores = np.zeros((rows, cols))
+            for (row, col, _), stats in zip(boxes, tile_stats):
+                tile_results = results_from_statistics(self.analyzer, stats)
+                scores[row, col] = round(self.analyzer._calculate_overall_score(tile_results), 2)
+
+            response['image_size'] = {'width': source.width, 'height': source.height}
+            response['tiles'] = {
+                'tile_size': self.tile_size,
+                'halo': self.halo,
+                'rows': rows,
+                'cols': cols,
+                'scores': scores.tolist()
+            }
+            return response
+
+        except Exception as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'error_type': type(e).__name__
+            }
+
+    def _tile_boxes(self, height, width):
+        return tile_boxes(height, width, self.tile_size, self.halo)
+
+    def _map(self, path, function, boxes, *args):
+        """Run function over all tiles, in worker processes when configured"""
+        tasks = [box for _, _, box in boxes]
+        settings = (self.analyzer.min_region_area, self.analyzer.precision)
+        if self.workers <= 1:
+            _init_worker(path, settings, limit_threads=False)
+            return [function(box, *args) for box in tasks]
+
+        # Spawned, not forked: the parent may hold an open GDAL dataset and
+        # OpenCV threads, which a forked child would inherit mid-state
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(path, settings)) as executor:
+            return list(executor.map(function, tasks, *[[arg] * len(tasks) for arg in args]))
+
+
+def tile_boxes(height, width, tile_size, halo):
+    """(row, col, (core, padded)) for every tile; boxes are (y0, y1, x0, x1)"""
+    boxes = []
+    for row, y0 in enumerate(range(0, height, tile_size)):
+        for col, x0 in enumerate(range(0, width, tile_size)):
+            y1 = min(height, y0 + tile_size)
+            x1 = min(width, x0 + tile_size)
+            padded = (max(0, y0 - halo), min(height, y1 + halo),
+                      max(0, x0 - halo), min(width, x1 + halo))
+            boxes.append((row, col, ((y0, y1, x0, x1), padded)))
+    return boxes
+
+
+# Per-process state for tile workers
+_worker = {}
+
+
+def _init_worker(path, settings, limit_threads=True):
+    """Open the tile source once per process"""
+    if limit_threads:
+        # Tiles already run in parallel; avoid oversubscribing cores
+        cv2.setNumThreads(1)
+    _worker['source'] = open_tile_source(path)
+    _worker['analyzer'] = DamConditionAnalyzer(min_region_area=settings[0], precision=settings[1])
+
+
+def _read_tile(box):
+    """Read a padded tile and return its context and the core slice within it"""
+    (y0, y1, x0, x1), (py0, py1, px0, px1) = box
+    tile = _worker['source'].read(py0, py1, px0, px1)
+    core = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+    return ImageContext(tile, precision=_worker['analyzer'].precision), core
+
+
+def _count_core_regions(mask, core, min_area):
+    """Count components whose bounding box starts inside the tile core"""
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    left = stats[1:, cv2.CC_STAT_LEFT]
+    top = stats[1:, cv2.CC_STAT_TOP]
+    keep = ((top >= core[0].start) & (top < core[0].stop) &
+            (left >= core[1].start) & (left < core[1].stop))
+    if min_area:
+        keep &= stats[1:, cv2.CC_STAT_AREA] >= min_area
+    return int(np.count_nonzero(keep))
+
+
+def tile_statistics(analyzer, ctx, core):
+    """Mergeable detector statistics for the core of a padded tile context"""
+    gray = ctx.gray[core]
+
+    stats = {
+        'pixels': gray.size,
+        'channels': ctx.image.shape[2] if ctx.is_color else 1,
+        'gray_hist': fast_stats.uint8_histogram(gray),
+        'crack_pixels': np.count_nonzero(analyzer._crack_mask(ctx)[core]),
+        'green_pixels': np.count_nonzero(analyzer._algae_mask(ctx)[core]) if ctx.is_color else 0,
+        'laplacian_hist': fast_stats.laplacian_magnitude_histogram(ctx.laplacian_magnitude[core]),
+        'gradient_sum': ctx.gradient_sum(core),
+        'moisture_regions': _count_core_regions((ctx.gray < 100).astype(np.uint8), core,
+                                                analyzer.min_region_area),
+        'damage_regions': 0
+    }
+    return stats
+
+
+def tile_damage_regions(analyzer, ctx, core, threshold):
+    """Damage regions in the core of a padded tile context under a global threshold"""
+    mask = (ctx.laplacian_magnitude > threshold).astype(np.uint8)
+    return _count_core_regions(mask, core, analyzer.min_region_area)
+
+
+def _tile_statistics(box):
+    ctx, core = _read_tile(box)
+    return tile_statistics(_worker['analyzer'], ctx, core)
+
+
+def _tile_damage_regions(box, threshold):
+    ctx, core = _read_tile(box)
+    return tile_damage_regions(_worker['analyzer'], ctx, core, threshold)
+
+
+def merge_statistics(tile_stats):
+    """Sum per-tile statistics into whole-image statistics"""
+    merged = {}
+    for stats in tile_stats:
+        for key, value in stats.items():
+            if key == 'channels':
+                merged[key] = value
+            elif key in merged:
+                merged[key] = merged[key] + value
+            else:
+                merged[key] = value
+    return merged
+
+
+def results_from_statistics(analyzer, stats, damage_threshold=None):
+    """
+    Detector results (as returned by the analyzer's detectors) from merged
+    statistics. Without a damage threshold the 75th percentile of the
+    statistics' own Laplacian histogram is used.
+    """
+    pixels = stats['pixels']
+    gray_hist = stats['gray_hist']
+
+    wear_threshold = gray_hist.quantile(25)
+    wear_pixels = gray_hist.count_where(np.abs(gray_hist.values - gray_hist.mean) > wear_threshold)
+
+    laplacian_hist = stats['laplacian_hist']
+    if damage_threshold is None:
+        damage_threshold = laplacian_hist.quantile(75)
+    damage_pixels = laplacian_hist.count_above(damage_threshold)
+
+    crack_coverage = stats['crack_pixels'] / pixels * 100
+    if stats['channels'] == 1:
+        algae = {'detected': False, 'coverage': 0}
+    else:
+        algae = analyzer._classify_algae(stats['green_pixels'] / (pixels * stats['channels']) * 100)
+
+    return {
+        'cracks': analyzer._classify_cracks(crack_coverage, stats['crack_pixels']),
+        'surface_wear': analyzer._classify_surface_wear(gray_hist.variance, wear_pixels / pixels * 100),
+        'moisture': analyzer._classify_moisture(gray_hist.count_where(gray_hist.values < 100) / pixels * 100,
+                                                stats['moisture_regions'] + 1),
+        'algae_growth': algae,
+        'structural_damage': analyzer._classify_structural_damage(damage_pixels / pixels * 100,
+                                                                  stats['damage_regions'] + 1),
+        'erosion': analyzer._classify_erosion(stats['gradient_sum'] / pixels)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='image to analyze (.npy is memory-mapped)')
+    parser.add_argument('--tile-size', type=int, default=1024)
+    parser.add_argument('--halo', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    tiled = TiledDamAnalyzer(tile_size=args.tile_size, halo=args.halo, workers=args.workers)
+    print(json.dumps(tiled.analyze_file(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
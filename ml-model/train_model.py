@@ -12,6 +12,8 @@ from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 import joblib
 import json
+from compiled_ensemble import MANIFEST, CompiledEnsemble, compile_ensemble
+from model_registry import ModelRegistry
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
@@ -22,6 +24,8 @@ class DamMonitoringMLModel:
         self.rf_model = None
         self.gb_model = None
         self.nn_model = None
+        # Export written by save_models (or read by load_models) for the current models
+        self.compiled_model = None
         self.feature_names = [
             'waterLevel', 'pressure', 'seepage', 'structuralStress', 
             'temperature', 'inflow', 'outflow', 'turbidity', 
@@ -142,6 +146,7 @@ class DamMonitoringMLModel:
         Train multiple ML models and select the best
         """
         print("\nPreparing data for training...")
+        self.compiled_model = None
         
         X = df[self.feature_names]
         y = df['riskLevel']
@@ -260,13 +265,17 @@ class DamMonitoringMLModel:
             sensor_data.get('rainfall', 15)
         ]])
         
-        # Scale input
-        input_scaled = self.scaler.transform(input_data)
-        
-        # Get predictions from all models
-        rf_pred = self.rf_model.predict_proba(input_scaled)[0]
-        gb_pred = self.gb_model.predict_proba(input_scaled)[0]
-        nn_pred = self.nn_model.predict_proba(input_scaled)[0]
+        if self.compiled_model is not None and self.compiled_model.raw_inputs:
+            # Scaling is folded into the compiled models
+            rf_pred, gb_pred, nn_pred = (proba[0] for proba in self.compiled_model.predict_proba(input_data))
+        else:
+            # Scale input
+            input_scaled = self.scaler.transform(input_data)
+            
+            # Get predictions from all models
+            rf_pred = self.rf_model.predict_proba(input_scaled)[0]
+            gb_pred = self.gb_model.predict_proba(input_scaled)[0]
+            nn_pred = self.nn_model.predict_proba(input_scaled)[0]
         
         # Ensemble prediction
         ensemble_proba = (rf_pred + gb_pred + nn_pred) / 3
@@ -301,9 +310,10 @@ class DamMonitoringMLModel:
         df.to_csv(path, index=False)
         print(f"Dataset saved to {path}")
     
-    def save_models(self, path='ml-model/models'):
+    def save_models(self, path='ml-model/models', fold_scaler=True):
         """
-        Save trained models and scaler
+        Save trained models and scaler, and the compiled export of the
+        ensemble; with fold_scaler the export takes raw sensor readings
         """
         import os
         os.makedirs(path, exist_ok=True)
@@ -324,16 +334,27 @@ class DamMonitoringMLModel:
         with open(f'{path}/metadata.json', 'w') as f:
             json.dump(metadata, f, indent=2)
         
+        # NumPy arrays of the ensemble for fast inference in api_server
+        self.compiled_model = compile_ensemble(self.rf_model, self.gb_model, self.nn_model,
+                                               scaler=self.scaler if fold_scaler else None,
+                                               trained_date=metadata['trained_date'])
+        self.compiled_model.save(f'{path}/compiled')
+        
         print(f"\nModels saved to {path}/")
     
     def load_models(self, path='ml-model/models'):
         """
         Load pre-trained models
         """
+        import os
         self.rf_model = joblib.load(f'{path}/random_forest.pkl')
         self.gb_model = joblib.load(f'{path}/gradient_boosting.pkl')
         self.nn_model = joblib.load(f'{path}/neural_network.pkl')
         self.scaler = joblib.load(f'{path}/scaler.pkl')
+        if os.path.exists(f'{path}/compiled/{MANIFEST}'):
+            self.compiled_model = CompiledEnsemble.load(f'{path}/compiled')
+        else:
+            self.compiled_model = None
         
         print("Models loaded successfully!")
 
@@ -354,8 +375,12 @@ def main():
     # Train models
     metrics = model.train_models(df)
     
-    # Save models
-    model.save_models()
+    # Save models as a new version and activate it; running API servers
+    # switch to it without a restart
+    registry = ModelRegistry('ml-model/models')
+    version = registry.add(model.save_models)
+    registry.activate(version)
+    print(f"Model version {version} is now active")
     
     # Test prediction
     print("\n" + "="*60)
@@ -406,12 +431,13 @@ def main():
     print("\n" + "="*60)
     print("TRAINING COMPLETE!")
     print("="*60)
-    print("\nModel files saved in: ml-model/models/")
+    print(f"\nModel files saved in: ml-model/models/versions/{version}/")
     print("- random_forest.pkl")
     print("- gradient_boosting.pkl")
     print("- neural_network.pkl")
     print("- scaler.pkl")
     print("- metadata.json")
+    print("- compiled/ (NumPy export of the ensemble, scaler folded in)")
     print("\nDataset file saved in: ml-model/data/dam_risk_dataset.csv")
 
 if __name__ == "__main__":
@@ -0,0 +1,343 @@
+"""
+Drone video and frame-sequence analysis
+Streams frames from a video file or an image directory, skips frames that
+barely differ from the last analyzed one and analyzes only keyframes
+
+Usage:
+    python video_analyzer.py inspection.mp4 [--threshold 8] [--max-gap 10] [--sample-every 1] [--stream]
+    python video_analyzer.py frames/ --fps 2
+"""
+
+import argparse
+import json
+import os
+import cv2
+import numpy as np
+from batch_engine import BatchDamAnalyzer
+from dam_condition_analyzer import DETECTORS, DamConditionAnalyzer
+from image_context import stride_thumbnail
+from image_decoder import decode_image, decode_thumbnail
+from metrics import StageTimer
+
+FRAME_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+# Frames are compared on SAMPLE_SIDE x SAMPLE_SIDE grayscale samples,
+# blurred so fine texture moving under the camera weighs less than new content
+SAMPLE_SIDE = 32
+SAMPLE_BLUR = 1.0
+
+# Mean absolute difference (gray levels) from the last keyframe's sample
+# above which a frame becomes a keyframe. On textured concrete a pan of 5%
+# of the frame width scores about 9; sensor noise alone stays below 0.1
+DEFAULT_THRESHOLD = 8.0
+
+# Seconds after which a frame is analyzed even if it looks unchanged
+DEFAULT_MAX_GAP = 10.0
+
+
+class VideoFrameSource:
+    """
+    Frames of a video file read with OpenCV (FFmpeg backend). With
+    sample_every > 1 the frames in between are grabbed but never converted.
+    Yields (index, seconds, RGB frame).
+    """
+
+    def __init__(self, path, sample_every=1):
+        self.path = path
+        self.sample_every = max(1, int(sample_every))
+        self.frames_read = 0
+
+    def __iter__(self):
+        capture = cv2.VideoCapture(self.path)
+        if not capture.isOpened():
+            raise ValueError(f'Cannot open video {self.path}')
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        try:
+            index = 0
+            while capture.grab():
+                self.frames_read = index + 1
+                if index % self.sample_every == 0:
+                    ok, frame = capture.retrieve()
+                    if not ok:
+                        break
+                    seconds = index / fps if fps else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+                    yield index, seconds, frame
+                index += 1
+        finally:
+            capture.release()
+
+
+class FrameSequenceSource:
+    """
+    Encoded frames (bytes, or paths of image files) at a fixed frame rate.
+    Frames are yielded still encoded, so frames that are skipped are only
+    decoded at reduced scale (JPEG) for comparison. A file that cannot be
+    read is yielded as None.
+    """
+
+    def __init__(self, frames, fps=1.0, sample_every=1):
+        if not fps > 0:
+            raise ValueError(f'fps must be positive, got {fps}')
+        self.frames = list(frames)
+        self.fps = fps
+        self.sample_every = max(1, int(sample_every))
+        self.frames_read = 0
+
+    @classmethod
+    def from_directory(cls, path, fps=1.0, sample_every=1):
+        """Image files of a directory in name order"""
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(FRAME_EXTENSIONS))
+        if not names:
+            raise ValueError(f'No frames ({", ".join(FRAME_EXTENSIONS)}) in {path}')
+        return cls([os.path.join(path, name) for name in names], fps=fps, sample_every=sample_every)
+
+    def __iter__(self):
+        for index in range(0, len(self.frames), self.sample_every):
+            frame = self.frames[index]
+            if isinstance(frame, str):
+                try:
+                    with open(frame, 'rb') as f:
+                        frame = f.read()
+                except OSError:
+                    frame = None
+            self.frames_read = min(len(self.frames), index + self.sample_every)
+            yield index, index / self.fps, frame
+
+
+def open_frame_source(path, sample_every=1, fps=1.0):
+    """Video file or directory of frames"""
+    if os.path.isdir(path):
+        return FrameSequenceSource.from_directory(path, fps=fps, sample_every=sample_every)
+    return VideoFrameSource(path, sample_every=sample_every)
+
+
+def frame_sample(frame):
+    """
+    Blurred SAMPLE_SIDE x SAMPLE_SIDE grayscale sample of a frame for comparison,
+    and the frame as the analyzer should receive it. Encoded JPEGs are
+    sampled from a reduced-scale decode and stay encoded; other encoded
+    frames are decoded once and handed on decoded.
+    """
+    if not isinstance(frame, np.ndarray):
+        small = decode_thumbnail(frame, SAMPLE_SIDE)
+        if small is None:
+            frame = small = decode_image(frame)
+    else:
+        small = frame
+    # Striding first keeps the area resize cheap on full-size frames
+    small = stride_thumbnail(small, SAMPLE_SIDE * 4)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    sample = cv2.resize(small, (SAMPLE_SIDE, SAMPLE_SIDE), interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(sample, (0, 0), SAMPLE_BLUR), frame
+
+
+class KeyframeSelector:
+    """
+    Pick frames worth analyzing. A frame is a keyframe when its sample
+    differs from the last keyframe's by more than threshold gray levels on
+    average, or when max_gap seconds have passed since the last keyframe.
+    Comparing against the last keyframe rather than the previous frame
+    catches slow pans that change little from one frame to the next.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_gap=DEFAULT_MAX_GAP):
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self._sample = None
+        self._seconds = None
+
+    def offer(self, sample, seconds):
+        """(is_keyframe, difference from the last keyframe; None for the first frame)"""
+        if self._sample is None:
+            difference = None
+            keyframe = True
+        else:
+            difference = float(cv2.absdiff(sample, self._sample).mean())
+            keyframe = (difference > self.threshold or
+                        (self.max_gap is not None and seconds - self._seconds >= self.max_gap))
+        if keyframe:
+            self._sample = sample
+            self._seconds = seconds
+        return keyframe, difference
+
+
+class VideoDamAnalyzer:
+    """
+    Condition timeline of a drone video or frame sequence. Frames are read
+    one at a time; keyframes are analyzed in batches of batch_size with
+    batch_engine.BatchDamAnalyzer (frames of one video share a size, so
+    they stack), and the reports are identical to analyze_image's.
+    """
+
+    def __init__(self, analyzer=None, threshold=DEFAULT_THRESHOLD, max_gap=DEFAULT_MAX_GAP, batch_size=4):
+        self.engine = BatchDamAnalyzer(analyzer or DamConditionAnalyzer())
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self.batch_size = max(1, int(batch_size))
+
+    def stream(self, source, detectors=None):
+        """
+        Yield one timeline entry per keyframe as soon as its batch is
+        analyzed, then a summary with counts, the aggregated condition and
+        throughput in frames per second ('status': 'completed'). Frames
+        that cannot be decoded are skipped and listed in the summary.
+        """
+        detectors = self.engine.analyzer.select_detectors(detectors)
+        selector = KeyframeSelector(self.threshold, self.max_gap)
+        timer = StageTimer()
+        summary = _TimelineSummary(detectors)
+        pending = []
+        frames = iter(source)
+        while True:
+            with timer.stage('read'):
+                item = next(frames, None)
+            if item is None:
+                break
+            index, seconds, frame = item
+            summary.sampled += 1
+            summary.duration = seconds
+            with timer.stage('selection'):
+                try:
+                    if frame is None:
+                        raise ValueError('Cannot read frame')
+                    sample, frame = frame_sample(frame)
+                except Exception as e:
+                    # A corrupt frame fails on its own, not the whole video
+                    summary.corrupt.append({'frame': index, 'time': round(seconds, 3), 'message': str(e)})
+                    continue
+                keyframe, difference = selector.offer(sample, seconds)
+            if not keyframe:
+                continue
+            entry = {'frame': index, 'time': round(seconds, 3),
+                     'difference': None if difference is None else round(difference, 2)}
+            pending.append((entry, frame))
+            if len(pending) >= self.batch_size:
+                yield from self._analyze(pending, detectors, timer, summary)
+                pending = []
+        yield from self._analyze(pending, detectors, timer, summary)
+
+        timer.stop()
+        yield summary.report(getattr(source, 'frames_read', summary.sampled), timer,
+                             self.engine.analyzer)
+
+    def analyze(self, source, detectors=None):
+        """Summary with the full 'timeline' of keyframe entries"""
+        timeline = []
+        for entry in self.stream(source, detectors):
+            if entry.get('status') == 'completed':
+                entry['timeline'] = timeline
+                return entry
+            timeline.append(entry)
+
+    def _analyze(self, pending, detectors, timer, summary):
+        if not pending:
+            return
+        with timer.stage('analysis'):
+            results = self.engine.analyze_batch([frame for _, frame in pending], detectors=detectors)
+        for (entry, _), result in zip(pending, results):
+            summary.add(entry, result)
+            yield entry
+
+
+class _TimelineSummary:
+    """Running counts and condition statistics of the analyzed keyframes"""
+
+    def __init__(self, detectors):
+        self.sampled = 0
+        self.duration = 0.0
+        self.keyframes = 0
+        self.rejected = 0
+        self.failed = 0
+        self.corrupt = []
+        self.scores = []
+        self.worst = None
+        self.detections = {name: 0 for name in detectors}
+
+    def add(self, entry, result):
+        """Fill a timeline entry from an analysis result and count it"""
+        self.keyframes += 1
+        if result['status'] != 'success':
+            rejected = result.get('error_type') == 'ValidationError'
+            self.rejected += rejected
+            self.failed += not rejected
+            entry.update(status='rejected' if rejected else 'error', message=result.get('message'))
+            return
+        detected = [name for name, values in result['analysis'].items() if values.get('detected')]
+        entry.update(status='success',
+                     condition_score=result['condition_score'],
+                     overall_condition=result['overall_condition'],
+                     risk_level=result['risk_level'],
+                     detected=detected,
+                     analysis=result['analysis'])
+        for name in detected:
+            self.detections[name] += 1
+        self.scores.append(result['condition_score'])
+        if self.worst is None or result['condition_score'] < self.worst['condition_score']:
+            self.worst = entry
+
+    def report(self, frames_read, timer, analyzer):
+        seconds = timer.timings['total']
+        report = {
+            'status': 'completed',
+            'frames': frames_read,
+            'sampled_frames': self.sampled,
+            'keyframes': self.keyframes,
+            'analyzed': len(self.scores),
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'corrupt': len(self.corrupt),
+            'corrupt_frames': self.corrupt,
+            'duration': round(self.duration, 3),
+            'condition': None,
+            'detections': self.detections,
+            'throughput': {
+                'seconds': round(seconds, 3),
+                'frames_per_second': round(frames_read / seconds, 2) if seconds else None,
+                'keyframes_per_second': round(self.keyframes / seconds, 2) if seconds else None,
+                # Video seconds processed per wall-clock second
+                'realtime_factor': round(self.duration / seconds, 2) if seconds else None
+            },
+            'timings': timer.milliseconds()
+        }
+        if self.scores:
+            # The video is rated by its worst keyframe: damage seen once is
+            # not averaged away by the rest of the flight
+            level = self.worst['overall_condition']
+            report['condition'] = {
+                'overall_condition': level,
+                'risk_level': analyzer.condition_levels[level]['risk'],
+                'min_score': self.worst['condition_score'],
+                'mean_score': round(float(np.mean(self.scores)), 2),
+                'worst_frame': self.worst['frame'],
+                'worst_time': self.worst['time']
+            }
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='video file or directory of frames')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='mean gray-level difference from the last keyframe that makes a new keyframe')
+    parser.add_argument('--max-gap', type=float, default=DEFAULT_MAX_GAP,
+                        help='seconds after which a frame is analyzed regardless')
+    parser.add_argument('--sample-every', type=int, default=1, help='only consider every n-th frame')
+    parser.add_argument('--fps', type=float, default=1.0, help='frame rate of a frame directory')
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--detectors', help=f'comma-separated subset of {", ".join(DETECTORS)}')
+    parser.add_argument('--stream', action='store_true', help='print one JSON line per keyframe as it is analyzed')
+    args = parser.parse_args()
+
+    video = VideoDamAnalyzer(threshold=args.threshold, max_gap=args.max_gap, batch_size=args.batch_size)
+    source = open_frame_source(args.path, sample_every=args.sample_every, fps=args.fps)
+    if args.stream:
+        for entry in video.stream(source, args.detectors):
+            print(json.dumps(entry), flush=True)
+    else:
+        print(json.dumps(video.analyze(source, args.detectors), indent=2))
+
+
+if __name__ == "__main__":
+    main()